@@ -18,13 +18,30 @@ logger = logging.getLogger(__name__)
 # Importar rutas
 from app.routes import (
     ar_mirror_routes,
+    ar_routes,
     marketplace_public_routes,
+    marketplace_routes,
     products_routes,
     orders_routes,
     analytics_routes,
     notifications_routes,
     users_routes,
 )
+from app.services.database import init_db, close_db, get_db
+from app.services.email_queue import email_queue
+from app.services.garment_cache import garment_cache
+from app.services.idempotency import idempotency_cache, idempotency_purger
+from app.services.kpi_cache import customer_kpis
+from app.services.inference import get_inference_executor, shutdown_inference_executor
+from app.services.live_session import live_sessions
+from app.services.model_registry import AR_MODEL_LOADING
+from app.services.pose_cache import pose_cache
+from app.services.product_images import image_pipeline
+from app.services.response_cache import response_cache
+from app.services.stock import reservation_sweeper
+from app.services.storefront import storefront_cache
+from app.services.uploads import UploadLimitMiddleware, upload_stats
+from app.services.visit_counter import visit_counter
 
 # Configuración CORS
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "").split(",")
@@ -39,9 +56,29 @@ if not ALLOWED_ORIGINS or ALLOWED_ORIGINS == ['']:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    init_db()
+    visit_counter.start()
+    reservation_sweeper.start()
+    idempotency_purger.start()
+    email_queue.start()
+    if AR_MODEL_LOADING == "eager":
+        # Cargar y calentar los modelos antes de recibir tráfico
+        await get_inference_executor().warm_up()
     logger.info("🚀 OmniTienda API iniciada")
     yield
     # Shutdown
+    shutdown_inference_executor()
+    await reservation_sweeper.stop()
+    await idempotency_purger.stop()
+    await garment_cache.close()
+    # Variantes de fotos pendientes (escriben en la base)
+    await image_pipeline.close()
+    # Emails pendientes; los fallidos se guardan en la base
+    await email_queue.stop()
+    await response_cache.close()
+    # Escribir las visitas pendientes antes de cerrar la conexión
+    await visit_counter.stop()
+    await close_db()
     logger.info("🛑 API cerrada")
 
 app = FastAPI(
@@ -65,17 +102,29 @@ app.add_middleware(
     allowed_hosts=ALLOWED_ORIGINS,
 )
 
+app.add_middleware(UploadLimitMiddleware)
+
 # Rutas
 app.include_router(
     ar_mirror_routes.router,
     prefix="/api/v1/ar",
     tags=["AR - Realidad Aumentada"],
 )
+app.include_router(
+    ar_routes.router,
+    prefix="/api/v1/ar",
+    tags=["AR - Realidad Aumentada"],
+)
 app.include_router(
     marketplace_public_routes.router,
     prefix="/api/v1/marketplace",
     tags=["Marketplace Público"],
 )
+app.include_router(
+    marketplace_routes.router,
+    prefix="/api/v1/marketplace",
+    tags=["Marketplace"],
+)
 app.include_router(
     products_routes.router,
     prefix="/api/v1/products",
@@ -127,6 +176,26 @@ async def api_health():
         "version": "0.1.0",
     }
 
+@app.get("/api/v1/metrics", tags=["Health"])
+async def api_metrics():
+    return {
+        "database": get_db().stats(),
+        "inference": get_inference_executor().stats(),
+        "models": get_inference_executor().model_stats(),
+        "pose_cache": pose_cache.stats(),
+        "live_sessions": live_sessions.stats(),
+        "garment_cache": garment_cache.stats(),
+        "storefront_cache": storefront_cache.stats(),
+        "visits": visit_counter.stats(),
+        "customer_kpis": customer_kpis.stats(),
+        "response_cache": response_cache.stats(),
+        "idempotency": {**idempotency_cache.stats(), "purge": idempotency_purger.stats()},
+        "stock_reservations": reservation_sweeper.stats(),
+        "email_queue": email_queue.stats(),
+        "product_images": image_pipeline.stats(),
+        "uploads": upload_stats.stats(),
+    }
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("API_PORT", 8000))
@@ -1,98 +1,150 @@
-from fastapi import APIRouter, HTTPException
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from datetime import datetime, timedelta, timezone
+import asyncio
 import os
-from supabase import create_client, Client
+
+from app.services.database import Database, get_db
+from app.services.kpi_cache import customer_kpis
+from app.services.pagination import PAGE_SIZE_MAX, InvalidCursor, cursor_values, page_result
 
 router = APIRouter()
 
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
-)
+# Zona horaria para agrupar la analítica por hora/día/semana/mes
+ANALYTICS_TIMEZONE = os.getenv("ANALYTICS_TIMEZONE", "America/Lima")
+
+# Orden del listado de stock bajo (RPC low_stock_productos): menos stock primero
+LOW_STOCK_KEY = ("stock_actual", "id")
 
 @router.get("/sales/{negocio_id}")
-async def get_sales_analytics(negocio_id: str, days: int = 30):
+async def get_sales_analytics(
+    negocio_id: str,
+    days: int = Query(30, ge=1, le=3660),
+    desde: Optional[datetime] = Query(None),
+    hasta: Optional[datetime] = Query(None),
+    bucket: str = Query("day", pattern="^(hour|day|week|month)$"),
+    db: Database = Depends(get_db)
+):
     """
-    Obtiene analítica de ventas
+    Obtiene analítica de ventas (ventas no anuladas) a partir del resumen
+    por hora. La ventana es [desde, hasta) o los últimos `days` días; la
+    serie se agrupa por `bucket` en la zona horaria del negocio.
     """
     try:
-        start_date = (datetime.now() - timedelta(days=days)).isoformat()
+        if desde is None:
+            desde = datetime.now(timezone.utc) - timedelta(days=days)
         
-        data = supabase.table("ventas").select("*").eq(
-            "negocio_id", negocio_id
-        ).gte("created_at", start_date).execute()
+        data = await db.rpc("sales_summary", {
+            "p_negocio_id": negocio_id,
+            "p_desde": desde.isoformat(),
+            "p_hasta": hasta.isoformat() if hasta else None,
+            "p_bucket": bucket,
+            "p_tz": ANALYTICS_TIMEZONE
+        }).execute()
+        filas = data.data or []
         
-        # Procesar datos
-        total_ventas = sum(v["total"] for v in data.data)
-        cantidad_ventas = len(data.data)
+        # Procesar datos (una fila por periodo, método de pago y tipo)
+        total_ventas = round(sum(f["total"] for f in filas), 2)
+        cantidad_ventas = sum(f["cantidad"] for f in filas)
         promedio_venta = total_ventas / cantidad_ventas if cantidad_ventas > 0 else 0
         
-        # Por método de pago
         por_metodo = {}
-        for venta in data.data:
-            metodo = venta["metodo_pago"]
-            por_metodo[metodo] = por_metodo.get(metodo, 0) + venta["total"]
+        por_tipo = {}
+        series = {}
+        for fila in filas:
+            metodo = fila["metodo_pago"]
+            por_metodo[metodo] = round(por_metodo.get(metodo, 0) + fila["total"], 2)
+            por_tipo[fila["tipo"]] = round(por_tipo.get(fila["tipo"], 0) + fila["total"], 2)
+            punto = series.setdefault(fila["periodo"], {
+                "periodo": fila["periodo"], "cantidad": 0, "total": 0, "descuento": 0
+            })
+            punto["cantidad"] += fila["cantidad"]
+            punto["total"] = round(punto["total"] + fila["total"], 2)
+            punto["descuento"] = round(punto["descuento"] + fila["descuento"], 2)
         
         return {
             "success": True,
             "periodo_dias": days,
+            "desde": desde.isoformat(),
+            "hasta": hasta.isoformat() if hasta else None,
             "total_ventas": total_ventas,
             "cantidad_ventas": cantidad_ventas,
             "promedio_venta": promedio_venta,
-            "por_metodo_pago": por_metodo
+            "descuento_total": round(sum(f["descuento"] for f in filas), 2),
+            "por_metodo_pago": por_metodo,
+            "por_tipo": por_tipo,
+            "bucket": bucket,
+            "series": list(series.values())
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/inventory/{negocio_id}")
-async def get_inventory_analytics(negocio_id: str):
+async def get_inventory_analytics(
+    negocio_id: str,
+    limit: int = Query(20, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = Query(None),
+    db: Database = Depends(get_db)
+):
     """
-    Obtiene analítica de inventario
+    Obtiene analítica de inventario. Los agregados se calculan en la base;
+    la lista de productos con stock bajo va paginada por cursor.
     """
     try:
-        data = supabase.table("productos").select("*").eq(
-            "negocio_id", negocio_id
-        ).execute()
-        
-        # Productos con stock bajo
-        bajo_stock = [p for p in data.data if p["stock_actual"] < p["stock_minimo"]]
+        kind = "low-stock:" + negocio_id
+        params = {"p_negocio_id": negocio_id, "p_limit": limit + 1}
+        values = cursor_values(kind, cursor, LOW_STOCK_KEY)
+        if values:
+            params["p_after_stock"], params["p_after_id"] = values
         
-        # Valor total inventario
-        valor_total = sum(p["precio_compra"] * p["stock_actual"] for p in data.data)
+        resumen, bajo_stock = await asyncio.gather(
+            db.rpc("inventory_summary", {"p_negocio_id": negocio_id}).execute(),
+            db.rpc("low_stock_productos", params).execute()
+        )
+        resumen = resumen.data or {}
+        lista, next_cursor = page_result(bajo_stock.data or [], kind, limit, key=LOW_STOCK_KEY)
         
         return {
             "success": True,
-            "total_productos": len(data.data),
-            "productos_bajo_stock": len(bajo_stock),
-            "valor_total_inventario": valor_total,
-            "productos_bajo_stock_lista": bajo_stock
+            "total_productos": resumen.get("total_productos", 0),
+            "productos_bajo_stock": resumen.get("productos_bajo_stock", 0),
+            "valor_total_inventario": resumen.get("valor_total_inventario", 0),
+            "valor_por_categoria": resumen.get("por_categoria", []),
+            "productos_bajo_stock_lista": lista,
+            "next_cursor": next_cursor
         }
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def load_customer_kpis(negocio_id):
+    """Conteo de clientes y resumen de deudas pendientes, en paralelo"""
+    db = get_db()
+    clientes, cuentas = await asyncio.gather(
+        db.table("clientes").select("id", count="exact").eq(
+            "negocio_id", negocio_id
+        ).limit(1).execute(),
+        db.rpc("receivables_summary", {"p_negocio_id": negocio_id}).execute()
+    )
+    cuentas = cuentas.data or {}
+    return {
+        "total_clientes": clientes.count or 0,
+        "cuentas_pendientes": cuentas.get("cuentas_pendientes", 0),
+        "deuda_total": cuentas.get("deuda_total", 0)
+    }
+
 @router.get("/clientes/{negocio_id}")
 async def get_customers_analytics(negocio_id: str):
     """
-    Obtiene analítica de clientes
+    Obtiene analítica de clientes (cacheada por negocio)
     """
     try:
-        # Obtener clientes
-        clientes = supabase.table("clientes").select("*").eq(
-            "negocio_id", negocio_id
-        ).execute()
-        
-        # Obtener deudas
-        cuentas = supabase.table("cuentas_por_cobrar").select("*").eq(
-            "negocio_id", negocio_id
-        ).eq("estado", "PENDIENTE").execute()
-        
-        total_deuda = sum(c["monto_pendiente"] for c in cuentas.data)
+        kpis = await customer_kpis.get(negocio_id, load_customer_kpis)
         
         return {
             "success": True,
-            "total_clientes": len(clientes.data),
-            "cuentas_pendientes": len(cuentas.data),
-            "deuda_total": total_deuda
+            **kpis
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
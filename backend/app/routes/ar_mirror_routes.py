@@ -1,38 +1,61 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, Query
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    UploadFile,
+    HTTPException,
+    Query,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 import cv2
 import numpy as np
-import mediapipe as mp
 from PIL import Image
 import io
+import time
 from datetime import datetime
-import os
-from supabase import create_client, Client
-
-router = APIRouter()
-
-# MediaPipe setup
-mp_pose = mp.solutions.pose
-mp_hands = mp.solutions.hands
-pose = mp_pose.Pose(static_image_mode=False, model_complexity=1)
-hands = mp_hands.Hands()
 
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
+from app.services.compositing import (
+    composite,
+    solid_layer,
+    texture_layer,
+    circle_layer,
+)
+from app.services.database import get_db
+from app.services.garment_cache import garment_cache
+from app.services.image_output import (
+    OutputOptions,
+    output_options,
+    fit_frame,
+    encode_frame,
+    to_base64,
+    image_response,
+)
+from app.services.image_input import (
+    InvalidImage,
+    decode_with_pose,
+    pipeline_timing,
+)
+from app.services.inference import InferenceQueueFull
+from app.services.live_session import live_sessions, SessionLimitReached
+from app.services.pose_cache import detect_pose_cached
+from app.services.size_comparison import (
+    render_size_comparisons,
+    get_scale_by_size,
+    clothing_rect,
 )
+from app.services.uploads import UploadRejected, image_upload
+
+router = APIRouter()
 
 class PoseDetector:
     """Detecta pose corporal para probador AR"""
     
-    def __init__(self):
-        self.pose = pose
-        
-    def detect_pose(self, frame):
-        """Detecta landmarks del cuerpo"""
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.pose.process(frame_rgb)
-        return results
+    async def detect_pose(self, frame):
+        """Detecta landmarks del cuerpo (caché de pose + pool de inferencia)"""
+        return await detect_pose_cached(frame)
     
     def get_body_measurements(self, landmarks, frame_height, frame_width):
         """Calcula medidas corporales"""
@@ -88,68 +111,120 @@ class PoseDetector:
 
 detector = PoseDetector()
 
+def decode_for_pose(upload, max_side):
+    """Decodifica reducido y prepara la copia acotada para la pose"""
+    try:
+        return decode_with_pose(upload.data, max_side, upload.header)
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def fetch_clothing_product(product_id):
+    """Metadata de render de la prenda (solo en fallos de caché)"""
+    product_data = await get_db().table("clothing_products").select(
+        "imagen_3d_url, colores"
+    ).eq("id", product_id).limit(1).execute()
+    return product_data.data[0] if product_data.data else None
+
+def draw_prenda(frame, prenda_type, landmarks, measurements, max_side, texture=None):
+    """Superpone la prenda según tipo sobre el frame de salida"""
+    # Los landmarks están normalizados: la geometría se adapta al nuevo tamaño
+    frame = fit_frame(frame, max_side)
+    
+    if prenda_type == "top":
+        frame = apply_top_overlay(frame, landmarks, measurements, texture)
+    elif prenda_type == "bottom":
+        frame = apply_bottom_overlay(frame, landmarks, measurements, texture)
+    elif prenda_type == "full_body":
+        frame = apply_full_body_overlay(frame, landmarks, measurements, texture)
+    elif prenda_type == "shoes":
+        frame = apply_shoes_overlay(frame, landmarks, measurements, texture)
+    elif prenda_type == "accessories":
+        frame = apply_accessories_overlay(frame, landmarks, measurements, texture)
+    return frame
+
+def render_prenda(frame, prenda_type, landmarks, measurements, options, texture=None):
+    """Superpone la prenda según tipo y retorna la imagen codificada"""
+    frame = draw_prenda(
+        frame, prenda_type, landmarks, measurements, options.max_side, texture
+    )
+    return encode_frame(frame, options)
+
 @router.post("/mirror/process")
 async def process_ar_mirror(
     image: UploadFile = File(...),
     product_id: str = Query(...),
-    prenda_type: str = Query(...)  # 'top', 'bottom', 'full_body', 'shoes', 'accessories'
+    prenda_type: str = Query(...),  # 'top', 'bottom', 'full_body', 'shoes', 'accessories'
+    options: OutputOptions = Depends(output_options)
 ):
     """
     Procesa imagen para probador AR
     Detecta pose y superpone prenda virtual
+    Salida: JSON (base64), image/jpeg, image/webp o multipart/mixed
     """
     try:
-        contents = await image.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.COLOR_BGR2RGB)
-        
-        h, w, c = frame.shape
-        
-        # Detectar pose
-        results = detector.detect_pose(frame)
-        
-        if not results.pose_landmarks:
-            raise HTTPException(status_code=400, detail="No se detectó pose corporal")
-        
-        landmarks = results.pose_landmarks.landmark
-        measurements = detector.get_body_measurements(landmarks, h, w)
-        
-        # Obtener prenda del producto
-        product_data = supabase.table("clothing_products").select(
-            "imagen_3d_url, colores"
-        ).eq("id", product_id).single().execute()
-        
-        if not product_data.data:
-            raise HTTPException(status_code=404, detail="Producto no encontrado")
-        
-        # Superponer prenda según tipo
-        if prenda_type == "top":
-            frame = apply_top_overlay(frame, landmarks, measurements)
-        elif prenda_type == "bottom":
-            frame = apply_bottom_overlay(frame, landmarks, measurements)
-        elif prenda_type == "full_body":
-            frame = apply_full_body_overlay(frame, landmarks, measurements)
-        elif prenda_type == "shoes":
-            frame = apply_shoes_overlay(frame, landmarks, measurements)
-        elif prenda_type == "accessories":
-            frame = apply_accessories_overlay(frame, landmarks, measurements)
-        
-        # Convertir a bytes
-        success, buffer = cv2.imencode('.jpg', frame)
-        img_bytes = buffer.tobytes()
-        
-        # Talla recomendada
-        recommended_size, confidence = detector.recommend_size(measurements)
-        
-        return {
-            "success": True,
-            "image_base64": img_bytes.hex(),
-            "recommended_size": recommended_size,
-            "size_confidence": confidence,
-            "measurements": measurements,
-            "timestamp": datetime.now().isoformat()
-        }
-        
+        async with image_upload(image) as upload:
+            decoded, pose_frame = await run_in_threadpool(
+                decode_for_pose, upload, options.max_side
+            )
+            
+            # Medidas en píxeles de la foto original
+            h, w = decoded.height, decoded.width
+            
+            # Detectar pose
+            results = await detector.detect_pose(pose_frame)
+            
+            if not results.landmarks:
+                raise HTTPException(status_code=400, detail="No se detectó pose corporal")
+            
+            landmarks = results.landmarks
+            measurements = detector.get_body_measurements(landmarks, h, w)
+            
+            # Obtener prenda del producto (caché de assets)
+            garment = await garment_cache.get_asset(product_id, fetch_clothing_product)
+            
+            if not garment:
+                raise HTTPException(status_code=404, detail="Producto no encontrado")
+            
+            # Superponer prenda según tipo y convertir a bytes
+            frame = await run_in_threadpool(
+                draw_prenda, decoded.frame, prenda_type, landmarks, measurements,
+                options.max_side, garment.texture
+            )
+            started_at = time.perf_counter()
+            img_bytes = await run_in_threadpool(encode_frame, frame, options)
+            encode_ms = round((time.perf_counter() - started_at) * 1000, 2)
+            
+            # Talla recomendada
+            recommended_size, confidence = detector.recommend_size(measurements)
+            
+            timing = pipeline_timing(decoded, results, encode_ms)
+            
+            if options.mode != "json":
+                return image_response({"image": img_bytes}, options, {
+                    "recommended_size": recommended_size,
+                    "size_confidence": confidence,
+                    "measurements": {
+                        k: v for k, v in measurements.items() if k != "landmarks"
+                    },
+                    "timing": timing
+                })
+            
+            return {
+                "success": True,
+                "image_base64": to_base64(img_bytes),
+                "recommended_size": recommended_size,
+                "size_confidence": confidence,
+                "measurements": measurements,
+                "timing": timing,
+                "timestamp": datetime.now().isoformat()
+            }
+            
+    except HTTPException:
+        raise
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -157,51 +232,108 @@ async def process_ar_mirror(
 async def compare_sizes(
     image: UploadFile = File(...),
     product_id: str = Query(...),
-    sizes: str = Query(...)  # "XS,S,M,L"
+    sizes: str = Query(...),  # "XS,S,M,L"
+    options: OutputOptions = Depends(output_options)
 ):
     """
     Compara cómo se vería la prenda en diferentes tallas
+    Salida binaria: multipart/mixed con una parte por talla
     """
     try:
-        contents = await image.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.COLOR_BGR2RGB)
-        
-        h, w, c = frame.shape
-        results = detector.detect_pose(frame)
-        
-        if not results.pose_landmarks:
-            raise HTTPException(status_code=400, detail="No se detectó pose")
-        
-        landmarks = results.pose_landmarks.landmark
-        size_list = sizes.split(",")
-        
-        comparisons = {}
-        for size in size_list:
-            # Aplicar escala según talla
-            scale = get_scale_by_size(size)
-            frame_copy = frame.copy()
+        async with image_upload(image) as upload:
+            decoded, pose_frame = await run_in_threadpool(
+                decode_for_pose, upload, options.max_side
+            )
+            
+            results = await detector.detect_pose(pose_frame)
+            
+            if not results.landmarks:
+                raise HTTPException(status_code=400, detail="No se detectó pose")
+            
+            landmarks = results.landmarks
+            size_list = sizes.split(",")
             
-            # Superponer con escala
-            frame_copy = apply_clothing_with_scale(
-                frame_copy, landmarks, scale
+            frame = await run_in_threadpool(fit_frame, decoded.frame, options.max_side)
+            started_at = time.perf_counter()
+            comparisons = await run_in_threadpool(
+                render_size_comparisons, frame, landmarks, size_list, options
             )
+            encode_ms = round((time.perf_counter() - started_at) * 1000, 2)
             
-            success, buffer = cv2.imencode('.jpg', frame_copy)
-            comparisons[size] = buffer.tobytes().hex()
-        
-        return {
-            "success": True,
-            "comparisons": comparisons,
-            "timestamp": datetime.now().isoformat()
-        }
-        
+            timing = pipeline_timing(decoded, results, encode_ms)
+            
+            if options.mode != "json":
+                return image_response(comparisons, options, {"timing": timing})
+            
+            return {
+                "success": True,
+                "comparisons": {
+                    size: to_base64(img_bytes) for size, img_bytes in comparisons.items()
+                },
+                "timing": timing,
+                "timestamp": datetime.now().isoformat()
+            }
+            
+    except HTTPException:
+        raise
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def apply_top_overlay(frame, landmarks, measurements):
-    """Superpone camiseta/blusa"""
-    h, w = frame.shape[:2]
+@router.post("/mirror/garments/{product_id}/invalidate")
+async def invalidate_garment(product_id: str):
+    """Invalida la prenda en caché tras actualizar el producto"""
+    garment_cache.invalidate(product_id)
+    return {
+        "success": True,
+        "message": "Prenda invalidada"
+    }
+
+@router.websocket("/mirror/live")
+async def live_ar_mirror(
+    websocket: WebSocket,
+    prenda_type: str = Query("top"),
+    modo: str = Query("overlay"),  # 'overlay' (JPEG binario) o 'landmarks' (JSON)
+    quality: int = Query(70, ge=1, le=100)
+):
+    """
+    Probador AR en vivo
+    El cliente envía frames JPEG binarios; se procesa siempre el más reciente
+    y se responde con el overlay (binario) o un paquete de landmarks (JSON)
+    """
+    await websocket.accept()
+    options = OutputOptions(mode="image", quality=quality, max_side=0)
+    
+    def handle_frame(frame, landmarks):
+        if not landmarks:
+            return {"pose": False}
+        
+        h, w = frame.shape[:2]
+        measurements = detector.get_body_measurements(landmarks, h, w)
+        
+        if modo == "landmarks":
+            recommended_size, confidence = detector.recommend_size(measurements)
+            return {
+                "pose": True,
+                "landmarks": [list(lm) for lm in landmarks],
+                "recommended_size": recommended_size,
+                "size_confidence": confidence
+            }
+        return render_prenda(frame, prenda_type, landmarks, measurements, options)
+    
+    try:
+        await live_sessions.serve(websocket, handle_frame)
+    except SessionLimitReached as e:
+        await websocket.close(code=1013, reason=str(e))
+    except WebSocketDisconnect:
+        pass
+
+def top_layer(landmarks, frame_height, frame_width, texture=None):
+    """Capa de camiseta/blusa: de hombros a caderas"""
+    h, w = frame_height, frame_width
     
     shoulder_left = landmarks[11]
     shoulder_right = landmarks[12]
@@ -214,16 +346,14 @@ def apply_top_overlay(frame, landmarks, measurements):
     x2 = int(max(shoulder_left.x, shoulder_right.x) * w)
     y2 = int(max(hip_left.y, hip_right.y) * h)
     
-    # Color aleatorio (representar prenda)
-    overlay = frame.copy()
-    cv2.rectangle(overlay, (x1, y1), (x2, y2), (100, 200, 255), -1)
-    
-    cv2.addWeighted(overlay, 0.6, frame, 0.4, 0, frame)
-    return frame
+    if texture is not None:
+        return texture_layer((x1, y1, x2, y2), texture)
+    # Color fijo (representar prenda)
+    return solid_layer((x1, y1, x2, y2), (100, 200, 255), 0.6)
 
-def apply_bottom_overlay(frame, landmarks, measurements):
-    """Superpone pantalones/falda"""
-    h, w = frame.shape[:2]
+def bottom_layer(landmarks, frame_height, frame_width, texture=None):
+    """Capa de pantalón/falda: de caderas a tobillos"""
+    h, w = frame_height, frame_width
     
     hip_left = landmarks[23]
     hip_right = landmarks[24]
@@ -235,19 +365,36 @@ def apply_bottom_overlay(frame, landmarks, measurements):
     x2 = int(max(hip_left.x, hip_right.x) * w)
     y2 = int(max(ankle_left.y, ankle_right.y) * h)
     
-    overlay = frame.copy()
-    cv2.rectangle(overlay, (x1, y1), (x2, y2), (80, 100, 200), -1)
-    
-    cv2.addWeighted(overlay, 0.6, frame, 0.4, 0, frame)
-    return frame
+    if texture is not None:
+        return texture_layer((x1, y1, x2, y2), texture)
+    return solid_layer((x1, y1, x2, y2), (80, 100, 200), 0.6)
+
+def apply_top_overlay(frame, landmarks, measurements, texture=None):
+    """Superpone camiseta/blusa"""
+    h, w = frame.shape[:2]
+    return composite(frame, [top_layer(landmarks, h, w, texture)])
+
+def apply_bottom_overlay(frame, landmarks, measurements, texture=None):
+    """Superpone pantalones/falda"""
+    h, w = frame.shape[:2]
+    return composite(frame, [bottom_layer(landmarks, h, w, texture)])
 
-def apply_full_body_overlay(frame, landmarks, measurements):
+def apply_full_body_overlay(frame, landmarks, measurements, texture=None):
     """Superpone vestido/abrigo"""
-    frame = apply_top_overlay(frame, landmarks, measurements)
-    frame = apply_bottom_overlay(frame, landmarks, measurements)
-    return frame
+    h, w = frame.shape[:2]
+    top = top_layer(landmarks, h, w)
+    bottom = bottom_layer(landmarks, h, w)
+    
+    if texture is not None:
+        # Una sola textura de hombros a tobillos
+        x1 = min(top.rect[0], bottom.rect[0])
+        x2 = max(top.rect[2], bottom.rect[2])
+        return composite(frame, [
+            texture_layer((x1, top.rect[1], x2, bottom.rect[3]), texture)
+        ])
+    return composite(frame, [top, bottom])
 
-def apply_shoes_overlay(frame, landmarks, measurements):
+def apply_shoes_overlay(frame, landmarks, measurements, texture=None):
     """Superpone zapatos"""
     h, w = frame.shape[:2]
     
@@ -256,79 +403,36 @@ def apply_shoes_overlay(frame, landmarks, measurements):
     foot_left = landmarks[31]
     foot_right = landmarks[32]
     
-    # Zapato izquierdo
-    x1 = int(ankle_left.x * w) - 20
-    y1 = int(ankle_left.y * h)
-    x2 = int(foot_left.x * w) + 20
-    y2 = int(foot_left.y * h) + 40
-    
-    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 0), -1)
-    
-    # Zapato derecho
-    x1 = int(ankle_right.x * w) - 20
-    y1 = int(ankle_right.y * h)
-    x2 = int(foot_right.x * w) + 20
-    y2 = int(foot_right.y * h) + 40
-    
-    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 0), -1)
+    layers = []
+    for ankle, foot in ((ankle_left, foot_left), (ankle_right, foot_right)):
+        x1 = int(ankle.x * w) - 20
+        y1 = int(ankle.y * h)
+        x2 = int(foot.x * w) + 20
+        y2 = int(foot.y * h) + 40
+        layers.append(solid_layer((x1, y1, x2, y2), (0, 0, 0)))
     
-    return frame
+    return composite(frame, layers)
 
-def apply_accessories_overlay(frame, landmarks, measurements):
+def apply_accessories_overlay(frame, landmarks, measurements, texture=None):
     """Superpone accesorios (collares, pulseras)"""
     h, w = frame.shape[:2]
     
     # Cuello
     neck = landmarks[0]
-    x = int(neck.x * w)
-    y = int(neck.y * h)
-    cv2.circle(frame, (x, y), 30, (255, 215, 0), 2)
+    layers = [
+        circle_layer((int(neck.x * w), int(neck.y * h)), 30, (255, 215, 0), 2)
+    ]
     
     # Muñecas
-    wrist_left = landmarks[15]
-    wrist_right = landmarks[16]
-    
-    x_l = int(wrist_left.x * w)
-    y_l = int(wrist_left.y * h)
-    cv2.circle(frame, (x_l, y_l), 15, (255, 215, 0), 2)
-    
-    x_r = int(wrist_right.x * w)
-    y_r = int(wrist_right.y * h)
-    cv2.circle(frame, (x_r, y_r), 15, (255, 215, 0), 2)
+    for wrist in (landmarks[15], landmarks[16]):
+        layers.append(
+            circle_layer((int(wrist.x * w), int(wrist.y * h)), 15, (255, 215, 0), 2)
+        )
     
-    return frame
-
-def get_scale_by_size(size):
-    """Obtiene escala según talla"""
-    scales = {
-        "XS": 0.85,
-        "S": 0.90,
-        "M": 1.0,
-        "L": 1.10,
-        "XL": 1.20,
-        "XXL": 1.30
-    }
-    return scales.get(size, 1.0)
+    return composite(frame, layers)
 
 def apply_clothing_with_scale(frame, landmarks, scale):
     """Aplica overlay de ropa con escala"""
     h, w = frame.shape[:2]
-    
-    # Centro del cuerpo
-    center_x = int((landmarks[11].x + landmarks[12].x) / 2 * w)
-    center_y = int((landmarks[11].y + landmarks[12].y) / 2 * h)
-    
-    # Tamaño base
-    width = int(abs(landmarks[12].x - landmarks[11].x) * w * scale)
-    height = int(abs(landmarks[23].y - landmarks[12].y) * h * scale)
-    
-    x1 = center_x - width // 2
-    y1 = center_y - height // 2
-    x2 = center_x + width // 2
-    y2 = center_y + height // 2
-    
-    overlay = frame.copy()
-    cv2.rectangle(overlay, (x1, y1), (x2, y2), (100, 200, 255), -1)
-    cv2.addWeighted(overlay, 0.6, frame, 0.4, 0, frame)
-    
-    return frame
+    rect = clothing_rect(landmarks, h, w, scale)
+    return composite(frame, [solid_layer(rect, (100, 200, 255), 0.6)])
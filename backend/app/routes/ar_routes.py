@@ -1,71 +1,123 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 import cv2
 import numpy as np
 from PIL import Image
 import io
-import mediapipe as mp
+import time
 from datetime import datetime
 
+from app.services.compositing import composite, solid_layer, circle_layer
+from app.services.image_output import (
+    OutputOptions,
+    output_options,
+    fit_frame,
+    encode_frame,
+    to_base64,
+    image_response,
+)
+from app.services.image_input import (
+    AR_POSE_INPUT_SIDE,
+    InvalidImage,
+    decode_with_pose,
+    pipeline_timing,
+)
+from app.services.inference import get_inference_executor, InferenceQueueFull
+from app.services.pose_cache import detect_pose_cached
+from app.services.uploads import UploadRejected, image_upload
+
 router = APIRouter()
 
-# MediaPipe setup
-mp_pose = mp.solutions.pose
-mp_hands = mp.solutions.hands
-pose = mp_pose.Pose()
-hands = mp_hands.Hands()
+executor = get_inference_executor()
+
+def decode_for_pose(upload, max_side):
+    """Decodifica reducido y prepara la copia acotada para la pose"""
+    try:
+        return decode_with_pose(upload.data, max_side, upload.header)
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def draw_try_on(frame, type, landmarks, product_id, hands, max_side):
+    """Superpone según tipo sobre el frame de salida"""
+    frame = fit_frame(frame, max_side)
+    
+    if type == "clothing":
+        processed_frame = apply_clothing_overlay(frame, landmarks, product_id)
+    elif type == "jewelry":
+        processed_frame = apply_jewelry_overlay(frame, landmarks, hands)
+    elif type == "makeup":
+        processed_frame = apply_makeup_overlay(frame, landmarks)
+    else:
+        processed_frame = frame
+    
+    return processed_frame
 
 @router.post("/virtual-try-on")
 async def virtual_try_on(
     image: UploadFile = File(...),
     product_id: str = None,
-    type: str = "clothing"
+    type: str = "clothing",
+    options: OutputOptions = Depends(output_options)
 ):
     """
     Procesa una imagen para probador virtual AR
     - Detecta pose corporal
     - Superpone la prenda
-    - Retorna imagen procesada
+    - Retorna imagen procesada (JSON base64, binaria o multipart)
     """
     try:
         # Leer imagen
-        contents = await image.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Convertir a RGB
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Detectar pose
-        results = pose.process(frame_rgb)
-        
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-            
-            # Procesar según tipo
-            if type == "clothing":
-                processed_frame = apply_clothing_overlay(frame, landmarks, product_id)
-            elif type == "jewelry":
-                processed_frame = apply_jewelry_overlay(frame, landmarks)
-            elif type == "makeup":
-                processed_frame = apply_makeup_overlay(frame, landmarks)
-            else:
-                processed_frame = frame
+        async with image_upload(image) as upload:
+            decoded, pose_frame = await run_in_threadpool(
+                decode_for_pose, upload, options.max_side
+            )
             
-            # Convertir a bytes
-            _, buffer = cv2.imencode('.jpg', processed_frame)
-            img_bytes = buffer.tobytes()
-            
-            return {
-                "success": True,
-                "message": "Imagen procesada",
-                "image_base64": img_bytes.hex(),
-                "timestamp": datetime.now().isoformat(),
-                "landmarks_count": len(landmarks)
-            }
-        else:
-            raise HTTPException(status_code=400, detail="No se detectó postura corporal")
+            # Detectar pose
+            results = await detect_pose_cached(pose_frame)
             
+            if results.landmarks:
+                landmarks = results.landmarks
+                
+                # Las joyas necesitan además los landmarks de las manos
+                hands = None
+                if type == "jewelry":
+                    hands = (await executor.detect_hands(pose_frame)).hands
+                
+                # Procesar según tipo y convertir a bytes
+                frame = await run_in_threadpool(
+                    draw_try_on, decoded.frame, type, landmarks, product_id, hands,
+                    options.max_side
+                )
+                started_at = time.perf_counter()
+                img_bytes = await run_in_threadpool(encode_frame, frame, options)
+                encode_ms = round((time.perf_counter() - started_at) * 1000, 2)
+                
+                timing = pipeline_timing(decoded, results, encode_ms)
+                
+                if options.mode != "json":
+                    return image_response({"image": img_bytes}, options, {
+                        "landmarks_count": len(landmarks),
+                        "timing": timing
+                    })
+                
+                return {
+                    "success": True,
+                    "message": "Imagen procesada",
+                    "image_base64": to_base64(img_bytes),
+                    "timestamp": datetime.now().isoformat(),
+                    "landmarks_count": len(landmarks),
+                    "timing": timing
+                }
+            else:
+                raise HTTPException(status_code=400, detail="No se detectó postura corporal")
+                
+    except HTTPException:
+        raise
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -76,48 +128,57 @@ async def detect_size(image: UploadFile = File(...)):
     Retorna: ancho hombros, altura, etc.
     """
     try:
-        contents = await image.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.COLOR_BGR2RGB)
-        
-        results = pose.process(frame)
-        
-        if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
+        async with image_upload(image) as upload:
+            # Solo se necesita la pose: decodificar directo al tamaño de inferencia
+            decoded, pose_frame = await run_in_threadpool(
+                decode_for_pose, upload, AR_POSE_INPUT_SIDE
+            )
             
-            # Calcular medidas
-            shoulder_left = landmarks[11]
-            shoulder_right = landmarks[12]
-            hip_left = landmarks[23]
-            hip_right = landmarks[24]
+            results = await detect_pose_cached(pose_frame)
             
-            shoulder_width = abs(shoulder_right.x - shoulder_left.x)
-            hip_width = abs(hip_right.x - hip_left.x)
-            
-            # Estimar talla
-            if shoulder_width < 0.25:
-                size = "XS"
-            elif shoulder_width < 0.30:
-                size = "S"
-            elif shoulder_width < 0.35:
-                size = "M"
-            elif shoulder_width < 0.40:
-                size = "L"
-            elif shoulder_width < 0.45:
-                size = "XL"
+            if results.landmarks:
+                landmarks = results.landmarks
+                
+                # Calcular medidas
+                shoulder_left = landmarks[11]
+                shoulder_right = landmarks[12]
+                hip_left = landmarks[23]
+                hip_right = landmarks[24]
+                
+                shoulder_width = abs(shoulder_right.x - shoulder_left.x)
+                hip_width = abs(hip_right.x - hip_left.x)
+                
+                # Estimar talla
+                if shoulder_width < 0.25:
+                    size = "XS"
+                elif shoulder_width < 0.30:
+                    size = "S"
+                elif shoulder_width < 0.35:
+                    size = "M"
+                elif shoulder_width < 0.40:
+                    size = "L"
+                elif shoulder_width < 0.45:
+                    size = "XL"
+                else:
+                    size = "XXL"
+                
+                return {
+                    "success": True,
+                    "estimated_size": size,
+                    "shoulder_width": float(shoulder_width),
+                    "hip_width": float(hip_width),
+                    "confidence": 0.85,
+                    "timing": pipeline_timing(decoded, results)
+                }
             else:
-                size = "XXL"
-            
-            return {
-                "success": True,
-                "estimated_size": size,
-                "shoulder_width": float(shoulder_width),
-                "hip_width": float(hip_width),
-                "confidence": 0.85
-            }
-        else:
-            raise HTTPException(status_code=400, detail="No se detectó postura")
-            
+                raise HTTPException(status_code=400, detail="No se detectó postura")
+                
+    except HTTPException:
+        raise
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except InferenceQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -139,27 +200,24 @@ def apply_clothing_overlay(frame, landmarks, product_id):
     x_right = int(shoulder_right.x * w)
     y_bottom = int(hip_left.y * h)
     
-    # Dibujar rectángulo (simulación de prenda)
-    cv2.rectangle(frame, (x_left, y_top), (x_right, y_bottom), (100, 200, 255), -1)
-    
-    return frame
+    # Rectángulo sólido (simulación de prenda)
+    return composite(frame, [
+        solid_layer((x_left, y_top, x_right, y_bottom), (100, 200, 255))
+    ])
 
-def apply_jewelry_overlay(frame, landmarks):
+def apply_jewelry_overlay(frame, landmarks, hands):
     """Superpone joyas (collares, pulseras)"""
-    # Detectar manos
     h, w, c = frame.shape
-    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    hand_results = hands.process(frame_rgb)
     
-    if hand_results.multi_hand_landmarks:
-        for hand_landmarks in hand_results.multi_hand_landmarks:
-            # Dibujar círculos en muñecas
-            wrist = hand_landmarks.landmark[0]
-            x = int(wrist.x * w)
-            y = int(wrist.y * h)
-            cv2.circle(frame, (x, y), 15, (0, 215, 255), -1)
+    # Círculos en muñecas
+    layers = []
+    for hand_landmarks in hands or []:
+        wrist = hand_landmarks[0]
+        layers.append(
+            circle_layer((int(wrist.x * w), int(wrist.y * h)), 15, (0, 215, 255))
+        )
     
-    return frame
+    return composite(frame, layers)
 
 def apply_makeup_overlay(frame, landmarks):
     """Superpone maquillaje (ojos, labios)"""
@@ -174,6 +232,6 @@ def apply_makeup_overlay(frame, landmarks):
     y_nose = int(nose.y * h)
     
     # Aplicar color rojo en los labios (aproximado)
-    cv2.circle(frame, (x_nose, y_nose + 30), 20, (0, 0, 255), -1)
-    
-    return frame
+    return composite(frame, [
+        circle_layer((x_nose, y_nose + 30), 20, (0, 0, 255))
+    ])
@@ -1,19 +1,23 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query
+from fastapi.responses import Response
 from pydantic import BaseModel
+from typing import Optional
 import uuid
 import qrcode
 import io
 import base64
 from datetime import datetime, timedelta
-import os
-from supabase import create_client, Client
 
-router = APIRouter()
+from app.services.database import Database, get_db
+from app.services.garment_cache import garment_cache
+from app.services.idempotency import IdempotencyKeyReused, idempotency_cache
+from app.services.kpi_cache import customer_kpis
+from app.services.response_cache import response_cache
+from app.services.stock import STOCK_RESERVATION_MINUTES
+from app.services.storefront import etag_matches, storefront_body, storefront_cache
+from app.services.visit_counter import visit_counter
 
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
-)
+router = APIRouter()
 
 class CreatePublicLink(BaseModel):
     negocio_id: str
@@ -35,7 +39,10 @@ class PublicMarketplaceLink(BaseModel):
     visitas: int
 
 @router.post("/links/create")
-async def create_public_link(link_data: CreatePublicLink):
+async def create_public_link(
+    link_data: CreatePublicLink,
+    db: Database = Depends(get_db)
+):
     """
     Crea enlace público para marketplace
     Genera código único y QR
@@ -71,9 +78,10 @@ async def create_public_link(link_data: CreatePublicLink):
             "visitas": 0
         }
         
-        response = supabase.table("marketplace_links").insert(
+        response = await db.table("marketplace_links").insert(
             marketplace_data
         ).execute()
+        await response_cache.invalidate("links", link_data.negocio_id)
         
         return {
             "success": True,
@@ -85,68 +93,83 @@ async def create_public_link(link_data: CreatePublicLink):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/links/{negocio_id}")
-async def get_marketplace_links(negocio_id: str):
+async def get_marketplace_links(negocio_id: str, db: Database = Depends(get_db)):
     """Obtiene todos los enlaces del negocio"""
     try:
-        data = supabase.table("marketplace_links").select("*").eq(
-            "negocio_id", negocio_id
-        ).execute()
+        async def load():
+            data = await db.table("marketplace_links").select("*").eq(
+                "negocio_id", negocio_id
+            ).execute()
+            return data.data
+        
+        links = await response_cache.get_or_load("links", (negocio_id,), load)
         
         return {
             "success": True,
-            "links": data.data,
-            "total": len(data.data)
+            "links": links,
+            "total": len(links)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def load_storefront(codigo):
+    """Enlace + negocio + productos activos en una sola llamada (RPC)"""
+    response = await get_db().rpc("marketplace_storefront", {"p_codigo": codigo}).execute()
+    return response.data
+
 @router.get("/access/{codigo}")
-async def access_marketplace(codigo: str):
+async def access_marketplace(
+    codigo: str,
+    background_tasks: BackgroundTasks,
+    if_none_match: Optional[str] = Header(None)
+):
     """
     Acceso público al marketplace
     Verificar que el enlace esté activo
+    Soporta If-None-Match: si la vitrina no cambió responde 304
     """
     try:
-        data = supabase.table("marketplace_links").select(
-            "*, negocios:negocio_id(nombre_comercial, logo_url)"
-        ).eq("codigo", codigo).eq("estado", "ACTIVO").single().execute()
+        storefront, loaded = await storefront_cache.get(codigo, load_storefront)
         
-        if not data.data:
+        if not storefront:
             raise HTTPException(status_code=404, detail="Enlace no encontrado")
         
-        # Incrementar visitas
-        supabase.table("marketplace_links").update({
-            "visitas": data.data["visitas"] + 1
-        }).eq("id", data.data["id"]).execute()
+        # Escritura diferida: se suma en memoria y se vacía por lotes
+        visit_counter.add(codigo)
         
-        # Obtener productos del negocio
-        products = supabase.table("clothing_products").select(
-            "*"
-        ).eq("negocio_id", data.data["negocio_id"]).eq("activo", True).execute()
+        headers = {"ETag": storefront.etag, "Cache-Control": "public, no-cache"}
+        if etag_matches(if_none_match, storefront.etag):
+            return Response(status_code=304, headers=headers)
         
-        return {
-            "success": True,
-            "marketplace": {
-                "nombre": data.data["nombre"],
-                "descripcion": data.data["descripcion"],
-                "negocio": data.data["negocios"],
-                "productos": products.data,
-                "total_productos": len(products.data),
-                "visitas": data.data["visitas"]
-            }
-        }
+        if loaded:
+            visit_counter.observe(codigo, storefront.visitas)
+            # Precalentar prendas del probador AR mientras el cliente navega
+            background_tasks.add_task(garment_cache.prefetch, storefront.productos)
+        
+        visitas = visit_counter.current(codigo, storefront.visitas)
+        return Response(
+            storefront_body(storefront, visitas),
+            media_type="application/json",
+            headers=headers
+        )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/links/{link_id}")
-async def delete_marketplace_link(link_id: str):
+async def delete_marketplace_link(link_id: str, db: Database = Depends(get_db)):
     """Desactiva un enlace público"""
     try:
-        supabase.table("marketplace_links").update({
+        response = await db.table("marketplace_links").update({
             "estado": "INACTIVO"
         }).eq("id", link_id).execute()
         
+        for link in response.data:
+            storefront_cache.invalidate(link["codigo"])
+            await response_cache.invalidate("links", link["negocio_id"])
+        
         return {
             "success": True,
             "message": "Enlace desactivado"
@@ -160,56 +183,98 @@ async def create_order_from_marketplace(
     producto_id: str,
     talla: str,
     color: str,
-    cantidad: int,
-    cliente_nombre: str,
-    cliente_email: str,
-    cliente_telefono: str,
-    cliente_direccion: str
+    response: Response,
+    cantidad: int = Query(..., ge=1),
+    cliente_nombre: str = Query(...),
+    cliente_email: str = Query(...),
+    cliente_telefono: str = Query(...),
+    cliente_direccion: str = Query(...),
+    idempotency_key: Optional[str] = Header(None, max_length=255),
+    db: Database = Depends(get_db)
 ):
-    """Crea orden desde marketplace público"""
+    """
+    Crea orden desde marketplace público
+    Enlace, producto, cliente invitado y orden en una sola transacción (RPC).
+    Con Idempotency-Key, un reintento retorna la orden original sin escribir;
+    la misma clave con otros datos en el mismo enlace responde 422.
+    El stock de la talla/color queda reservado hasta que el vendedor confirma
+    la orden; si no la confirma a tiempo, la reserva se libera sola.
+    """
     try:
-        # Obtener enlace
-        link_data = supabase.table("marketplace_links").select(
-            "negocio_id"
-        ).eq("codigo", codigo).single().execute()
-        
-        # Obtener producto
-        product_data = supabase.table("clothing_products").select(
-            "nombre, precio_venta"
-        ).eq("id", producto_id).single().execute()
-        
-        # Crear cliente guest
-        cliente = supabase.table("clientes").insert({
-            "negocio_id": link_data.data["negocio_id"],
-            "nombre": cliente_nombre,
-            "email": cliente_email,
-            "telefono": cliente_telefono,
-            "direccion": cliente_direccion,
-            "es_empresa": False,
-            "tipo_cliente": "CONSUMIDOR_FINAL"
-        }).execute()
-        
-        # Crear orden
-        orden = supabase.table("marketplace_orders").insert({
-            "negocio_id": link_data.data["negocio_id"],
-            "cliente_id": cliente.data[0]["id"],
-            "producto_id": producto_id,
-            "talla": talla,
-            "color": color,
-            "cantidad": cantidad,
-            "precio_unitario": product_data.data["precio_venta"],
-            "total": product_data.data["precio_venta"] * cantidad,
-            "estado": "PENDIENTE",
-            "origen": "MARKETPLACE_PUBLICO",
-            "fecha_creacion": datetime.now().isoformat()
-        }).execute()
+        params = {
+            "p_producto_id": producto_id,
+            "p_talla": talla,
+            "p_color": color,
+            "p_cantidad": cantidad,
+            "p_cliente": {
+                "nombre": cliente_nombre,
+                "email": cliente_email,
+                "telefono": cliente_telefono,
+                "direccion": cliente_direccion
+            }
+        }
+        
+        async def checkout():
+            result = await db.rpc("marketplace_checkout", {
+                "p_codigo": codigo,
+                **params,
+                "p_idempotency_key": idempotency_key,
+                "p_reserva_minutos": STOCK_RESERVATION_MINUTES
+            }).execute()
+            return result.data
+        
+        orden, replayed = await idempotency_cache.run(
+            ("checkout", codigo), idempotency_key, params, checkout
+        )
+        
+        if orden.get("error") == "IDEMPOTENCY_KEY_REUSED":
+            raise IdempotencyKeyReused("La clave de idempotencia ya se usó con otros datos")
+        if orden.get("error") == "ENLACE_NO_ENCONTRADO":
+            raise HTTPException(status_code=404, detail="Enlace no encontrado")
+        if orden.get("error") == "PRODUCTO_NO_ENCONTRADO":
+            raise HTTPException(status_code=404, detail="Producto no encontrado")
+        if orden.get("error") == "SIN_STOCK":
+            raise HTTPException(status_code=409, detail="Stock insuficiente para la talla y color")
+        
+        replayed = replayed or orden.get("replay", False)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+        else:
+            customer_kpis.invalidate(orden["negocio_id"])
         
         return {
             "success": True,
-            "orden_id": orden.data[0]["id"],
+            "orden_id": orden["orden_id"],
             "message": "Orden creada. El vendedor se contactará pronto.",
-            "total": product_data.data["precio_venta"] * cantidad
+            "total": orden["total"],
+            "reserva_expira_at": orden.get("reserva_expira_at")
         }
         
+    except HTTPException:
+        raise
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/orders/{orden_id}/confirm")
+async def confirm_marketplace_order(orden_id: str, db: Database = Depends(get_db)):
+    """
+    Confirma una orden del marketplace: su reserva de stock pasa a definitiva
+    409 si la reserva ya venció (stock liberado) o ya estaba confirmada.
+    """
+    try:
+        result = await db.rpc("confirmar_reserva", {"p_orden_id": orden_id}).execute()
+        
+        if not result.data:
+            raise HTTPException(status_code=409, detail="La orden no tiene una reserva activa")
+        await response_cache.invalidate("order", orden_id)
+        
+        return {
+            "success": True,
+            "message": "Orden confirmada"
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
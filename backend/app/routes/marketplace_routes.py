@@ -1,18 +1,19 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from datetime import datetime
-import os
-from supabase import create_client, Client
 
-router = APIRouter()
-
-# Supabase client
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
+from app.services.database import Database, get_db
+from app.services.response_cache import response_cache
+from app.services.pagination import (
+    PAGE_SIZE_MAX, InvalidCursor, cursor_values, keyset_page, page_result
 )
 
+# Orden de la búsqueda: relevancia (RPC search_productos) y id para desempatar
+SEARCH_KEY = ("rank", "id")
+
+router = APIRouter()
+
 class ProductMarketplace(BaseModel):
     id: str
     nombre: str
@@ -35,36 +36,51 @@ class OrderMarketplace(BaseModel):
 async def get_marketplace_products(
     negocio_id: str = Query(...),
     categoria: str = Query(None),
-    limit: int = Query(20),
-    offset: int = Query(0)
+    limit: int = Query(20, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = Query(None),
+    total: bool = Query(False),
+    db: Database = Depends(get_db)
 ):
     """
     Obtiene productos del marketplace
     Filtrable por negocio, categoría, etc.
+    Paginación por cursor: enviar `next_cursor` de la respuesta anterior
     """
     try:
-        query = supabase.table("productos").select("*")
+        query = db.table("productos").select(
+            "*", count="estimated" if total else None
+        )
         
         if negocio_id:
             query = query.eq("negocio_id", negocio_id)
         if categoria:
             query = query.eq("categoria", categoria)
         
-        # Paginación
-        data = query.range(offset, offset + limit).execute()
+        # Paginación por (created_at, id)
+        data = await keyset_page(query, "productos", cursor, limit).execute()
         
-        return {
+        productos, next_cursor = page_result(data.data, "productos", limit)
+        
+        result = {
             "success": True,
-            "data": data.data,
-            "total": len(data.data),
+            "data": productos,
+            "count": len(productos),
             "limit": limit,
-            "offset": offset
+            "next_cursor": next_cursor
         }
+        if total:
+            result["total_estimado"] = data.count
+        return result
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/orders")
-async def create_marketplace_order(order: OrderMarketplace):
+async def create_marketplace_order(
+    order: OrderMarketplace,
+    db: Database = Depends(get_db)
+):
     """
     Crea una orden en el marketplace
     """
@@ -79,7 +95,8 @@ async def create_marketplace_order(order: OrderMarketplace):
             "fecha_entrega": order.fecha_entrega
         }
         
-        response = supabase.table("marketplace_orders").insert(order_data).execute()
+        response = await db.table("marketplace_orders").insert(order_data).execute()
+        await response_cache.invalidate("order", order.id)
         
         return {
             "success": True,
@@ -91,44 +108,60 @@ async def create_marketplace_order(order: OrderMarketplace):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/orders/{order_id}")
-async def get_order_status(order_id: str):
+async def get_order_status(order_id: str, db: Database = Depends(get_db)):
     """
     Obtiene estado de una orden
     """
     try:
-        data = supabase.table("marketplace_orders").select("*").eq("id", order_id).execute()
+        async def load():
+            data = await db.table("marketplace_orders").select("*").eq("id", order_id).execute()
+            return data.data[0] if data.data else None
         
-        if data.data:
+        order = await response_cache.get_or_load("order", (order_id,), load)
+        
+        if order:
             return {
                 "success": True,
-                "order": data.data[0]
+                "order": order
             }
         else:
             raise HTTPException(status_code=404, detail="Orden no encontrada")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/search")
-async def search_products(q: str = Query(...), negocio_id: str = Query(None)):
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=100),
+    negocio_id: str = Query(None),
+    limit: int = Query(20, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = Query(None),
+    db: Database = Depends(get_db)
+):
     """
-    Busca productos en el marketplace
+    Busca productos en el marketplace (nombre, código, categoría y
+    descripción; por prefijo y tolerante a errores de tipeo), ordenados
+    por relevancia. Paginación por cursor.
     """
     try:
-        query = supabase.table("productos").select("*")
-        
-        # Búsqueda simple por nombre
-        if q:
-            query = query.ilike("nombre", f"%{q}%")
-        
-        if negocio_id:
-            query = query.eq("negocio_id", negocio_id)
-        
-        data = query.limit(20).execute()
+        # El cursor queda atado a la búsqueda que lo emitió
+        kind = "search:" + q.strip().lower()
+        params = {"p_query": q.strip(), "p_negocio_id": negocio_id, "p_limit": limit + 1}
+        values = cursor_values(kind, cursor, SEARCH_KEY)
+        if values:
+            params["p_after_rank"], params["p_after_id"] = values
+
+        data = await db.rpc("search_productos", params).execute()
+        results, next_cursor = page_result(data.data or [], kind, limit, key=SEARCH_KEY)
         
         return {
             "success": True,
-            "results": data.data,
-            "count": len(data.data)
+            "results": results,
+            "count": len(results),
+            "next_cursor": next_cursor
         }
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
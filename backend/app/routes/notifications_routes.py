@@ -1,67 +1,88 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from fastapi import APIRouter, Body, HTTPException
+from pydantic import BaseModel, Field, field_validator
+from typing import List
 import os
+import re
+
+from app.services.email_queue import EmailQueueFull, email_queue
 
 router = APIRouter()
 
+# Emails por petición en /email/batch
+EMAIL_BATCH_MAX_ITEMS = int(os.getenv("EMAIL_BATCH_MAX_ITEMS", 500))
+
+# local@dominio.tld, sin espacios ni saltos de línea
+_EMAIL_ADDRESS = re.compile(r"[^@\s<>,;\"]+@[^@\s<>,;\"]+\.[^@\s<>,;\".]+")
+
 class EmailNotification(BaseModel):
-    to: str
+    to: str = Field(..., max_length=254)
     subject: str
     message: str
     nombre: str
 
-@router.post("/email")
+    @field_validator("to")
+    @classmethod
+    def valid_address(cls, value):
+        if not _EMAIL_ADDRESS.fullmatch(value):
+            raise ValueError("Dirección de email inválida")
+        return value
+
+    @field_validator("subject")
+    @classmethod
+    def single_line(cls, value):
+        # Un salto de línea en una cabecera permite inyectar otras (Bcc, ...)
+        if "\r" in value or "\n" in value:
+            raise ValueError("No puede contener saltos de línea")
+        return value
+
+@router.post("/email", status_code=202)
 async def send_email_notification(notification: EmailNotification):
-    """Envía notificación por email"""
+    """
+    Encola una notificación por email
+    El envío lo hace la cola de fondo (conexiones SMTP persistentes, con
+    reintentos); la respuesta no espera al servidor de correo.
+    """
     try:
-        # Configuración SMTP (usar variables de entorno)
-        sender_email = os.getenv("EMAIL_FROM", "notificaciones@omnitienda.pe")
-        sender_password = os.getenv("EMAIL_PASSWORD", "")
-        smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SMTP_PORT", 587))
-
-        # Crear mensaje
-        message = MIMEMultipart("alternative")
-        message["Subject"] = notification.subject
-        message["From"] = sender_email
-        message["To"] = notification.to
+        email_id = email_queue.enqueue(
+            notification.to, notification.subject, notification.nombre, notification.message
+        )
 
-        # HTML del email
-        html = f"""
-        <html>
-          <body style="font-family: Arial, sans-serif;">
-            <div style="background-color: #f5f5f5; padding: 20px; border-radius: 8px;">
-              <h2 style="color: #2563EB;">OmniTienda</h2>
-              <p>Hola {notification.nombre},</p>
-              <p>{notification.message}</p>
-              <p style="color: #999; font-size: 12px;">
-                Este es un email automático. Por favor no respondas.
-              </p>
-            </div>
-          </body>
-        </html>
-        """
+        return {
+            "success": True,
+            "id": email_id,
+            "message": "Email encolado"
+        }
 
-        part = MIMEText(html, "html")
-        message.attach(part)
+    except EmailQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Enviar email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.sendmail(
-                sender_email,
-                notification.to,
-                message.as_string()
-            )
+@router.post("/email/batch", status_code=202)
+async def send_email_batch(
+    notifications: List[EmailNotification] = Body(..., embed=True, max_length=EMAIL_BATCH_MAX_ITEMS)
+):
+    """Encola varias notificaciones (p.ej. confirmaciones de órdenes)"""
+    try:
+        ids = email_queue.enqueue_many([
+            (n.to, n.subject, n.nombre, n.message) for n in notifications
+        ])
 
         return {
             "success": True,
-            "message": "Email enviado correctamente"
+            "ids": ids,
+            "message": f"{len(ids)} emails encolados"
         }
 
+    except EmailQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/email/dead-letter")
+async def get_failed_emails():
+    """Últimos emails descartados por esta instancia (el historial está en la base)"""
+    return {
+        "success": True,
+        "data": list(email_queue.dead)
+    }
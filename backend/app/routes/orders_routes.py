@@ -1,20 +1,24 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List
-from datetime import datetime
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from pydantic import BaseModel, Field, ValidationError
+from typing import List, Optional
+from datetime import datetime, timezone
+from uuid import UUID
+import asyncio
 import os
-from supabase import create_client, Client
+
+from app.services.database import Database, get_db
+from app.services.pagination import PAGE_SIZE_MAX, InvalidCursor, keyset_page, page_result
+from app.services.stock import StockShortage, register_sale, register_sync_sales
 
 router = APIRouter()
 
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
-)
+# Sincronización de ventas offline: ventas por petición y por transacción
+ORDERS_SYNC_MAX_ITEMS = int(os.getenv("ORDERS_SYNC_MAX_ITEMS", 500))
+ORDERS_SYNC_CHUNK = int(os.getenv("ORDERS_SYNC_CHUNK", 100))
 
 class OrderItem(BaseModel):
     producto_id: str
-    cantidad: int
+    cantidad: int = Field(..., gt=0)
     precio_unitario: float
 
 class CreateOrder(BaseModel):
@@ -25,48 +29,169 @@ class CreateOrder(BaseModel):
     tipo: str  # 'CONTADO' o 'CREDITO'
     metodo_pago: str
 
+class SyncOrder(CreateOrder):
+    id: UUID  # generado en el dispositivo; identifica la venta en los reintentos
+    created_at: Optional[datetime] = None  # hora de la venta en el dispositivo
+
+def order_row(order: CreateOrder) -> dict:
+    """Fila de `ventas` a partir del modelo de la API"""
+    return {
+        "negocio_id": order.negocio_id,
+        "cliente_id": order.cliente_id,
+        "items": [item.dict() for item in order.items],
+        "subtotal": order.total,
+        "total": order.total,
+        "tipo": order.tipo,
+        "metodo_pago": order.metodo_pago,
+        "estado": "PENDIENTE",
+        "created_at": datetime.now().isoformat()
+    }
+
 @router.post("/create")
-async def create_order(order: CreateOrder):
+async def create_order(order: CreateOrder, db: Database = Depends(get_db)):
     """
     Crea una nueva orden de venta
+    Descuenta el stock de todos los items en la misma transacción; si alguno
+    no alcanza responde 409 con los faltantes y no se crea nada.
     """
     try:
-        order_data = {
-            "negocio_id": order.negocio_id,
-            "cliente_id": order.cliente_id,
-            "items": [item.dict() for item in order.items],
-            "total": order.total,
-            "tipo": order.tipo,
-            "metodo_pago": order.metodo_pago,
-            "estado": "PENDIENTE",
-            "created_at": datetime.now().isoformat()
-        }
+        order_data = order_row(order)
         
-        response = supabase.table("ventas").insert(order_data).execute()
+        venta = await register_sale(db, order_data)
         
         return {
             "success": True,
-            "order_id": response.data[0]["id"],
+            "order_id": venta["id"],
             "message": "Orden creada",
-            "data": response.data
+            "data": [venta]
         }
+    except StockShortage as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": str(e), "faltantes": e.faltantes}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/list/{negocio_id}")
-async def list_orders(negocio_id: str, limit: int = 20, offset: int = 0):
+def rollup_key(fila, ahora):
     """
-    Lista órdenes del negocio
+    Fila de ventas_resumen que actualiza la venta: (negocio, hora UTC,
+    método de pago, tipo). Sin created_at la base usa NOW(): se toma `ahora`.
+    """
+    hora = datetime.fromisoformat(fila["created_at"]) if "created_at" in fila else ahora
+    if hora.tzinfo is None:
+        hora = hora.replace(tzinfo=timezone.utc)
+    hora = hora.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return (fila["negocio_id"], hora, fila["metodo_pago"], fila["tipo"])
+
+@router.post("/sync")
+async def sync_orders(
+    ventas: List[dict] = Body(..., embed=True, max_length=ORDERS_SYNC_MAX_ITEMS),
+    db: Database = Depends(get_db)
+):
+    """
+    Sincroniza ventas hechas sin conexión (POS), en lote
+    Cada venta trae su `id` generado en el dispositivo: los reintentos no
+    duplican ni descuentan dos veces. Resultado por venta: "creada",
+    "duplicada" o "error". Las ventas ya ocurrieron, así que se registran
+    aunque el stock no alcance (queda negativo); esas traen "faltantes".
     """
     try:
-        data = supabase.table("ventas").select("*").eq(
-            "negocio_id", negocio_id
-        ).range(offset, offset + limit).order("created_at", desc=True).execute()
+        resultados = [None] * len(ventas)
+        filas = {}  # id -> (posición, fila), sin repetidos dentro del lote
+        for i, venta in enumerate(ventas):
+            try:
+                order = SyncOrder(**venta)
+            except ValidationError as e:
+                resultados[i] = {
+                    "id": venta.get("id"),
+                    "estado": "error",
+                    "errores": [
+                        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                        for error in e.errors()
+                    ]
+                }
+                continue
+            venta_id = str(order.id)
+            if venta_id in filas:
+                resultados[i] = {"id": venta_id, "estado": "duplicada"}
+                continue
+            fila = order_row(order)
+            fila["id"] = venta_id
+            if order.created_at:
+                fila["created_at"] = order.created_at.isoformat()
+            filas[venta_id] = (i, fila)
+        
+        # Lotes ordenados por la fila de resumen que tocan: las transacciones
+        # concurrentes la bloquean en el mismo orden y no se cruzan
+        ahora = datetime.now(timezone.utc)
+        pendientes = sorted(filas.values(), key=lambda item: rollup_key(item[1], ahora))
+        chunks = [
+            pendientes[start:start + ORDERS_SYNC_CHUNK]
+            for start in range(0, len(pendientes), ORDERS_SYNC_CHUNK)
+        ]
+        insertadas = await asyncio.gather(
+            *(register_sync_sales(db, [fila for _, fila in chunk]) for chunk in chunks),
+            return_exceptions=True
+        )
+        
+        for chunk, insertado in zip(chunks, insertadas):
+            for i, fila in chunk:
+                if isinstance(insertado, Exception):
+                    resultados[i] = {"id": fila["id"], "estado": "error", "errores": [str(insertado)]}
+                    continue
+                ids, faltantes = insertado
+                estado = "creada" if fila["id"] in ids else "duplicada"
+                resultados[i] = {"id": fila["id"], "estado": estado}
+                if fila["id"] in faltantes:
+                    resultados[i]["faltantes"] = faltantes[fila["id"]]
+        
+        conteo = {"creada": 0, "duplicada": 0, "error": 0}
+        for resultado in resultados:
+            conteo[resultado["estado"]] += 1
         
         return {
+            "success": conteo["error"] == 0,
+            "resultados": resultados,
+            "creadas": conteo["creada"],
+            "duplicadas": conteo["duplicada"],
+            "errores": conteo["error"],
+            "con_faltantes": sum(1 for r in resultados if "faltantes" in r)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/list/{negocio_id}")
+async def list_orders(
+    negocio_id: str,
+    limit: int = Query(20, ge=1, le=PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    total: bool = False,
+    db: Database = Depends(get_db)
+):
+    """
+    Lista órdenes del negocio (más recientes primero)
+    Paginación por cursor: enviar `next_cursor` de la respuesta anterior
+    `total=true` agrega un total estimado (barato, no exacto)
+    """
+    try:
+        query = db.table("ventas").select(
+            "*", count="estimated" if total else None
+        ).eq("negocio_id", negocio_id)
+        data = await keyset_page(query, "ventas", cursor, limit).execute()
+        
+        orders, next_cursor = page_result(data.data, "ventas", limit)
+        
+        result = {
             "success": True,
-            "orders": data.data,
-            "total": len(data.data)
+            "orders": orders,
+            "count": len(orders),
+            "next_cursor": next_cursor
         }
+        if total:
+            result["total_estimado"] = data.count
+        return result
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,24 +1,16 @@
-from fastapi import APIRouter, HTTPException, File, UploadFile
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
-import os
-from supabase import create_client, Client
-import boto3
+import json
 
-router = APIRouter()
-
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_KEY")
-)
+from app.services.database import Database, get_db
+from app.services.product_images import image_pipeline
+from app.services.product_import import IMPORT_FORMATS, ProductImport, import_format
+from app.services.response_cache import response_cache
+from app.services.uploads import UploadRejected, image_upload
 
-# S3 client (opcional)
-s3_client = boto3.client(
-    's3',
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    region_name=os.getenv("AWS_REGION")
-)
+router = APIRouter()
 
 class ProductCreate(BaseModel):
     nombre: str
@@ -28,44 +20,72 @@ class ProductCreate(BaseModel):
     stock: int
     negocio_id: str
     categoria: str
+    codigo: Optional[str] = None
     atributos: Optional[dict] = None
 
+def product_row(product: ProductCreate) -> dict:
+    """Fila de `productos` a partir del modelo de la API"""
+    row = product.dict()
+    row["stock_actual"] = row.pop("stock")
+    row["atributos"] = row["atributos"] or {}
+    return row
+
+class ImportProgressResponse(StreamingResponse):
+    """
+    NDJSON de progreso mientras todavía se lee el cuerpo de la petición.
+    StreamingResponse escucha `receive` para detectar desconexiones, lo que
+    competiría con la lectura del archivo; aquí solo se envía.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
 @router.post("/upload")
-async def upload_product_image(file: UploadFile = File(...), product_id: str = None):
+async def upload_product_image(
+    file: UploadFile = File(...),
+    product_id: str = None
+):
     """
-    Carga imagen de producto a Supabase Storage
+    Carga imagen de producto
+    El original se guarda una vez por contenido (subir la misma foto no
+    escribe de nuevo); las variantes thumb/card/zoom se generan en segundo
+    plano: la URL va a `productos.fotos` y las variantes a
+    `productos.fotos_variantes`.
     """
     try:
-        contents = await file.read()
+        async with image_upload(file) as upload:
+            data = upload.data.tobytes()
+            header = upload.header
+            media_type, extension = upload.media_type, upload.extension
         
-        # Guardar en Supabase Storage
-        file_path = f"productos/{product_id}/{file.filename}"
-        
-        response = supabase.storage.from_bucket("omnitienda").upload(
-            file_path,
-            contents
+        digest, file_path, public_url, duplicada = await image_pipeline.store_original(
+            data, media_type, extension
         )
-        
-        # Obtener URL pública
-        public_url = supabase.storage.from_bucket("omnitienda").get_public_url(file_path)
+        image_pipeline.submit(digest, public_url, data, header, product_id)
         
         return {
             "success": True,
-            "url": public_url.get("publicUrl"),
-            "file_path": file_path
+            "url": public_url,
+            "file_path": file_path,
+            "hash": digest,
+            "duplicada": duplicada,
+            "variantes": "pendiente"
         }
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/create")
-async def create_product(product: ProductCreate):
+async def create_product(product: ProductCreate, db: Database = Depends(get_db)):
     """
     Crea nuevo producto
     """
     try:
-        product_data = product.dict()
+        product_data = product_row(product)
         
-        response = supabase.table("productos").insert(product_data).execute()
+        response = await db.table("productos").insert(product_data).execute()
+        await response_cache.invalidate("product", response.data[0]["id"])
         
         return {
             "success": True,
@@ -76,33 +96,70 @@ async def create_product(product: ProductCreate):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/import/{negocio_id}")
+async def import_products(
+    negocio_id: str,
+    request: Request,
+    formato: Optional[str] = Query(None, pattern="^(csv|jsonl)$"),
+    db: Database = Depends(get_db)
+):
+    """
+    Importa productos en bloque desde el cuerpo de la petición (CSV con
+    cabecera o JSONL, uno por línea), insertando o actualizando por código.
+    Responde NDJSON: eventos "progreso" y "error" por fila, y un "resumen".
+    """
+    formato = import_format(request.headers.get("content-type"), formato)
+    if formato not in IMPORT_FORMATS:
+        raise HTTPException(
+            status_code=415, detail="Formato no soportado: use text/csv o application/x-ndjson"
+        )
+    
+    job = ProductImport(db, negocio_id, ProductCreate, product_row)
+    
+    async def events():
+        async for event in job.run(request.stream(), formato):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+    
+    return ImportProgressResponse(events(), media_type="application/x-ndjson")
+
 @router.get("/{product_id}")
-async def get_product(product_id: str):
+async def get_product(product_id: str, db: Database = Depends(get_db)):
     """
     Obtiene detalles del producto
     """
     try:
-        data = supabase.table("productos").select("*").eq("id", product_id).execute()
+        async def load():
+            data = await db.table("productos").select("*").eq("id", product_id).execute()
+            return data.data[0] if data.data else None
+        
+        product = await response_cache.get_or_load("product", (product_id,), load)
         
-        if data.data:
+        if product:
             return {
                 "success": True,
-                "product": data.data[0]
+                "product": product
             }
         else:
             raise HTTPException(status_code=404, detail="Producto no encontrado")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/{product_id}")
-async def update_product(product_id: str, product: ProductCreate):
+async def update_product(
+    product_id: str,
+    product: ProductCreate,
+    db: Database = Depends(get_db)
+):
     """
     Actualiza producto existente
     """
     try:
-        response = supabase.table("productos").update(
-            product.dict()
+        response = await db.table("productos").update(
+            product_row(product)
         ).eq("id", product_id).execute()
+        await response_cache.invalidate("product", product_id)
         
         return {
             "success": True,
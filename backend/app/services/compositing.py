@@ -0,0 +1,155 @@
+"""
+Motor de composición por región (ROI) para los overlays del probador AR.
+
+Cada capa se recorta al frame y se mezcla solo sobre su porción del
+frame, in-place, usando buffers de trabajo preasignados por hilo. No se
+copia ni se recorre el frame completo; varias capas se apilan en orden en
+una sola llamada.
+"""
+import threading
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# rect: (x1, y1, x2, y2) inclusivo, como cv2.rectangle
+# color: BGR para capas sólidas/máscara; texture: BGRA para capas de textura
+# mask: uint8 (0-255) del tamaño del rect para capas con forma, o una función
+#       draw(dst, origin) que dibuja la forma en el buffer de la ROI recortada
+Layer = namedtuple("Layer", ["rect", "alpha", "color", "texture", "mask"])
+
+
+def solid_layer(rect, color, alpha=1.0):
+    """Rectángulo de color sólido"""
+    return Layer(rect, alpha, color, None, None)
+
+
+def texture_layer(rect, texture, alpha=1.0):
+    """Textura BGRA escalada al rectángulo (usa su canal alfa)"""
+    return Layer(rect, alpha, None, texture, None)
+
+
+def mask_layer(rect, mask, color, alpha=1.0):
+    """Color aplicado según una máscara del tamaño del rectángulo"""
+    return Layer(rect, alpha, color, None, mask)
+
+
+def circle_layer(center, radius, color, thickness=-1, alpha=1.0):
+    """Círculo (relleno o contorno) como capa de máscara"""
+    x, y = center
+    pad = radius + max(thickness, 0)
+    rect = (x - pad, y - pad, x + pad, y + pad)
+
+    def draw(dst, origin):
+        cv2.circle(dst, (x - origin[0], y - origin[1]), radius, 255, thickness)
+
+    return mask_layer(rect, draw, color, alpha)
+
+
+def clip_rect(rect, frame_height, frame_width):
+    """Recorta un rectángulo inclusivo al frame; retorna slices (o None)"""
+    x1, y1, x2, y2 = rect
+    x1, x2 = sorted((x1, x2))
+    y1, y2 = sorted((y1, y2))
+    x1, y1 = max(x1, 0), max(y1, 0)
+    x2, y2 = min(x2 + 1, frame_width), min(y2 + 1, frame_height)
+    if x1 >= x2 or y1 >= y2:
+        return None
+    return slice(y1, y2), slice(x1, x2)
+
+
+class _Scratch(threading.local):
+    """Buffers de trabajo por hilo; crecen según la ROI más grande vista"""
+
+    def __init__(self):
+        self.buffers = {}
+
+    def get(self, name, shape, dtype):
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or buffer.ndim != len(shape):
+            buffer = np.empty(shape, dtype=dtype)
+        elif any(need > have for need, have in zip(shape, buffer.shape)):
+            buffer = np.empty(
+                tuple(max(need, have) for need, have in zip(shape, buffer.shape)),
+                dtype=dtype,
+            )
+        self.buffers[name] = buffer
+        return buffer[tuple(slice(0, n) for n in shape)]
+
+
+_scratch = _Scratch()
+
+
+def blend_color(roi, color, alpha):
+    """Mezcla un color sólido sobre la región, in-place"""
+    if alpha >= 1.0:
+        roi[:] = color
+        return
+    fill = _scratch.get("fill", roi.shape, roi.dtype)
+    fill[:] = color
+    cv2.addWeighted(fill, alpha, roi, 1 - alpha, 0, dst=roi)
+
+
+def _blend_weighted(roi, source, weights):
+    """roi = roi * (1 - w) + source * w, con w por píxel (float32)"""
+    inverse = _scratch.get("inverse", weights.shape, np.float32)
+    np.subtract(1.0, weights, out=inverse)
+    cv2.blendLinear(roi, source, inverse, weights, dst=roi)
+
+
+def _blend_mask(roi, mask, color, alpha):
+    fill = _scratch.get("fill", roi.shape, roi.dtype)
+    fill[:] = color
+    weights = _scratch.get("weights", mask.shape, np.float32)
+    np.multiply(mask, alpha / 255.0, out=weights, casting="unsafe")
+    _blend_weighted(roi, fill, weights)
+
+
+def _blend_texture(roi, texture, alpha, offset, full_size):
+    # Escalar la textura al rectángulo completo y tomar la parte visible
+    full_w, full_h = full_size
+    if texture.shape[:2] != (full_h, full_w):
+        scaled = _scratch.get("texture", (full_h, full_w, 4), np.uint8)
+        scaled = cv2.resize(
+            texture, (full_w, full_h), dst=scaled, interpolation=cv2.INTER_LINEAR
+        )
+    else:
+        scaled = texture
+    oy, ox = offset
+    h, w = roi.shape[:2]
+    visible = scaled[oy:oy + h, ox:ox + w]
+
+    bgr = _scratch.get("texture_bgr", (h, w, 3), np.uint8)
+    bgr[:] = visible[..., :3]
+    weights = _scratch.get("weights", (h, w), np.float32)
+    np.multiply(visible[..., 3], alpha / 255.0, out=weights, casting="unsafe")
+    _blend_weighted(roi, bgr, weights)
+
+
+def composite(frame, layers):
+    """Aplica las capas en orden sobre el frame (in-place) y lo retorna"""
+    h, w = frame.shape[:2]
+    for layer in layers:
+        region = clip_rect(layer.rect, h, w)
+        if region is None:
+            continue
+        roi = frame[region]
+
+        if layer.texture is not None:
+            x1, y1, x2, y2 = layer.rect
+            offset = (region[0].start - min(y1, y2), region[1].start - min(x1, x2))
+            full_size = (abs(x2 - x1) + 1, abs(y2 - y1) + 1)
+            _blend_texture(roi, layer.texture, layer.alpha, offset, full_size)
+        elif callable(layer.mask):
+            mask = _scratch.get("mask", roi.shape[:2], np.uint8)
+            mask[:] = 0
+            layer.mask(mask, (region[1].start, region[0].start))
+            _blend_mask(roi, mask, layer.color, layer.alpha)
+        elif layer.mask is not None:
+            x1, y1 = min(layer.rect[0], layer.rect[2]), min(layer.rect[1], layer.rect[3])
+            oy, ox = region[0].start - y1, region[1].start - x1
+            mask = layer.mask[oy:oy + roi.shape[0], ox:ox + roi.shape[1]]
+            _blend_mask(roi, mask, layer.color, layer.alpha)
+        else:
+            blend_color(roi, layer.color, layer.alpha)
+    return frame
@@ -0,0 +1,139 @@
+"""
+Acceso a datos compartido (Supabase: PostgREST + Storage).
+
+Un solo cliente async por worker, creado en el lifespan de la app, con un
+pool de conexiones keep-alive acotado. Los routers lo reciben con
+`Depends(get_db)` y hacen `await ....execute()`, así un worker puede tener
+decenas de consultas en vuelo sin bloquear el event loop.
+"""
+import logging
+import os
+
+import httpx
+from postgrest import AsyncPostgrestClient
+from storage3 import AsyncStorageClient
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_MAX_CONNECTIONS = int(os.getenv("DB_POOL_MAX_CONNECTIONS", 50))
+DB_POOL_MAX_KEEPALIVE = int(os.getenv("DB_POOL_MAX_KEEPALIVE", 20))
+DB_POOL_KEEPALIVE_EXPIRY = float(os.getenv("DB_POOL_KEEPALIVE_EXPIRY", 30))
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", 10))
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", 5))
+# Tiempo máximo esperando una conexión libre del pool
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+
+
+def _pool_limits():
+    return httpx.Limits(
+        max_connections=DB_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=DB_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=DB_POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout():
+    return httpx.Timeout(DB_TIMEOUT, connect=DB_CONNECT_TIMEOUT, pool=DB_POOL_TIMEOUT)
+
+
+class _CountingTransport(httpx.AsyncHTTPTransport):
+    """Transporte con pool acotado que lleva la cuenta de peticiones en vuelo"""
+
+    def __init__(self, db):
+        super().__init__(limits=_pool_limits())
+        self._db = db
+
+    async def handle_async_request(self, request):
+        self._db.requests += 1
+        self._db.in_flight += 1
+        self._db.peak_in_flight = max(self._db.peak_in_flight, self._db.in_flight)
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            self._db.in_flight -= 1
+
+
+class _PooledPostgrestClient(AsyncPostgrestClient):
+    def __init__(self, base_url, headers, transport):
+        self._transport = transport
+        super().__init__(base_url, headers=headers, timeout=_timeout())
+
+    def create_session(self, base_url, headers, timeout):
+        return httpx.AsyncClient(
+            base_url=base_url, headers=headers, timeout=timeout, transport=self._transport
+        )
+
+
+class _PooledStorageClient(AsyncStorageClient):
+    def __init__(self, url, headers, transport):
+        self._transport = transport
+        super().__init__(url, headers)
+
+    def _create_session(self, base_url, headers, timeout, verify=True):
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=_timeout(),
+            follow_redirects=True,
+            transport=self._transport,
+        )
+
+
+class Database:
+    """Cliente de datos de la app: misma API de consulta que supabase-py"""
+
+    def __init__(self, url, key):
+        headers = {"apikey": key, "Authorization": f"Bearer {key}"}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        # REST y Storage comparten el mismo pool de conexiones
+        transport = _CountingTransport(self)
+        self.rest = _PooledPostgrestClient(f"{url}/rest/v1", headers, transport)
+        self.storage = _PooledStorageClient(f"{url}/storage/v1", headers, transport)
+
+    def table(self, name):
+        return self.rest.from_(name)
+
+    def rpc(self, func, params=None):
+        return self.rest.rpc(func, params or {})
+
+    async def close(self):
+        await self.rest.aclose()
+        await self.storage.aclose()
+
+    def stats(self):
+        return {
+            "max_connections": DB_POOL_MAX_CONNECTIONS,
+            "max_keepalive": DB_POOL_MAX_KEEPALIVE,
+            "timeout": DB_TIMEOUT,
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+        }
+
+
+_db = None
+
+
+def init_db():
+    """Crea el cliente compartido (lifespan de la app)"""
+    global _db
+    if _db is None:
+        _db = Database(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+        logger.info(
+            f"Cliente de datos listo (pool de {DB_POOL_MAX_CONNECTIONS} conexiones)"
+        )
+    return _db
+
+
+def get_db():
+    """Dependencia FastAPI: cliente de datos compartido por todos los routers"""
+    return init_db()
+
+
+async def close_db():
+    global _db
+    if _db is not None:
+        await _db.close()
+        _db = None
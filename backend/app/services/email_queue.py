@@ -0,0 +1,384 @@
+"""
+Cola de notificaciones por email con conexiones SMTP persistentes.
+
+La API solo encola (responde 202); EMAIL_SENDERS tareas de fondo toman
+lotes de hasta EMAIL_BATCH_SIZE mensajes y los envían por su propia
+conexión SMTP ya autenticada (STARTTLS + login una sola vez, no por email).
+smtplib es bloqueante, así que cada lote corre en un hilo del pool de la
+cola. Los errores temporales (4xx, conexión caída) se reintentan con
+backoff exponencial; los permanentes (5xx) o los que agotan
+EMAIL_MAX_ATTEMPTS van a la tabla de fallidos (dead letter). La plantilla
+HTML se compila una vez al cargar el módulo.
+"""
+import asyncio
+import logging
+import os
+import random
+import smtplib
+import string
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email import policy
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.utils import make_msgid
+from functools import lru_cache
+from html import escape
+
+from app.services.database import get_db
+
+logger = logging.getLogger(__name__)
+
+EMAIL_FROM = os.getenv("EMAIL_FROM", "notificaciones@omnitienda.pe")
+EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD", "")
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "True") == "True"
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
+# Los servidores cierran conexiones inactivas; pasado esto se reabre
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", 60))
+EMAIL_SENDERS = int(os.getenv("EMAIL_SENDERS", 2))
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 20))
+EMAIL_QUEUE_MAX = int(os.getenv("EMAIL_QUEUE_MAX", 10000))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 5))
+EMAIL_RETRY_BASE = float(os.getenv("EMAIL_RETRY_BASE", 2))
+EMAIL_RETRY_MAX = float(os.getenv("EMAIL_RETRY_MAX", 300))
+
+_LAYOUT = string.Template("""
+<html>
+  <body style="font-family: Arial, sans-serif;">
+    <div style="background-color: #f5f5f5; padding: 20px; border-radius: 8px;">
+      <h2 style="color: #2563EB;">OmniTienda</h2>
+      <p>Hola $nombre,</p>
+      <p>$mensaje</p>
+      <p style="color: #999; font-size: 12px;">
+        Este es un email automático. Por favor no respondas.
+      </p>
+    </div>
+  </body>
+</html>
+""")
+
+
+@lru_cache(maxsize=1024)
+def render_html(nombre, mensaje):
+    """Cuerpo HTML; un lote de avisos iguales se renderiza una sola vez"""
+    return _LAYOUT.substitute(nombre=escape(nombre), mensaje=escape(mensaje))
+
+
+class EmailQueueFull(Exception):
+    """La cola llegó a EMAIL_QUEUE_MAX mensajes pendientes"""
+
+
+class EmailJob:
+    __slots__ = ("id", "to", "subject", "nombre", "mensaje", "attempts", "error")
+
+    def __init__(self, to, subject, nombre, mensaje):
+        self.id = str(uuid.uuid4())
+        self.to = to
+        self.subject = subject
+        self.nombre = nombre
+        self.mensaje = mensaje
+        self.attempts = 0
+        self.error = None
+
+    def message(self, sender):
+        message = MIMEMultipart("alternative")
+        message["Subject"] = self.subject
+        message["From"] = sender
+        message["To"] = self.to
+        message["Message-ID"] = make_msgid(domain=sender.rpartition("@")[2] or None)
+        message.attach(MIMEText(render_html(self.nombre, self.mensaje), "html"))
+        # CRLF: smtplib no corrige los finales de línea de un mensaje en bytes
+        return message.as_bytes(policy=policy.SMTP)
+
+    def record(self):
+        return {
+            "id": self.id, "destinatario": self.to, "asunto": self.subject,
+            "nombre": self.nombre, "mensaje": self.mensaje,
+            "intentos": self.attempts, "error": self.error,
+        }
+
+
+class SmtpConnection:
+    """Conexión SMTP autenticada y reutilizable; la usa un solo hilo a la vez"""
+
+    def __init__(self, host=SMTP_SERVER, port=SMTP_PORT, user=EMAIL_FROM,
+                 password=EMAIL_PASSWORD, starttls=SMTP_STARTTLS,
+                 timeout=SMTP_TIMEOUT, idle_timeout=SMTP_IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self._smtp = None
+        self._last_used = 0.0
+        self.opened = 0
+
+    def _open(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.password:
+                smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._smtp = smtp
+        self.opened += 1
+
+    def send(self, sender, to, data):
+        if self._smtp is not None and time.monotonic() - self._last_used > self.idle_timeout:
+            self.close()
+        if self._smtp is None:
+            self._open()
+        try:
+            self._smtp.sendmail(sender, [to], data)
+        except smtplib.SMTPServerDisconnected:
+            # El servidor cerró la conexión: se reabre una vez
+            self.close()
+            self._open()
+            self._smtp.sendmail(sender, [to], data)
+        finally:
+            # Un rechazo (4xx/5xx) no cierra la conexión
+            self._last_used = time.monotonic()
+
+    def close(self, graceful=True):
+        """graceful=False descarta el socket sin QUIT (conexión caída o colgada)"""
+        if self._smtp is None:
+            return
+        try:
+            if graceful:
+                self._smtp.quit()
+        except Exception:
+            pass
+        finally:
+            self._smtp.close()
+            self._smtp = None
+
+
+# Fallas de la conexión o del servidor, no del email: afectan a todo el lote
+_CONNECTION_ERRORS = (
+    smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+    smtplib.SMTPHeloError, smtplib.SMTPAuthenticationError,
+)
+
+
+def is_connection_error(error):
+    """Socket caído, timeout, conexión o login rechazados"""
+    if isinstance(error, _CONNECTION_ERRORS):
+        return True
+    # SMTPException hereda de OSError; las demás son rechazos de un email
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def is_permanent(error):
+    """5xx: reintentar no sirve (destinatario o mensaje rechazado)"""
+    if is_connection_error(error):
+        return False
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+class EmailQueue:
+    """Cola en memoria con remitentes de fondo, reintentos y dead letter"""
+
+    def __init__(self, connect=SmtpConnection, dead_letter=None, sender=EMAIL_FROM,
+                 senders=EMAIL_SENDERS, batch_size=EMAIL_BATCH_SIZE,
+                 max_size=EMAIL_QUEUE_MAX, max_attempts=EMAIL_MAX_ATTEMPTS,
+                 retry_base=EMAIL_RETRY_BASE, retry_max=EMAIL_RETRY_MAX):
+        self._connect = connect
+        self._dead_letter = dead_letter  # async (lista de registros) -> None
+        self.sender = sender
+        self.senders = senders
+        self.batch_size = batch_size
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._queue = None
+        self._tasks = []
+        self._connections = []
+        self._executor = None
+        self._delayed = {}  # id -> (job, TimerHandle) esperando reintento
+        self.dead = deque(maxlen=100)  # últimos fallidos (para /dead-letter)
+        self.enqueued = 0
+        self.sent = 0
+        self.retries = 0
+        self.dead_lettered = 0
+        self.batches = 0
+        self._send_ms = 0.0
+
+    def enqueue(self, to, subject, nombre, message):
+        """Encola un email y retorna su id; no espera el envío"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._queue.qsize() >= self.max_size:
+            raise EmailQueueFull(f"Hay {self.max_size} emails pendientes, reintenta luego")
+        job = EmailJob(to, subject, nombre, message)
+        self._queue.put_nowait(job)
+        self.enqueued += 1
+        return job.id
+
+    def enqueue_many(self, emails):
+        """Encola todos o ninguno; `emails` son tuplas (to, subject, nombre, message)"""
+        queued = self._queue.qsize() if self._queue is not None else 0
+        if queued + len(emails) > self.max_size:
+            raise EmailQueueFull(f"Hay {queued} emails pendientes, reintenta luego")
+        return [self.enqueue(*email) for email in emails]
+
+    def start(self):
+        if self._tasks:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.senders, thread_name_prefix="smtp"
+        )
+        self._connections = [self._connect() for _ in range(self.senders)]
+        self._tasks = [
+            asyncio.create_task(self._run(connection)) for connection in self._connections
+        ]
+
+    def _send_batch(self, connection, batch):
+        """
+        En un hilo: envía el lote por la conexión; [(job, error o None)].
+        Si falla la conexión (no un email), el resto del lote no se intenta:
+        cada email esperaría el timeout. Todo queda como falla temporal.
+        """
+        results = []
+        for i, job in enumerate(batch):
+            try:
+                connection.send(self.sender, job.to, job.message(self.sender))
+                results.append((job, None))
+            except Exception as e:
+                if is_connection_error(e):
+                    connection.close(graceful=False)
+                    results.extend((pending, e) for pending in batch[i:])
+                    break
+                results.append((job, e))
+        return results
+
+    async def _run(self, connection):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            started = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self._send_batch, connection, batch
+                )
+            except Exception as e:
+                results = [(job, e) for job in batch]
+            self._send_ms += (time.perf_counter() - started) * 1000
+            self.batches += 1
+            failed = []
+            for job, error in results:
+                if error is None:
+                    self.sent += 1
+                else:
+                    failed.append(self._failed(job, error))
+            await self._store_dead([job for job in failed if job is not None])
+            for _ in batch:
+                self._queue.task_done()
+
+    def _failed(self, job, error):
+        """Programa el reintento; retorna el job si va a dead letter"""
+        job.attempts += 1
+        job.error = f"{type(error).__name__}: {error}"
+        if is_permanent(error) or job.attempts >= self.max_attempts:
+            return job
+        delay = min(self.retry_base * 2 ** (job.attempts - 1), self.retry_max)
+        delay *= random.uniform(0.8, 1.2)
+        handle = asyncio.get_running_loop().call_later(delay, self._requeue, job.id)
+        self._delayed[job.id] = (job, handle)
+        self.retries += 1
+        return None
+
+    def _requeue(self, job_id):
+        job, _ = self._delayed.pop(job_id)
+        self._queue.put_nowait(job)
+
+    async def _store_dead(self, jobs):
+        if not jobs:
+            return
+        records = [job.record() for job in jobs]
+        self.dead.extend(records)
+        self.dead_lettered += len(records)
+        for record in records:
+            logger.error(f"Email {record['id']} a {record['destinatario']} descartado: {record['error']}")
+        if self._dead_letter is not None:
+            try:
+                await self._dead_letter(records)
+            except Exception as e:
+                logger.error(f"No se pudieron guardar {len(records)} emails fallidos: {e}")
+
+    async def _drain(self):
+        """Espera la cola y los reintentos programados"""
+        while True:
+            await self._queue.join()
+            if not self._delayed:
+                return
+            await asyncio.sleep(0.1)
+
+    async def stop(self, timeout=10):
+        """Envía lo pendiente (hasta `timeout` s), cierra las conexiones"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Apagado con {self._queue.qsize() + len(self._delayed)} emails sin enviar"
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Los que esperaban reintento (o no alcanzaron a salir) no se pierden
+        pending = []
+        for job, handle in self._delayed.values():
+            handle.cancel()
+            pending.append(job)
+        self._delayed.clear()
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for job in pending:
+            job.error = job.error or "Pendiente al apagar"
+        await self._store_dead(pending)
+        loop = asyncio.get_running_loop()
+        for connection in self._connections:
+            await loop.run_in_executor(self._executor, connection.close)
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        return {
+            "senders": self.senders,
+            "batch_size": self.batch_size,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "retrying": len(self._delayed),
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "retries": self.retries,
+            "dead_lettered": self.dead_lettered,
+            "connections_opened": sum(c.opened for c in self._connections),
+            "avg_batch_ms": round(self._send_ms / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+async def store_dead_letters(records):
+    """Guarda los emails descartados en notificaciones_fallidas"""
+    await get_db().table("notificaciones_fallidas").insert(records).execute()
+
+
+email_queue = EmailQueue(dead_letter=store_dead_letters)
@@ -0,0 +1,192 @@
+"""
+Caché de assets de prendas (clothing_products) para el probador AR.
+
+Guarda la metadata de render del producto (imagen_3d_url, colores) y la
+textura descargada, decodificada y pre-escalada en BGRA (orden OpenCV).
+Las texturas se desalojan por LRU acotado en bytes; al abrir el enlace de
+marketplace de un negocio se pueden precalentar todos sus productos.
+"""
+import asyncio
+import logging
+import os
+from collections import namedtuple
+
+import cv2
+import httpx
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.cache import TTLCache
+from app.services.uploads import UPLOAD_MAX_BYTES, UPLOAD_MAX_PIXELS, UploadRejected, check_image_bytes
+
+logger = logging.getLogger(__name__)
+
+AR_GARMENT_CACHE_MB = int(os.getenv("AR_GARMENT_CACHE_MB", 128))
+AR_GARMENT_META_TTL = int(os.getenv("AR_GARMENT_META_TTL", 300))
+AR_GARMENT_MAX_SIDE = int(os.getenv("AR_GARMENT_MAX_SIDE", 512))
+AR_GARMENT_PREFETCH_CONCURRENCY = int(os.getenv("AR_GARMENT_PREFETCH_CONCURRENCY", 4))
+
+GarmentAsset = namedtuple("GarmentAsset", ["product_id", "metadata", "texture"])
+
+# Texturas que no se pudieron descargar/decodificar (caché negativa corta)
+_MISSING = np.empty((0, 0, 4), dtype=np.uint8)
+_MISSING_TTL = 60
+
+
+def decode_texture(data, max_side=AR_GARMENT_MAX_SIDE):
+    """
+    Decodifica una imagen a BGRA y la reduce a `max_side`. La URL es
+    externa: mismos límites de bytes y píxeles que las subidas.
+    """
+    try:
+        check_image_bytes(data, UPLOAD_MAX_BYTES, UPLOAD_MAX_PIXELS)
+    except UploadRejected as e:
+        logger.warning(f"Textura descartada: {e}")
+        return None
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        return None
+
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGRA)
+    elif image.shape[2] == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+
+    h, w = image.shape[:2]
+    if max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        image = cv2.resize(
+            image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA
+        )
+    return np.ascontiguousarray(image)
+
+
+class GarmentCache:
+    """Metadata por producto + texturas por URL, con descargas deduplicadas"""
+
+    def __init__(self, max_bytes=AR_GARMENT_CACHE_MB * 1024 * 1024,
+                 metadata_ttl=AR_GARMENT_META_TTL):
+        self.metadata = TTLCache(max_entries=4096, ttl=metadata_ttl)
+        self.textures = TTLCache(
+            max_entries=4096, ttl=3600, max_bytes=max_bytes,
+            sizeof=lambda texture: texture.nbytes,
+        )
+        self._downloads = {}  # url -> asyncio.Task en curso
+        # product_id -> URL de su textura; sobrevive al TTL de la metadata
+        # para poder invalidar la textura después
+        self._texture_urls = {}
+        self._http = None
+
+    def _client(self):
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=10, follow_redirects=True)
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def put_metadata(self, product_id, row):
+        previous = self._texture_urls.get(product_id)
+        if previous and previous != row.get("imagen_3d_url"):
+            self.textures.invalidate(previous)
+        if row.get("imagen_3d_url"):
+            self._texture_urls[product_id] = row["imagen_3d_url"]
+        else:
+            self._texture_urls.pop(product_id, None)
+        self.metadata.set(product_id, {
+            "imagen_3d_url": row.get("imagen_3d_url"),
+            "colores": row.get("colores"),
+        })
+
+    async def get_asset(self, product_id, fetch_metadata):
+        """
+        Retorna el GarmentAsset del producto (o None si no existe).
+        `fetch_metadata(product_id)` se llama solo si la metadata no está en caché.
+        """
+        metadata = self.metadata.get(product_id)
+        if metadata is None:
+            row = await fetch_metadata(product_id)
+            if not row:
+                return None
+            self.put_metadata(product_id, row)
+            metadata = self.metadata.get(product_id)
+
+        texture = await self.texture(metadata["imagen_3d_url"])
+        return GarmentAsset(product_id, metadata, texture)
+
+    async def texture(self, url):
+        """Textura BGRA de la URL (None si no hay o no es una imagen)"""
+        if not url:
+            return None
+        texture = self.textures.get(url)
+        if texture is None:
+            # Una sola descarga por URL aunque lleguen varias peticiones a la vez
+            task = self._downloads.get(url)
+            if task is None:
+                task = asyncio.ensure_future(self._download(url))
+                self._downloads[url] = task
+                task.add_done_callback(lambda _: self._downloads.pop(url, None))
+            texture = await asyncio.shield(task)
+        return texture if texture.size else None
+
+    async def _download(self, url):
+        try:
+            data = await self._fetch(url)
+            texture = await run_in_threadpool(decode_texture, data) if data else None
+        except Exception as e:
+            logger.warning(f"No se pudo cargar la textura {url}: {e}")
+            texture = None
+
+        if texture is None:
+            self.textures.set(url, _MISSING, ttl=_MISSING_TTL)
+            return _MISSING
+        self.textures.set(url, texture)
+        return texture
+
+    async def _fetch(self, url, max_bytes=UPLOAD_MAX_BYTES):
+        """Descarga por bloques cortando al pasar `max_bytes` (None si excede)"""
+        async with self._client().stream("GET", url) as response:
+            response.raise_for_status()
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                logger.warning(f"Textura {url} descartada: {declared} bytes")
+                return None
+            data = bytearray()
+            async for chunk in response.aiter_bytes():
+                data += chunk
+                if len(data) > max_bytes:
+                    logger.warning(f"Textura {url} descartada: supera {max_bytes} bytes")
+                    return None
+            return bytes(data)
+
+    def invalidate(self, product_id):
+        """Invalida metadata y textura de un producto actualizado"""
+        self.metadata.invalidate(product_id)
+        url = self._texture_urls.pop(product_id, None)
+        if url:
+            self.textures.invalidate(url)
+
+    async def prefetch(self, products):
+        """Precalienta metadata y texturas de una lista de filas de clothing_products"""
+        semaphore = asyncio.Semaphore(AR_GARMENT_PREFETCH_CONCURRENCY)
+
+        async def warm(row):
+            async with semaphore:
+                await self.texture(row.get("imagen_3d_url"))
+
+        for row in products:
+            self.put_metadata(row["id"], row)
+        await asyncio.gather(*(warm(row) for row in products))
+
+    def stats(self):
+        return {
+            "metadata": self.metadata.stats(),
+            "textures": self.textures.stats(),
+            "downloads_in_flight": len(self._downloads),
+            "tracked_products": len(self._texture_urls),
+        }
+
+
+garment_cache = GarmentCache()
@@ -0,0 +1,160 @@
+"""
+Claves de idempotencia (cabecera Idempotency-Key) para escrituras.
+
+La garantía la da la base (tabla de resultados por clave dentro de la misma
+transacción); esta capa evita el viaje a la base en reintentos recientes y
+une las peticiones concurrentes con la misma clave en una sola ejecución.
+Cada clave queda atada a la huella de los parámetros de su primera
+petición: reusarla con otros parámetros es un error, no un replay. Las
+claves guardadas en la base se purgan periódicamente (IdempotencyPurger).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+from app.services.cache import TTLCache
+from app.services.database import get_db
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", 24 * 3600))
+IDEMPOTENCY_ENTRIES = int(os.getenv("IDEMPOTENCY_ENTRIES", 10000))
+# Días que la base guarda las claves y cada cuánto se purgan (segundos)
+IDEMPOTENCY_RETENTION_DAYS = int(os.getenv("IDEMPOTENCY_RETENTION_DAYS", 7))
+IDEMPOTENCY_PURGE_INTERVAL = float(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", 3600))
+IDEMPOTENCY_PURGE_BATCH = int(os.getenv("IDEMPOTENCY_PURGE_BATCH", 5000))
+
+
+class IdempotencyKeyReused(Exception):
+    """La clave ya se usó con otros parámetros"""
+
+
+def fingerprint(params):
+    """Huella estable de los parámetros de una petición"""
+    return hashlib.sha256(
+        json.dumps(params, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+class IdempotencyCache:
+    """Resultados recientes por clave, con ejecuciones deduplicadas"""
+
+    def __init__(self, max_entries=IDEMPOTENCY_ENTRIES, ttl=IDEMPOTENCY_TTL):
+        self.cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._running = {}  # clave -> (huella, asyncio.Task en curso)
+        self.replays = 0
+        self.reused = 0
+
+    async def run(self, scope, key, params, operation):
+        """
+        Retorna (resultado, repetido). `operation()` solo se ejecuta si la
+        clave no tiene resultado; sin clave se ejecuta siempre. Los
+        resultados que `operation` marca con "error" no se guardan.
+        `scope` acota la clave (p.ej. ("checkout", codigo)); si la clave ya
+        se usó con otros `params` lanza IdempotencyKeyReused.
+        """
+        if not key:
+            return await operation(), False
+        cache_key = (scope, key)
+        huella = fingerprint(params)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            self._check(cached[0], huella)
+            self.replays += 1
+            return cached[1], True
+
+        running = self._running.get(cache_key)
+        if running is None:
+            task = asyncio.ensure_future(operation())
+            self._running[cache_key] = (huella, task)
+            task.add_done_callback(lambda _: self._running.pop(cache_key, None))
+            result = await asyncio.shield(task)
+            if not result.get("error"):
+                self.cache.set(cache_key, (huella, result))
+            return result, False
+        self._check(running[0], huella)
+        self.replays += 1
+        return await asyncio.shield(running[1]), True
+
+    def _check(self, original, huella):
+        if original != huella:
+            self.reused += 1
+            raise IdempotencyKeyReused("La clave de idempotencia ya se usó con otros datos")
+
+    def stats(self):
+        return {
+            **self.cache.stats(),
+            "in_flight": len(self._running),
+            "replays": self.replays,
+            "reused": self.reused,
+        }
+
+
+class IdempotencyPurger:
+    """Borra cada cierto tiempo las claves vencidas de la base (tarea de fondo)"""
+
+    def __init__(self, purge, interval=IDEMPOTENCY_PURGE_INTERVAL,
+                 batch=IDEMPOTENCY_PURGE_BATCH, days=IDEMPOTENCY_RETENTION_DAYS):
+        # purge(dias, limite) -> claves borradas
+        self._purge = purge
+        self.interval = interval
+        self.batch = batch
+        self.days = days
+        self._task = None
+        self.purges = 0
+        self.purged = 0
+        self.failures = 0
+
+    async def purge(self):
+        """Borra por lotes hasta que no quede ninguna vencida"""
+        try:
+            while True:
+                purged = await self._purge(self.days, self.batch)
+                self.purged += purged
+                if purged < self.batch:
+                    break
+            self.purges += 1
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"No se pudieron purgar claves de idempotencia: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.purge()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "retention_days": self.days,
+            "purge_interval": self.interval,
+            "purges": self.purges,
+            "purged": self.purged,
+            "failures": self.failures,
+        }
+
+
+async def purge_checkouts(days, limit):
+    """Una pasada en la base; varios workers pueden llamarla a la vez"""
+    response = await get_db().rpc(
+        "purgar_marketplace_checkouts", {"p_dias": days, "p_limite": limit}
+    ).execute()
+    return response.data or 0
+
+
+idempotency_cache = IdempotencyCache()
+idempotency_purger = IdempotencyPurger(purge_checkouts)
@@ -0,0 +1,150 @@
+"""
+Decodificación adaptativa de fotos subidas al probador AR.
+
+Las fotos de celular llegan a 12 MP pero MediaPipe trabaja internamente a
+256 px: se lee la cabecera (tamaño + orientación EXIF) sin decodificar,
+se decodifica reducido con IMREAD_REDUCED_* (escalado DCT en JPEG) y la
+orientación se aplica una sola vez. La pose corre sobre una copia acotada;
+como los landmarks son normalizados, valen tal cual para el frame de
+salida, y las medidas en píxeles usan el tamaño original.
+"""
+import io
+import os
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+from app.services.image_output import fit_frame
+
+AR_POSE_INPUT_SIDE = int(os.getenv("AR_POSE_INPUT_SIDE", 512))
+
+# frame: BGR orientado; width/height: tamaño original orientado
+DecodedImage = namedtuple("DecodedImage", ["frame", "width", "height", "decode_ms"])
+
+_REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+_EXIF_ORIENTATION = 0x0112
+
+
+class InvalidImage(ValueError):
+    """Los bytes recibidos no son una imagen decodificable"""
+
+
+def read_header(fp):
+    """(ancho, alto, orientación EXIF) de un archivo sin decodificar los píxeles"""
+    try:
+        with Image.open(fp) as image:
+            orientation = image.getexif().get(_EXIF_ORIENTATION, 1)
+            return image.size[0], image.size[1], orientation
+    except (UnidentifiedImageError, OSError):
+        return None, None, 1
+
+
+def apply_orientation(frame, orientation):
+    """Aplica la orientación EXIF (1-8) a un frame"""
+    if orientation == 2:
+        return cv2.flip(frame, 1)
+    if orientation == 3:
+        return cv2.rotate(frame, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(frame, 0)
+    if orientation == 5:
+        return cv2.transpose(frame)
+    if orientation == 6:
+        return cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.rotate(cv2.transpose(frame), cv2.ROTATE_180)
+    if orientation == 8:
+        return cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return frame
+
+
+def reduction_factor(width, height, min_side):
+    """Mayor reducción DCT (1, 2, 4, 8) que deja el lado mayor >= `min_side`"""
+    if min_side and width:
+        for candidate in (8, 4, 2):
+            if max(width, height) / candidate >= min_side:
+                return candidate
+    return 1
+
+
+def decode_upload(contents, min_side=0, header=None):
+    """
+    Decodifica una foto reduciéndola mientras su lado mayor siga siendo
+    >= `min_side` (0 = resolución completa). `header` evita releer la
+    cabecera si ya se conoce (ver uploads.ImageUpload).
+    """
+    started_at = time.perf_counter()
+    if header is None:
+        header = read_header(io.BytesIO(contents))
+    width, height, orientation = header
+    factor = reduction_factor(width, height, min_side)
+
+    frame = cv2.imdecode(
+        np.frombuffer(contents, np.uint8),
+        _REDUCED_FLAGS[factor] | cv2.IMREAD_IGNORE_ORIENTATION,
+    )
+    if frame is None:
+        raise InvalidImage("Imagen inválida")
+
+    frame = apply_orientation(frame, orientation)
+    if width is None:
+        height, width = frame.shape[:2]
+    elif orientation in (5, 6, 7, 8):
+        width, height = height, width
+
+    decode_ms = round((time.perf_counter() - started_at) * 1000, 2)
+    return DecodedImage(frame, width, height, decode_ms)
+
+
+def pose_input(frame):
+    """Copia acotada a AR_POSE_INPUT_SIDE para la inferencia de pose"""
+    return fit_frame(frame, AR_POSE_INPUT_SIDE)
+
+
+def decode_side(max_side):
+    """Lado mínimo a decodificar para una salida de `max_side` (0 = sin límite)"""
+    return max(max_side, AR_POSE_INPUT_SIDE) if max_side else 0
+
+
+def decode_with_pose(contents, max_side, header=None):
+    """
+    (DecodedImage para la salida, copia para la pose). La copia de pose sale
+    siempre de la decodificación canónica a AR_POSE_INPUT_SIDE: la misma
+    foto da los mismos píxeles (y la misma clave en pose_cache) sin importar
+    el `max_side` de la salida. Si ambas usan la misma reducción DCT se
+    decodifica una sola vez.
+    """
+    if header is None:
+        header = read_header(io.BytesIO(contents))
+    decoded = decode_upload(contents, decode_side(max_side), header)
+    width, height, _ = header
+    if reduction_factor(width, height, decode_side(max_side)) == reduction_factor(
+        width, height, AR_POSE_INPUT_SIDE
+    ):
+        return decoded, pose_input(decoded.frame)
+
+    canonical = decode_upload(contents, AR_POSE_INPUT_SIDE, header)
+    decoded = decoded._replace(decode_ms=round(decoded.decode_ms + canonical.decode_ms, 2))
+    return decoded, pose_input(canonical.frame)
+
+
+def pipeline_timing(decoded, pose_result, encode_ms=None):
+    """Tiempos por petición: decodificación, cola, inferencia y codificación"""
+    timing = {
+        "decode_ms": decoded.decode_ms,
+        "queue_wait_ms": pose_result.queue_wait_ms,
+        "inference_ms": pose_result.inference_ms,
+        "cache_hit": pose_result.cached,
+    }
+    if encode_ms is not None:
+        timing["encode_ms"] = encode_ms
+    return timing
@@ -0,0 +1,145 @@
+"""
+Salida negociada de imágenes para los endpoints AR.
+
+Según `Accept` (o el parámetro `formato`) se responde con:
+- `image/jpeg` / `image/webp` en binario, con metadatos en cabeceras `X-AR-*`
+- `multipart/mixed` (una parte JSON + una parte por imagen)
+- JSON con base64 (modo legacy, por defecto)
+"""
+import base64
+import json
+import os
+import re
+import uuid
+from typing import Optional
+
+import cv2
+from fastapi import Header, Query
+from fastapi.responses import StreamingResponse
+
+AR_OUTPUT_QUALITY = int(os.getenv("AR_OUTPUT_QUALITY", 85))
+AR_OUTPUT_MAX_SIDE = int(os.getenv("AR_OUTPUT_MAX_SIDE", 1280))
+
+MEDIA_TYPES = {
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+EXTENSIONS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+class OutputOptions:
+    """Modo de salida negociado para una petición"""
+
+    def __init__(self, mode="json", image_format="jpeg", quality=AR_OUTPUT_QUALITY,
+                 max_side=AR_OUTPUT_MAX_SIDE):
+        self.mode = mode  # 'json', 'image', 'multipart'
+        self.image_format = image_format  # 'jpeg', 'webp'
+        self.quality = quality
+        self.max_side = max_side
+
+    @property
+    def media_type(self):
+        return MEDIA_TYPES[self.image_format]
+
+
+def output_options(
+    accept: str = Header("application/json"),
+    formato: Optional[str] = Query(None, pattern="^(json|jpeg|webp|multipart)$"),
+    quality: int = Query(AR_OUTPUT_QUALITY, ge=1, le=100),
+    max_side: int = Query(AR_OUTPUT_MAX_SIDE, ge=0, le=8192),
+):
+    """Dependencia FastAPI: resuelve el modo de salida (0 = sin límite de lado)"""
+    accept = (accept or "").lower()
+    image_format = "webp" if formato == "webp" or "image/webp" in accept else "jpeg"
+
+    if formato is not None:
+        mode = {"json": "json", "multipart": "multipart"}.get(formato, "image")
+    elif "multipart/mixed" in accept:
+        mode = "multipart"
+    elif "image/webp" in accept or "image/jpeg" in accept:
+        mode = "image"
+    else:
+        mode = "json"
+
+    return OutputOptions(mode, image_format, quality, max_side)
+
+
+def fit_frame(frame, max_side):
+    """Reduce el frame para que su lado mayor no supere `max_side`"""
+    h, w = frame.shape[:2]
+    if not max_side or max(h, w) <= max_side:
+        return frame
+    scale = max_side / max(h, w)
+    return cv2.resize(
+        frame, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA
+    )
+
+
+def encode_frame(frame, options):
+    """Codifica un frame BGR en el formato/calidad negociados"""
+    ext, quality_flag = EXTENSIONS[options.image_format]
+    success, buffer = cv2.imencode(ext, frame, [quality_flag, options.quality])
+    if not success:
+        raise ValueError(f"No se pudo codificar la imagen ({options.image_format})")
+    return buffer.tobytes()
+
+
+def to_base64(img_bytes):
+    return base64.b64encode(img_bytes).decode()
+
+
+def metadata_headers(metadata):
+    """Convierte metadatos en cabeceras `X-AR-*` (valores no escalares en JSON)"""
+    headers = {}
+    for key, value in metadata.items():
+        name = "X-AR-" + key.replace("_", "-").title()
+        if not isinstance(value, (str, int, float)):
+            value = json.dumps(value, ensure_ascii=True, separators=(",", ":"))
+        headers[name] = str(value)
+    return headers
+
+
+# Nombres de parte: vienen de la query (tallas); nada que rompa la cabecera
+_PART_NAME_UNSAFE = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def _multipart_chunks(images, options, metadata, boundary):
+    yield (
+        f"--{boundary}\r\n"
+        "Content-Type: application/json\r\n\r\n"
+    ).encode()
+    yield json.dumps(metadata).encode()
+    yield b"\r\n"
+    for name, img_bytes in images.items():
+        yield (
+            f"--{boundary}\r\n"
+            f"Content-Type: {options.media_type}\r\n"
+            f'Content-Disposition: inline; name="{_PART_NAME_UNSAFE.sub("", name)}"\r\n'
+            f"Content-Length: {len(img_bytes)}\r\n\r\n"
+        ).encode()
+        yield img_bytes
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+def image_response(images, options, metadata):
+    """
+    Respuesta binaria para los modos 'image' y 'multipart'.
+    Varias imágenes en modo 'image' se envían como multipart.
+    """
+    if options.mode == "image" and len(images) == 1:
+        img_bytes = next(iter(images.values()))
+        return StreamingResponse(
+            iter([img_bytes]),
+            media_type=options.media_type,
+            headers=metadata_headers(metadata),
+        )
+
+    boundary = uuid.uuid4().hex
+    return StreamingResponse(
+        _multipart_chunks(images, options, metadata, boundary),
+        media_type=f"multipart/mixed; boundary={boundary}",
+    )
@@ -0,0 +1,257 @@
+"""
+Ejecutor de inferencia para el probador AR.
+
+MediaPipe corre en un pool de procesos dedicado: cada proceso mantiene sus
+propias instancias de Pose/Hands y los handlers async solo esperan el
+resultado, así una inferencia de 200 ms no bloquea el event loop.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from app.services.model_registry import AR_MODEL_LOADING, model_registry
+
+logger = logging.getLogger(__name__)
+
+AR_INFERENCE_WORKERS = int(os.getenv("AR_INFERENCE_WORKERS", 2))
+AR_INFERENCE_QUEUE_SIZE = int(os.getenv("AR_INFERENCE_QUEUE_SIZE", 8))
+
+# Configuración del modelo de pose (forma parte de la clave de caché)
+POSE_MODEL_COMPLEXITY = 1
+POSE_MODEL_SETTINGS = f"pose:static=1:complexity={POSE_MODEL_COMPLEXITY}"
+
+# Landmark compacto (picklable) con la misma interfaz que los de MediaPipe
+Landmark = namedtuple("Landmark", ["x", "y", "z", "visibility"])
+
+PoseResult = namedtuple(
+    "PoseResult", ["landmarks", "queue_wait_ms", "inference_ms", "cached"], defaults=[False]
+)
+HandsResult = namedtuple("HandsResult", ["hands", "queue_wait_ms", "inference_ms"])
+
+
+class InferenceQueueFull(Exception):
+    """La cola de inferencia alcanzó su límite"""
+
+
+# Frame sintético para el warm-up (no necesita contener una persona)
+_WARMUP_FRAME = np.full((256, 256, 3), 127, dtype=np.uint8)
+
+
+def _create_pose():
+    import mediapipe as mp
+
+    return mp.solutions.pose.Pose(
+        static_image_mode=True, model_complexity=POSE_MODEL_COMPLEXITY
+    )
+
+
+def _create_hands():
+    import mediapipe as mp
+
+    return mp.solutions.hands.Hands(static_image_mode=True)
+
+
+def _warm_up(model):
+    model.process(_WARMUP_FRAME)
+
+
+# Cada worker importa este módulo y tiene su propio registro
+model_registry.register("pose", _create_pose, _warm_up)
+model_registry.register("hands", _create_hands, _warm_up)
+
+
+def _init_worker(status_queue, eager):
+    """Conecta el registro del worker con el proceso principal"""
+    model_registry.on_change = status_queue.put
+    if eager:
+        model_registry.warm_all()
+    else:
+        status_queue.put(model_registry.stats())
+
+
+def _ping():
+    """Tarea vacía: fuerza el arranque (y la carga eager) de un worker"""
+    return os.getpid()
+
+
+def _run_pose(frame):
+    """Detecta pose en el worker; retorna landmarks como array (33, 4)"""
+    import cv2
+
+    pose = model_registry.get("pose")
+    started_at = time.monotonic()
+    results = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    model_registry.mark_warm("pose")
+
+    landmarks = None
+    if results.pose_landmarks:
+        landmarks = np.array(
+            [(lm.x, lm.y, lm.z, lm.visibility) for lm in results.pose_landmarks.landmark],
+            dtype=np.float32,
+        )
+    return landmarks, started_at, time.monotonic()
+
+
+def _run_hands(frame):
+    """Detecta manos en el worker; retorna una lista de arrays (21, 4)"""
+    import cv2
+
+    hands_model = model_registry.get("hands")
+    started_at = time.monotonic()
+    results = hands_model.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    model_registry.mark_warm("hands")
+
+    hands = []
+    for hand_landmarks in results.multi_hand_landmarks or []:
+        hands.append(np.array(
+            [(lm.x, lm.y, lm.z, 0.0) for lm in hand_landmarks.landmark],
+            dtype=np.float32,
+        ))
+    return hands, started_at, time.monotonic()
+
+
+def landmarks_from_array(array):
+    """Convierte un array (N, 4) en una lista de Landmark"""
+    if array is None:
+        return None
+    return [Landmark(*map(float, row)) for row in array]
+
+
+class InferenceExecutor:
+    """Pool de procesos con cola acotada para inferencia de pose/manos"""
+
+    def __init__(self, workers=AR_INFERENCE_WORKERS, queue_size=AR_INFERENCE_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._pool = None
+        self._status = None
+        self._models = {}  # pid -> estado del registro de ese worker
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._queue_wait_ms_total = 0.0
+        self._inference_ms_total = 0.0
+
+    def start(self):
+        if self._pool is None:
+            context = multiprocessing.get_context("spawn")
+            self._status = context.Queue()
+            self._models = {}
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self._status, AR_MODEL_LOADING == "eager"),
+            )
+            logger.info(f"Pool de inferencia AR iniciado ({self.workers} procesos)")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        if self._status is not None:
+            self._status.close()
+            self._status = None
+
+    async def warm_up(self):
+        """Arranca todos los workers; en modo eager cargan y calientan sus modelos"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        started_at = time.monotonic()
+        # El pool crea un proceso por tarea mientras no haya workers libres
+        pids = await asyncio.gather(*[
+            loop.run_in_executor(self._pool, _ping) for _ in range(self.workers)
+        ])
+        logger.info(
+            f"Workers de inferencia AR listos en "
+            f"{(time.monotonic() - started_at) * 1000:.0f} ms (pids {sorted(set(pids))})"
+        )
+
+    async def detect_pose(self, frame):
+        """Detecta landmarks del cuerpo en un frame BGR"""
+        array, queue_wait_ms, inference_ms = await self._submit(_run_pose, frame)
+        return PoseResult(landmarks_from_array(array), queue_wait_ms, inference_ms)
+
+    async def detect_hands(self, frame):
+        """Detecta landmarks de manos en un frame BGR"""
+        arrays, queue_wait_ms, inference_ms = await self._submit(_run_hands, frame)
+        hands = [landmarks_from_array(a) for a in arrays]
+        return HandsResult(hands, queue_wait_ms, inference_ms)
+
+    async def _submit(self, fn, frame):
+        # Cola acotada: procesos ocupados + espera máxima permitida
+        if self._in_flight >= self.workers + self.queue_size:
+            self._rejected += 1
+            raise InferenceQueueFull("Probador AR ocupado, intenta nuevamente")
+
+        self.start()
+        self._in_flight += 1
+        try:
+            submitted_at = time.monotonic()
+            result, started_at, finished_at = await asyncio.get_running_loop().run_in_executor(
+                self._pool, fn, frame
+            )
+        except BrokenProcessPool:
+            # Un worker murió (p.ej. OOM); el pool se recrea en la próxima llamada
+            logger.error("Pool de inferencia AR roto, se reiniciará")
+            self._pool = None
+            self._models = {}
+            raise
+        finally:
+            self._in_flight -= 1
+
+        queue_wait_ms = max(started_at - submitted_at, 0.0) * 1000
+        inference_ms = (finished_at - started_at) * 1000
+        self._completed += 1
+        self._queue_wait_ms_total += queue_wait_ms
+        self._inference_ms_total += inference_ms
+        return result, round(queue_wait_ms, 2), round(inference_ms, 2)
+
+    def model_stats(self):
+        """Estado de los modelos reportado por cada worker"""
+        while self._status is not None:
+            try:
+                report = self._status.get_nowait()
+            except queue.Empty:
+                break
+            self._models[report["pid"]] = report
+        return {
+            "loading": AR_MODEL_LOADING,
+            "workers": list(self._models.values()),
+        }
+
+    def stats(self):
+        completed = self._completed or 1
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self._in_flight,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "avg_queue_wait_ms": round(self._queue_wait_ms_total / completed, 2),
+            "avg_inference_ms": round(self._inference_ms_total / completed, 2),
+        }
+
+
+_executor = None
+
+
+def get_inference_executor():
+    """Retorna el ejecutor compartido por los routers AR"""
+    global _executor
+    if _executor is None:
+        _executor = InferenceExecutor()
+    return _executor
+
+
+def shutdown_inference_executor():
+    if _executor is not None:
+        _executor.shutdown()
@@ -0,0 +1,64 @@
+"""
+KPIs de clientes y cuentas por cobrar por negocio (/analytics/clientes).
+
+Los conteos y sumas se calculan en la base y se cachean por negocio_id.
+Las escrituras que pasan por la API invalidan la entrada; el TTL corto
+cubre los cambios hechos por fuera (app móvil, panel de Supabase). Una
+carga que se cruza con una invalidación no guarda su resultado.
+"""
+import asyncio
+import os
+
+from app.services.cache import TTLCache
+
+ANALYTICS_KPI_TTL = int(os.getenv("ANALYTICS_KPI_TTL", 30))
+ANALYTICS_KPI_ENTRIES = int(os.getenv("ANALYTICS_KPI_ENTRIES", 4096))
+
+
+class KpiCache:
+    """KPIs por negocio con cargas deduplicadas e invalidación explícita"""
+
+    def __init__(self, max_entries=ANALYTICS_KPI_ENTRIES, ttl=ANALYTICS_KPI_TTL):
+        self.cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._loads = {}  # negocio_id -> asyncio.Task en curso
+        self.invalidations = 0
+
+    async def get(self, negocio_id, load):
+        """Retorna los KPIs; `load(negocio_id)` solo se usa en fallos de caché"""
+        cached = self.cache.get(negocio_id)
+        if cached is not None:
+            return cached
+
+        task = self._loads.get(negocio_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load(negocio_id, load))
+            self._loads[negocio_id] = task
+            task.add_done_callback(lambda done: self._finished(negocio_id, done))
+        return await asyncio.shield(task)
+
+    async def _load(self, negocio_id, load):
+        kpis = await load(negocio_id)
+        # Si hubo una invalidación durante la carga, ya no es la vigente
+        if self._loads.get(negocio_id) is asyncio.current_task():
+            self.cache.set(negocio_id, kpis)
+        return kpis
+
+    def _finished(self, negocio_id, task):
+        if self._loads.get(negocio_id) is task:
+            del self._loads[negocio_id]
+
+    def invalidate(self, negocio_id):
+        """Descarta la entrada; la carga en curso ya no se guarda ni se reusa"""
+        self.cache.invalidate(negocio_id)
+        self._loads.pop(negocio_id, None)
+        self.invalidations += 1
+
+    def stats(self):
+        return {
+            **self.cache.stats(),
+            "loads_in_flight": len(self._loads),
+            "invalidations": self.invalidations,
+        }
+
+
+customer_kpis = KpiCache()
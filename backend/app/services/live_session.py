@@ -0,0 +1,194 @@
+"""
+Sesiones en vivo del probador AR (WebSocket).
+
+Cada sesión tiene su propio contexto de pose en modo tracking
+(`static_image_mode=False`) en un hilo dedicado, así el tracker solo ve
+frames consecutivos de la misma persona. Los frames llegan como binarios;
+si llegan más rápido de lo que se procesan, se descartan los viejos y
+siempre se procesa el más reciente.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+from starlette.websockets import WebSocketState
+
+from app.services.image_input import InvalidImage, decode_upload
+from app.services.image_output import fit_frame
+from app.services.inference import Landmark
+from app.services.uploads import UploadRejected, check_image_bytes
+
+logger = logging.getLogger(__name__)
+
+AR_LIVE_MAX_SESSIONS = int(os.getenv("AR_LIVE_MAX_SESSIONS", 4))
+AR_LIVE_MAX_SIDE = int(os.getenv("AR_LIVE_MAX_SIDE", 640))
+AR_LIVE_MODEL_COMPLEXITY = int(os.getenv("AR_LIVE_MODEL_COMPLEXITY", 0))
+# Un frame de cámara a 640 px pesa ~100 KB; lo que pase de esto se descarta
+AR_LIVE_MAX_FRAME_BYTES = int(os.getenv("AR_LIVE_MAX_FRAME_KB", 2048)) * 1024
+
+
+class SessionLimitReached(Exception):
+    """Se alcanzó el máximo de sesiones en vivo del worker"""
+
+
+class LiveSession:
+    """Sesión de tracking: recibe frames, procesa siempre el último"""
+
+    def __init__(self, websocket, handle_frame):
+        self.websocket = websocket
+        # handle_frame(frame, landmarks) -> bytes (overlay) o dict (paquete JSON)
+        self.handle_frame = handle_frame
+        self._thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ar-live")
+        self._pose = None
+        self._latest = None
+        self._ready = asyncio.Event()
+        self._closed = False
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.oversized = 0
+        self.started_at = time.monotonic()
+
+    def _process(self, data):
+        """Decodifica, hace tracking y renderiza (en el hilo de la sesión)"""
+        if self._pose is None:
+            import mediapipe as mp
+
+            self._pose = mp.solutions.pose.Pose(
+                static_image_mode=False, model_complexity=AR_LIVE_MODEL_COMPLEXITY
+            )
+
+        try:
+            # Bytes sin confiar: mismos límites que las subidas (tamaño,
+            # formato, píxeles declarados) antes de decodificar
+            header = check_image_bytes(data, AR_LIVE_MAX_FRAME_BYTES)
+            frame = decode_upload(data, AR_LIVE_MAX_SIDE, header).frame
+        except (InvalidImage, UploadRejected):
+            return None
+        frame = fit_frame(frame, AR_LIVE_MAX_SIDE)
+
+        results = self._pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        landmarks = None
+        if results.pose_landmarks:
+            landmarks = [
+                Landmark(lm.x, lm.y, lm.z, lm.visibility)
+                for lm in results.pose_landmarks.landmark
+            ]
+        return self.handle_frame(frame, landmarks)
+
+    def _close_pose(self):
+        if self._pose is not None:
+            self._pose.close()
+            self._pose = None
+
+    async def _receive(self):
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes")
+                if not data:
+                    continue
+                self.received += 1
+                if len(data) > AR_LIVE_MAX_FRAME_BYTES:
+                    # No se retiene: el frame vacío se responde como inválido
+                    self.oversized += 1
+                    data = b""
+                if self._latest is not None:
+                    self.dropped += 1
+                self._latest = data
+                self._ready.set()
+        finally:
+            self._closed = True
+            self._ready.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        receiver = asyncio.create_task(self._receive())
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                if self._closed:
+                    break
+                data, self._latest = self._latest, None
+                if data is None:
+                    continue
+
+                started_at = time.monotonic()
+                packet = await loop.run_in_executor(self._thread, self._process, data)
+                self.processed += 1
+
+                if packet is None:
+                    packet = {"error": "Frame inválido"}
+                if isinstance(packet, dict):
+                    packet.update({
+                        "frame": self.processed,
+                        "dropped": self.dropped,
+                        "latency_ms": round((time.monotonic() - started_at) * 1000, 2),
+                    })
+                    await self.websocket.send_json(packet)
+                else:
+                    await self.websocket.send_bytes(packet)
+        finally:
+            receiver.cancel()
+            await loop.run_in_executor(self._thread, self._close_pose)
+            self._thread.shutdown(wait=False)
+            if self.websocket.client_state == WebSocketState.CONNECTED:
+                await self.websocket.close()
+
+    def fps(self):
+        elapsed = time.monotonic() - self.started_at
+        return round(self.processed / elapsed, 2) if elapsed > 0 else 0.0
+
+
+class LiveSessionManager:
+    """Limita las sesiones concurrentes por worker y acumula métricas"""
+
+    def __init__(self, max_sessions=AR_LIVE_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self.sessions = set()
+        self.rejected = 0
+        self.total_processed = 0
+        self.total_dropped = 0
+        self.total_oversized = 0
+
+    async def serve(self, websocket, handle_frame):
+        """Atiende una sesión completa; lanza SessionLimitReached si no hay cupo"""
+        if len(self.sessions) >= self.max_sessions:
+            self.rejected += 1
+            raise SessionLimitReached(
+                f"Máximo de {self.max_sessions} sesiones en vivo alcanzado"
+            )
+
+        session = LiveSession(websocket, handle_frame)
+        self.sessions.add(session)
+        try:
+            await session.run()
+        finally:
+            self.sessions.discard(session)
+            self.total_processed += session.processed
+            self.total_dropped += session.dropped
+            self.total_oversized += session.oversized
+            logger.info(
+                f"Sesión AR en vivo cerrada: {session.processed} frames, "
+                f"{session.dropped} descartados, {session.fps()} fps"
+            )
+
+    def stats(self):
+        return {
+            "active": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "rejected": self.rejected,
+            "processed": self.total_processed + sum(s.processed for s in self.sessions),
+            "dropped": self.total_dropped + sum(s.dropped for s in self.sessions),
+            "oversized": self.total_oversized + sum(s.oversized for s in self.sessions),
+            "fps": [s.fps() for s in self.sessions],
+        }
+
+
+live_sessions = LiveSessionManager()
@@ -0,0 +1,127 @@
+"""
+Registro de modelos MediaPipe por proceso.
+
+Los modelos se crean una sola vez por proceso y se comparten entre todos los
+que los piden. Con `AR_MODEL_LOADING=lazy` se cargan en el primer uso; con
+`eager` se cargan al iniciar y se les pasa una inferencia sintética para que
+el primer cliente no pague la inicialización del grafo.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# lazy | eager
+AR_MODEL_LOADING = os.getenv("AR_MODEL_LOADING", "lazy").lower()
+
+
+def rss_bytes():
+    """Memoria residente del proceso actual (None si no se puede leer)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _Entry:
+    def __init__(self):
+        self.model = None
+        self.warm = False
+        self.load_ms = None
+        self.warmup_ms = None
+        self.rss_bytes = None
+
+
+class ModelRegistry:
+    """Modelos con nombre: fábrica + warm-up opcional, creados una vez"""
+
+    def __init__(self):
+        self._specs = {}  # name -> (factory, warmup)
+        self._entries = {}
+        self._lock = threading.Lock()
+        # Se llama con stats() cada vez que un modelo cambia de estado
+        self.on_change = None
+
+    def register(self, name, factory, warmup=None):
+        self._specs[name] = (factory, warmup)
+        self._entries.setdefault(name, _Entry())
+
+    def get(self, name):
+        """Retorna el modelo, creándolo si aún no existe"""
+        entry = self._entries[name]
+        if entry.model is None:
+            with self._lock:
+                if entry.model is None:
+                    self._load(name, entry)
+        return entry.model
+
+    def _load(self, name, entry):
+        factory, _ = self._specs[name]
+        rss_before = rss_bytes()
+        started_at = time.perf_counter()
+        entry.model = factory()
+        entry.load_ms = round((time.perf_counter() - started_at) * 1000, 2)
+        rss_after = rss_bytes()
+        if rss_before is not None and rss_after is not None:
+            # Aproximado: lo que creció el proceso al crear el modelo
+            entry.rss_bytes = max(rss_after - rss_before, 0)
+        logger.info(f"Modelo '{name}' cargado en {entry.load_ms} ms")
+        self._notify()
+
+    def warm(self, name):
+        """Carga el modelo y corre su inferencia sintética"""
+        model = self.get(name)
+        entry = self._entries[name]
+        _, warmup = self._specs[name]
+        if entry.warm:
+            return model
+        with self._lock:
+            if not entry.warm:
+                started_at = time.perf_counter()
+                if warmup is not None:
+                    warmup(model)
+                entry.warmup_ms = round((time.perf_counter() - started_at) * 1000, 2)
+                entry.warm = True
+        self._notify()
+        return model
+
+    def warm_all(self):
+        for name in self._specs:
+            self.warm(name)
+
+    def mark_warm(self, name):
+        """Una inferencia real también deja el modelo caliente"""
+        entry = self._entries[name]
+        if not entry.warm:
+            entry.warm = True
+            self._notify()
+
+    def _notify(self):
+        if self.on_change is not None:
+            try:
+                self.on_change(self.stats())
+            except Exception as e:
+                logger.warning(f"No se pudo reportar el estado de los modelos: {e}")
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "rss_bytes": rss_bytes(),
+            "models": {
+                name: {
+                    "loaded": entry.model is not None,
+                    "warm": entry.warm,
+                    "load_ms": entry.load_ms,
+                    "warmup_ms": entry.warmup_ms,
+                    "rss_bytes": entry.rss_bytes,
+                }
+                for name, entry in self._entries.items()
+            },
+        }
+
+
+# Registro del proceso actual (en los workers de inferencia, uno por worker)
+model_registry = ModelRegistry()
@@ -0,0 +1,91 @@
+"""
+Paginación por cursor (keyset) sobre PostgREST.
+
+En lugar de `.range(offset, ...)`, que recorre y descarta todas las filas
+anteriores, cada página filtra por la clave de orden de la última fila
+vista: `(created_at, id) < (c, i)` en orden descendente. El cursor es un
+token opaco (base64 de esa clave) atado al listado que lo emitió.
+"""
+import base64
+import json
+
+PAGE_SIZE_MAX = 100
+
+# Clave de orden estable: created_at no cambia y id desempata. Ambas
+# columnas son NOT NULL (add_keyset_pagination_indexes.sql): con NULLs el
+# filtro por tupla saltaría o repetiría filas
+DEFAULT_KEY = ("created_at", "id")
+
+
+class InvalidCursor(ValueError):
+    """El cursor no es válido para este listado"""
+
+
+def encode_cursor(kind, values):
+    payload = json.dumps({"k": kind, "v": list(values)}, separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(kind, token):
+    """Retorna los valores de la clave; lanza InvalidCursor si no corresponde"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values = payload["v"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Cursor inválido")
+    if payload.get("k") != kind or not isinstance(values, list):
+        raise InvalidCursor("Cursor inválido")
+    return values
+
+
+def cursor_values(kind, cursor, key=DEFAULT_KEY):
+    """Valores de la clave del cursor, o None si no hay cursor"""
+    if not cursor:
+        return None
+    values = decode_cursor(kind, cursor)
+    if len(values) != len(key):
+        raise InvalidCursor("Cursor inválido")
+    return values
+
+
+def _quote(value):
+    """Valor entre comillas para filtros lógicos de PostgREST (or/and)"""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def keyset_page(query, kind, cursor, limit, key=DEFAULT_KEY):
+    """
+    Aplica orden descendente por `key`, el filtro del cursor y pide una
+    fila de más para saber si hay página siguiente.
+    """
+    values = cursor_values(kind, cursor, key)
+    if values:
+        # (k1, k2) < (v1, v2)  =>  k1 < v1 OR (k1 = v1 AND k2 < v2)
+        first, second = key
+        v1, v2 = (_quote(v) for v in values)
+        query = query.or_(
+            f"{first}.lt.{v1},and({first}.eq.{v1},{second}.lt.{v2})"
+        )
+    return order_desc(query, key).limit(limit + 1)
+
+
+def order_desc(query, key):
+    """Orden descendente por cada columna de `key` (deben ser NOT NULL)"""
+    for column in key:
+        query = query.order(column, desc=True)
+    # postgrest-py 0.15 agrega un parámetro `order` por llamada; PostgREST
+    # toma una sola lista "created_at.desc,id.desc"
+    orders = query.params.get_list("order")
+    if len(orders) > 1:
+        query.params = query.params.remove("order").add("order", ",".join(orders))
+    return query
+
+
+def page_result(rows, kind, limit, key=DEFAULT_KEY):
+    """(filas de la página, next_cursor o None)"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(kind, [last[column] for column in key])
@@ -0,0 +1,58 @@
+"""
+Caché de resultados de pose por hash de contenido.
+
+La misma foto suele llegar a /mirror/process, /mirror/size-comparison y
+/detect-size mientras el cliente prueba varias prendas; la clave es el
+hash de los píxeles decodificados más la configuración del modelo, y el
+valor es el array compacto de landmarks (no objetos MediaPipe).
+"""
+import hashlib
+import os
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from app.services.cache import TTLCache
+from app.services.inference import (
+    POSE_MODEL_SETTINGS,
+    PoseResult,
+    get_inference_executor,
+    landmarks_from_array,
+)
+
+AR_POSE_CACHE_ENTRIES = int(os.getenv("AR_POSE_CACHE_ENTRIES", 2048))
+AR_POSE_CACHE_TTL = int(os.getenv("AR_POSE_CACHE_TTL", 600))
+
+# Marca "sin pose detectada" (también se cachea)
+_NO_POSE = np.empty((0, 4), dtype=np.float32)
+
+pose_cache = TTLCache(
+    max_entries=AR_POSE_CACHE_ENTRIES,
+    ttl=AR_POSE_CACHE_TTL,
+    sizeof=lambda array: array.nbytes,
+)
+
+
+def frame_key(frame):
+    """Hash de los píxeles decodificados + forma + configuración del modelo"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{POSE_MODEL_SETTINGS}:{frame.shape}".encode())
+    digest.update(np.ascontiguousarray(frame).data)
+    return digest.hexdigest()
+
+
+async def detect_pose_cached(frame):
+    """Detecta pose consultando primero la caché"""
+    key = await run_in_threadpool(frame_key, frame)
+
+    array = pose_cache.get(key)
+    if array is not None:
+        landmarks = landmarks_from_array(array) if len(array) else None
+        return PoseResult(landmarks, 0.0, 0.0, cached=True)
+
+    result = await get_inference_executor().detect_pose(frame)
+    if result.landmarks:
+        pose_cache.set(key, np.asarray(result.landmarks, dtype=np.float32))
+    else:
+        pose_cache.set(key, _NO_POSE)
+    return result
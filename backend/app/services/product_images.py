@@ -0,0 +1,303 @@
+"""
+Fotos de productos: original deduplicado y variantes derivadas.
+
+El original se guarda una sola vez bajo una clave derivada de su contenido
+(sha256), así subir la misma foto otra vez no escribe nada. Las variantes
+(thumb, card, zoom en WebP y JPEG) se generan fuera del camino de la
+petición en un pool de hilos (OpenCV libera el GIL al redimensionar y
+codificar), se suben en paralelo y se registran en el producto: la URL
+en `productos.fotos` y las variantes en `productos.fotos_variantes`.
+
+Almacenamiento según PRODUCT_IMAGE_STORAGE:
+- `supabase` (por defecto): bucket de Supabase Storage
+- `fs`: directorio local servido en PRODUCT_IMAGE_PUBLIC_URL
+- `s3`: S3 o compatible (MinIO, etc.) con S3_ENDPOINT_URL
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+from starlette.concurrency import run_in_threadpool
+
+from app.services.database import get_db
+from app.services.image_input import decode_upload
+from app.services.image_output import fit_frame
+from app.services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_IMAGE_STORAGE = os.getenv("PRODUCT_IMAGE_STORAGE", "supabase")
+PRODUCT_IMAGE_BUCKET = os.getenv("PRODUCT_IMAGE_BUCKET", "omnitienda")
+PRODUCT_IMAGE_FS_ROOT = os.getenv("PRODUCT_IMAGE_FS_ROOT", "media")
+PRODUCT_IMAGE_PUBLIC_URL = os.getenv("PRODUCT_IMAGE_PUBLIC_URL", "")
+PRODUCT_IMAGE_WORKERS = int(os.getenv("PRODUCT_IMAGE_WORKERS", 2))
+PRODUCT_IMAGE_QUALITY = int(os.getenv("PRODUCT_IMAGE_QUALITY", 80))
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+
+# Lado mayor máximo por variante (no se agranda si la foto es menor)
+VARIANTS = {"thumb": 160, "card": 480, "zoom": 1280}
+VARIANT_FORMATS = {
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+}
+
+
+def original_key(digest, extension):
+    return f"productos/originales/{digest[:2]}/{digest}.{extension}"
+
+
+def variant_key(digest, name, image_format):
+    return f"productos/variantes/{digest}/{name}{VARIANT_FORMATS[image_format][0]}"
+
+
+def _manifest_key(digest):
+    # Se escribe al final: si existe, todas las variantes existen
+    return f"productos/variantes/{digest}/manifest.json"
+
+
+def render_variants(contents, header, quality=PRODUCT_IMAGE_QUALITY):
+    """{(variante, formato): bytes}; corre en el pool de hilos"""
+    frame = decode_upload(contents, max(VARIANTS.values()), header).frame
+    encoded = {}
+    for name, side in VARIANTS.items():
+        resized = fit_frame(frame, side)
+        for image_format, (ext, quality_flag, _) in VARIANT_FORMATS.items():
+            success, buffer = cv2.imencode(ext, resized, [quality_flag, quality])
+            if not success:
+                raise ValueError(f"No se pudo codificar la variante {name} ({image_format})")
+            encoded[(name, image_format)] = buffer.tobytes()
+    return encoded
+
+
+class SupabaseImageStorage:
+    """Bucket público de Supabase Storage (cliente compartido de la app)"""
+
+    def __init__(self, bucket=PRODUCT_IMAGE_BUCKET):
+        self.bucket = bucket
+
+    def _bucket(self):
+        return get_db().storage.from_(self.bucket)
+
+    async def exists(self, key):
+        response = await get_db().storage.session.head(f"object/public/{self.bucket}/{key}")
+        return response.status_code == 200
+
+    async def put(self, key, data, content_type):
+        await self._bucket().upload(
+            key, data, {"content-type": content_type, "x-upsert": "true"}
+        )
+
+    async def url(self, key):
+        return await self._bucket().get_public_url(key)
+
+
+class FileSystemImageStorage:
+    """Directorio local (desarrollo o detrás de nginx)"""
+
+    def __init__(self, root=PRODUCT_IMAGE_FS_ROOT, public_url=PRODUCT_IMAGE_PUBLIC_URL):
+        self.root = root
+        self.public_url = public_url.rstrip("/")
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    async def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def _write(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escritura atómica: nunca se sirve un archivo a medias
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    async def put(self, key, data, content_type):
+        await run_in_threadpool(self._write, key, data)
+
+    async def url(self, key):
+        return f"{self.public_url}/{key}"
+
+
+class S3ImageStorage:
+    """S3 o compatible; el cliente boto3 se crea al primer uso"""
+
+    def __init__(self, bucket=os.getenv("AWS_BUCKET_NAME", PRODUCT_IMAGE_BUCKET),
+                 endpoint_url=S3_ENDPOINT_URL,
+                 public_url=PRODUCT_IMAGE_PUBLIC_URL):
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.public_url = public_url.rstrip("/")
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=self.endpoint_url,
+                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                region_name=os.getenv("AWS_REGION"),
+            )
+        return self._client
+
+    async def exists(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            await run_in_threadpool(self.client.head_object, Bucket=self.bucket, Key=key)
+            return True
+        except ClientError:
+            return False
+
+    async def put(self, key, data, content_type):
+        await run_in_threadpool(
+            self.client.put_object,
+            Bucket=self.bucket, Key=key, Body=data, ContentType=content_type,
+            CacheControl="public, max-age=31536000, immutable",
+        )
+
+    async def url(self, key):
+        if self.public_url:
+            return f"{self.public_url}/{key}"
+        if self.endpoint_url:
+            return f"{self.endpoint_url.rstrip('/')}/{self.bucket}/{key}"
+        return f"https://{self.bucket}.s3.amazonaws.com/{key}"
+
+
+class ImagePipeline:
+    """Guarda originales por hash y genera variantes en segundo plano"""
+
+    def __init__(self, storage, workers=PRODUCT_IMAGE_WORKERS):
+        self.storage = storage
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="product-images"
+        )
+        self._jobs = {}  # digest -> asyncio.Task con las variantes en curso
+        self._tasks = set()
+        self.originals_stored = 0
+        self.originals_deduped = 0
+        self.variants_rendered = 0
+        self.variants_deduped = 0
+        self.failures = 0
+        self._render_ms = 0.0
+
+    async def store_original(self, data, media_type, extension):
+        """(hash, clave, url, duplicada) del original"""
+        digest = hashlib.sha256(data).hexdigest()
+        key = original_key(digest, extension)
+        duplicate = await self.storage.exists(key)
+        if duplicate:
+            self.originals_deduped += 1
+        else:
+            await self.storage.put(key, data, media_type)
+            self.originals_stored += 1
+        return digest, key, await self.storage.url(key), duplicate
+
+    def submit(self, digest, original_url, data, header, product_id=None):
+        """Programa variantes + registro en el producto; no espera"""
+        task = asyncio.ensure_future(
+            self._process(digest, original_url, data, header, product_id)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _process(self, digest, original_url, data, header, product_id):
+        try:
+            job = self._jobs.get(digest)
+            if job is None:
+                job = asyncio.ensure_future(self._variants(digest, data, header))
+                self._jobs[digest] = job
+                job.add_done_callback(lambda _: self._jobs.pop(digest, None))
+            variantes = await asyncio.shield(job)
+            if product_id:
+                await self._record(product_id, {
+                    "hash": digest, "url": original_url, "variantes": variantes,
+                })
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Variantes de {digest[:12]} fallaron: {e}")
+
+    async def _variant_urls(self, digest):
+        return {
+            name: {
+                image_format: await self.storage.url(variant_key(digest, name, image_format))
+                for image_format in VARIANT_FORMATS
+            }
+            for name in VARIANTS
+        }
+
+    async def _variants(self, digest, data, header):
+        """Genera y sube las variantes si aún no existen; retorna sus URLs"""
+        if await self.storage.exists(_manifest_key(digest)):
+            self.variants_deduped += 1
+            return await self._variant_urls(digest)
+
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        encoded = await loop.run_in_executor(self._executor, render_variants, data, header)
+        self._render_ms += (time.perf_counter() - started) * 1000
+        await asyncio.gather(*(
+            self.storage.put(
+                variant_key(digest, name, image_format), content,
+                VARIANT_FORMATS[image_format][2],
+            )
+            for (name, image_format), content in encoded.items()
+        ))
+        urls = await self._variant_urls(digest)
+        await self.storage.put(
+            _manifest_key(digest), json.dumps(urls).encode(), "application/json"
+        )
+        self.variants_rendered += 1
+        return urls
+
+    async def _record(self, product_id, foto):
+        """Agrega la URL a productos.fotos y sus variantes (atómico; ignora repetidas)"""
+        await get_db().rpc(
+            "append_producto_foto", {"p_producto_id": product_id, "p_foto": foto}
+        ).execute()
+        await response_cache.invalidate("product", product_id)
+
+    async def close(self):
+        """Espera las variantes pendientes y libera el pool"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        return {
+            "storage": PRODUCT_IMAGE_STORAGE,
+            "workers": self._executor._max_workers,
+            "pending": len(self._tasks),
+            "originals_stored": self.originals_stored,
+            "originals_deduped": self.originals_deduped,
+            "variants_rendered": self.variants_rendered,
+            "variants_deduped": self.variants_deduped,
+            "failures": self.failures,
+            "avg_render_ms": (
+                round(self._render_ms / self.variants_rendered, 2)
+                if self.variants_rendered else 0.0
+            ),
+        }
+
+
+def _create_storage():
+    if PRODUCT_IMAGE_STORAGE == "fs":
+        return FileSystemImageStorage()
+    if PRODUCT_IMAGE_STORAGE == "s3":
+        return S3ImageStorage()
+    return SupabaseImageStorage()
+
+
+image_pipeline = ImagePipeline(_create_storage())
@@ -0,0 +1,247 @@
+"""
+Importación masiva de productos (CSV o JSONL) en streaming.
+
+El cuerpo se lee por bloques a medida que llega: cada fila se valida
+contra ProductCreate y las válidas se agrupan en lotes que se insertan o
+actualizan (upsert) por (negocio_id, codigo), con un número acotado de
+lotes en vuelo. Nunca se tiene el archivo completo en memoria: como mucho
+PRODUCT_IMPORT_CONCURRENCY lotes más la fila en curso. Produce eventos de
+progreso, de error por fila y un resumen final. Si un código se repite
+dentro de un lote gana su última fila; las anteriores cuentan como
+duplicadas, no como importadas.
+"""
+import asyncio
+import codecs
+import csv
+import json
+import os
+import time
+
+from postgrest.types import ReturnMethod
+from pydantic import ValidationError
+
+from app.services.response_cache import response_cache
+
+PRODUCT_IMPORT_CHUNK = int(os.getenv("PRODUCT_IMPORT_CHUNK", 1000))
+PRODUCT_IMPORT_CONCURRENCY = int(os.getenv("PRODUCT_IMPORT_CONCURRENCY", 4))
+PRODUCT_IMPORT_MAX_ROWS = int(os.getenv("PRODUCT_IMPORT_MAX_ROWS", 200_000))
+# Errores por fila que se detallan; los siguientes solo se cuentan
+PRODUCT_IMPORT_MAX_ERRORS = int(os.getenv("PRODUCT_IMPORT_MAX_ERRORS", 1000))
+
+IMPORT_FORMATS = ("csv", "jsonl")
+
+
+class ImportAborted(Exception):
+    """El archivo no se puede seguir leyendo (formato o límite de filas)"""
+
+
+def import_format(content_type, formato=None):
+    """Formato explícito o deducido del Content-Type; None si no se reconoce"""
+    if formato:
+        return formato
+    content_type = (content_type or "").lower()
+    if "csv" in content_type:
+        return "csv"
+    if "ndjson" in content_type or "jsonl" in content_type or "json" in content_type:
+        return "jsonl"
+    return None
+
+
+async def _lines(stream):
+    """Líneas de texto (UTF-8, con o sin BOM) de un stream de bytes"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in stream:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def _csv_records(stream):
+    """(número de línea, dict) por registro; la primera línea es la cabecera"""
+    header = None
+    record, start = "", 0
+    line_no = 0
+    async for line in _lines(stream):
+        line_no += 1
+        record = f"{record}\n{line}" if record else line
+        if not record.strip():
+            record = ""
+            continue
+        # Un campo entre comillas puede contener saltos de línea
+        if record.count('"') % 2:
+            start = start or line_no
+            continue
+        values = next(csv.reader([record]))
+        first, start, record = start or line_no, 0, ""
+        if header is None:
+            header = [column.strip().lower() for column in values]
+            continue
+        yield first, dict(zip(header, values))
+    if record:
+        raise ImportAborted(f"Línea {start}: comillas sin cerrar")
+
+
+async def _jsonl_records(stream):
+    line_no = 0
+    async for line in _lines(stream):
+        line_no += 1
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, e
+            continue
+        yield line_no, record if isinstance(record, dict) else ValueError("Se esperaba un objeto")
+
+
+def _clean_csv(record):
+    """Celdas vacías como ausentes y atributos como JSON"""
+    record = {k: v for k, v in record.items() if k and v not in ("", None)}
+    if isinstance(record.get("atributos"), str):
+        record["atributos"] = json.loads(record["atributos"])
+    return record
+
+
+class ProductImport:
+    """Una importación: lee, valida y escribe por lotes"""
+
+    def __init__(self, db, negocio_id, model, to_row,
+                 chunk_size=PRODUCT_IMPORT_CHUNK, concurrency=PRODUCT_IMPORT_CONCURRENCY,
+                 max_rows=PRODUCT_IMPORT_MAX_ROWS, max_errors=PRODUCT_IMPORT_MAX_ERRORS):
+        self.db = db
+        self.negocio_id = negocio_id
+        self.model = model
+        self.to_row = to_row  # ProductCreate -> fila de productos
+        self.chunk_size = chunk_size
+        self.max_rows = max_rows
+        self.max_errors = max_errors
+        self._slots = asyncio.Semaphore(concurrency)
+        self._events = []
+        self.rows = 0
+        self.imported = 0
+        self.duplicates = 0  # filas pisadas por otra con el mismo código en su lote
+        self.errors = 0
+
+    def _error(self, line, messages, codigo=None):
+        self.errors += 1
+        if self.errors <= self.max_errors:
+            self._events.append({
+                "tipo": "error", "fila": line, "codigo": codigo, "errores": messages,
+            })
+
+    def _validate(self, line, record, csv_format):
+        if isinstance(record, Exception):
+            self._error(line, [f"JSON inválido: {record}"])
+            return None
+        try:
+            if csv_format:
+                record = _clean_csv(record)
+            record.setdefault("negocio_id", self.negocio_id)
+            product = self.model(**record)
+        except ValidationError as e:
+            self._error(line, [
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+                for error in e.errors()
+            ], record.get("codigo"))
+            return None
+        except ValueError as e:
+            self._error(line, [f"atributos: {e}"], record.get("codigo"))
+            return None
+        if product.negocio_id != self.negocio_id:
+            self._error(line, ["negocio_id: no corresponde a la importación"], product.codigo)
+            return None
+        if not product.codigo:
+            self._error(line, ["codigo: requerido para importar"])
+            return None
+        return self.to_row(product)
+
+    async def _write(self, chunk):
+        """Upsert de un lote; si falla, todas sus filas cuentan como error"""
+        try:
+            # Última aparición de cada código; orden fijo para no cruzar locks
+            rows = {row["codigo"]: (line, row) for line, row in chunk}
+            ordered = [rows[codigo] for codigo in sorted(rows)]
+            query = self.db.table("productos").upsert(
+                [row for _, row in ordered],
+                on_conflict="negocio_id,codigo",
+                returning=ReturnMethod.representation,
+            )
+            query.params = query.params.add("select", "id")
+            response = await query.execute()
+            self.imported += len(ordered)
+            self.duplicates += len(chunk) - len(ordered)
+            await asyncio.gather(*(
+                response_cache.invalidate("product", row["id"]) for row in response.data or []
+            ))
+        except Exception as e:
+            self.errors += len(chunk)
+            self._events.append({
+                "tipo": "error",
+                "filas": [chunk[0][0], chunk[-1][0]],
+                "errores": [f"No se pudo guardar el lote: {e}"],
+            })
+        finally:
+            self._slots.release()
+        self._events.append(self._progress())
+
+    def _progress(self):
+        return {
+            "tipo": "progreso",
+            "filas": self.rows,
+            "importadas": self.imported,
+            "duplicadas": self.duplicates,
+            "errores": self.errors,
+        }
+
+    async def _submit(self, chunk, tasks):
+        # Espera un lugar libre: así la lectura no se adelanta a la escritura
+        await self._slots.acquire()
+        tasks.add(asyncio.ensure_future(self._write(chunk)))
+        for task in [t for t in tasks if t.done()]:
+            tasks.discard(task)
+
+    def _drain(self):
+        events, self._events = self._events, []
+        return events
+
+    async def run(self, stream, formato):
+        """Generador de eventos (dicts) hasta el resumen final"""
+        started = time.perf_counter()
+        csv_format = formato == "csv"
+        records = _csv_records(stream) if csv_format else _jsonl_records(stream)
+        chunk, tasks = [], set()
+        try:
+            async for line, record in records:
+                self.rows += 1
+                if self.rows > self.max_rows:
+                    raise ImportAborted(f"El archivo supera {self.max_rows} filas")
+                row = self._validate(line, record, csv_format)
+                if row is not None:
+                    chunk.append((line, row))
+                if len(chunk) >= self.chunk_size:
+                    await self._submit(chunk, tasks)
+                    chunk = []
+                for event in self._drain():
+                    yield event
+        except ImportAborted as e:
+            self.rows = min(self.rows, self.max_rows)
+            self._events.append({"tipo": "error", "errores": [str(e)]})
+        if chunk:
+            await self._submit(chunk, tasks)
+        await asyncio.gather(*tasks)
+        for event in self._drain():
+            yield event
+        yield {
+            "tipo": "resumen",
+            "filas": self.rows,
+            "importadas": self.imported,
+            "duplicadas": self.duplicates,
+            "errores": self.errors,
+            "duracion_s": round(time.perf_counter() - started, 3),
+        }
@@ -0,0 +1,222 @@
+"""
+Caché de lecturas por ruta (read-through) con invalidación en escrituras.
+
+Las lecturas que la app móvil consulta en bucle (producto, enlaces del
+negocio, estado de una orden) se guardan por ruta y parámetros con un TTL
+propio por ruta. Las escrituras que pasan por la API invalidan la clave
+afectada; el TTL acota lo que cambie por fuera.
+
+Backend en memoria (LRU del proceso) por defecto. Con
+RESPONSE_CACHE_BACKEND=redis se usa un Redis (o compatible) en
+RESPONSE_CACHE_URL, compartido entre workers; requiere el paquete `redis`.
+Si no se indica backend y hay varios workers (WEB_CONCURRENCY > 1) con
+RESPONSE_CACHE_URL definido, se usa redis. Si el backend falla, la lectura
+va directo a la base.
+
+Importante: el backend en memoria no invalida entre workers. Una escritura
+atendida por un worker borra solo su copia; los demás siguen sirviendo la
+versión anterior hasta que venza el TTL de la ruta. Con varios workers
+usar redis o TTLs cortos.
+"""
+import json
+import logging
+import os
+import time
+
+from app.services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND") or (
+    "redis" if WEB_CONCURRENCY > 1 and os.getenv("RESPONSE_CACHE_URL") else "memory"
+)
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "redis://localhost:6379/0")
+RESPONSE_CACHE_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", 4096))
+RESPONSE_CACHE_MB = int(os.getenv("RESPONSE_CACHE_MB", 64))
+
+# TTL en segundos por ruta
+RESPONSE_CACHE_TTLS = {
+    "product": int(os.getenv("RESPONSE_CACHE_TTL_PRODUCT", 60)),
+    "links": int(os.getenv("RESPONSE_CACHE_TTL_LINKS", 30)),
+    "order": int(os.getenv("RESPONSE_CACHE_TTL_ORDER", 10)),
+}
+
+_KEY_PREFIX = "omnitienda:resp:"
+
+
+class MemoryBackend:
+    """LRU en memoria del proceso, acotada por entradas y bytes"""
+
+    name = "memory"
+
+    def __init__(self, max_entries=RESPONSE_CACHE_ENTRIES, max_mb=RESPONSE_CACHE_MB):
+        self.cache = TTLCache(
+            max_entries=max_entries, max_bytes=max_mb * 1024 * 1024, sizeof=len
+        )
+
+    async def get(self, key):
+        return self.cache.get(key)
+
+    async def set(self, key, value, ttl):
+        self.cache.set(key, value, ttl=ttl)
+
+    async def delete(self, key):
+        self.cache.invalidate(key)
+
+    async def close(self):
+        self.cache.clear()
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class RedisBackend:
+    """Redis o compatible (KeyDB, Valkey, Dragonfly), compartido entre workers"""
+
+    name = "redis"
+
+    def __init__(self, url=RESPONSE_CACHE_URL):
+        import redis.asyncio as redis  # dependencia opcional
+
+        self.client = redis.from_url(url)
+
+    async def get(self, key):
+        return await self.client.get(key)
+
+    async def set(self, key, value, ttl):
+        await self.client.set(key, value, ex=ttl)
+
+    async def delete(self, key):
+        await self.client.delete(key)
+
+    async def close(self):
+        await self.client.close()
+
+    def stats(self):
+        return {}
+
+
+class _RouteStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+        self.age_total = 0.0  # segundos de antigüedad sumados en los aciertos
+        self.age_max = 0.0
+
+    def hit(self, age):
+        self.hits += 1
+        self.age_total += age
+        self.age_max = max(self.age_max, age)
+
+    def snapshot(self, ttl):
+        lookups = self.hits + self.misses
+        return {
+            "ttl": ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            # Antigüedad de lo servido desde caché (cota de desactualización)
+            "avg_age_s": round(self.age_total / self.hits, 3) if self.hits else 0.0,
+            "max_age_s": round(self.age_max, 3),
+        }
+
+
+class ResponseCache:
+    """Lecturas cacheadas por (ruta, parámetros)"""
+
+    def __init__(self, backend, ttls=RESPONSE_CACHE_TTLS):
+        self.backend = backend
+        self.ttls = ttls
+        self._stats = {route: _RouteStats() for route in ttls}
+        # Solo claves con cargas en curso: clave -> [cargas, invalidaciones]
+        self._loading = {}
+
+    @staticmethod
+    def key(route, params):
+        return _KEY_PREFIX + route + ":" + ":".join(str(p) for p in params)
+
+    async def get_or_load(self, route, params, load):
+        """
+        Retorna el valor cacheado o el de `load()`. Los valores None (p.ej.
+        no encontrado) no se guardan.
+        """
+        stats = self._stats[route]
+        key = self.key(route, params)
+        try:
+            cached = await self.backend.get(key)
+        except Exception as e:
+            stats.errors += 1
+            logger.warning(f"Caché de respuestas no disponible: {e}")
+            cached = None
+        if cached is not None:
+            entry = json.loads(cached)
+            stats.hit(max(0.0, time.time() - entry["t"]))
+            return entry["v"]
+
+        stats.misses += 1
+        # Si se invalida mientras load() está en curso, el valor leído puede
+        # ser anterior a la escritura: se retorna pero no se guarda
+        state = self._loading.setdefault(key, [0, 0])
+        state[0] += 1
+        version = state[1]
+        try:
+            value = await load()
+        finally:
+            state[0] -= 1
+            if state[0] == 0:
+                self._loading.pop(key, None)
+        if value is not None and state[1] == version:
+            payload = json.dumps({"t": time.time(), "v": value}, default=str).encode()
+            try:
+                await self.backend.set(key, payload, self.ttls[route])
+            except Exception as e:
+                stats.errors += 1
+                logger.warning(f"No se pudo guardar en la caché de respuestas: {e}")
+        return value
+
+    async def invalidate(self, route, *params):
+        self._stats[route].invalidations += 1
+        key = self.key(route, params)
+        if key in self._loading:
+            self._loading[key][1] += 1
+        try:
+            await self.backend.delete(key)
+        except Exception as e:
+            self._stats[route].errors += 1
+            logger.warning(f"No se pudo invalidar {route}{params}: {e}")
+
+    async def close(self):
+        await self.backend.close()
+
+    def stats(self):
+        return {
+            "backend": self.backend.name,
+            "loads_in_flight": len(self._loading),
+            "routes": {
+                route: stats.snapshot(self.ttls[route])
+                for route, stats in self._stats.items()
+            },
+            **self.backend.stats(),
+        }
+
+
+def _create_backend():
+    if RESPONSE_CACHE_BACKEND == "redis":
+        try:
+            return RedisBackend()
+        except ImportError:
+            if os.getenv("RESPONSE_CACHE_BACKEND"):
+                raise
+            logger.warning(
+                f"WEB_CONCURRENCY={WEB_CONCURRENCY} sin el paquete redis: caché en memoria "
+                "por worker (sin invalidación entre workers)"
+            )
+    return MemoryBackend()
+
+
+response_cache = ResponseCache(_create_backend())
@@ -0,0 +1,94 @@
+"""
+Renderizador de comparación de tallas para el probador AR.
+
+La geometría de todas las tallas se calcula una sola vez desde los
+landmarks; cada variante mezcla solo su región de interés y los JPEG se
+codifican en paralelo (cv2 libera el GIL durante imencode).
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.compositing import blend_color, clip_rect
+from app.services.image_output import OutputOptions, encode_frame
+
+AR_ENCODE_THREADS = int(os.getenv("AR_ENCODE_THREADS", 4))
+
+SIZE_SCALES = {
+    "XS": 0.85,
+    "S": 0.90,
+    "M": 1.0,
+    "L": 1.10,
+    "XL": 1.20,
+    "XXL": 1.30
+}
+
+CLOTHING_COLOR = (100, 200, 255)
+CLOTHING_ALPHA = 0.6
+
+_encode_pool = ThreadPoolExecutor(
+    max_workers=AR_ENCODE_THREADS, thread_name_prefix="ar-encode"
+)
+
+
+def get_scale_by_size(size):
+    """Obtiene escala según talla"""
+    return SIZE_SCALES.get(size, 1.0)
+
+
+def clothing_rect(landmarks, frame_height, frame_width, scale):
+    """Rectángulo (x1, y1, x2, y2) de la prenda centrado en los hombros"""
+    h, w = frame_height, frame_width
+
+    # Centro del cuerpo
+    center_x = int((landmarks[11].x + landmarks[12].x) / 2 * w)
+    center_y = int((landmarks[11].y + landmarks[12].y) / 2 * h)
+
+    # Tamaño base
+    width = int(abs(landmarks[12].x - landmarks[11].x) * w * scale)
+    height = int(abs(landmarks[23].y - landmarks[12].y) * h * scale)
+
+    return (
+        center_x - width // 2,
+        center_y - height // 2,
+        center_x + width // 2,
+        center_y + height // 2,
+    )
+
+
+def _render_chunk(frame, regions, options):
+    """Renderiza varias tallas reutilizando un único canvas"""
+    canvas = frame.copy()
+    encoded = {}
+    for size, region in regions:
+        if region is not None:
+            blend_color(canvas[region], CLOTHING_COLOR, CLOTHING_ALPHA)
+        encoded[size] = encode_frame(canvas, options)
+        # Restaurar solo la región modificada para la siguiente talla
+        if region is not None:
+            canvas[region] = frame[region]
+    return encoded
+
+
+def render_size_comparisons(frame, landmarks, sizes, options=None):
+    """
+    Renderiza la prenda en cada talla y retorna {talla: bytes codificados}.
+    Asigna como máximo un canvas por hilo de codificación.
+    """
+    options = options or OutputOptions()
+    h, w = frame.shape[:2]
+    regions = [
+        (size, clip_rect(clothing_rect(landmarks, h, w, get_scale_by_size(size)), h, w))
+        for size in sizes
+    ]
+
+    n_chunks = max(1, min(AR_ENCODE_THREADS, len(regions)))
+    chunks = [regions[i::n_chunks] for i in range(n_chunks)]
+    futures = [
+        _encode_pool.submit(_render_chunk, frame, chunk, options) for chunk in chunks
+    ]
+
+    encoded = {}
+    for future in futures:
+        encoded.update(future.result())
+    # Mantener el orden solicitado
+    return {size: encoded[size] for size, _ in regions}
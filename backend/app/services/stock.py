@@ -0,0 +1,127 @@
+"""
+Motor de stock: descuento en ventas y reservas del marketplace.
+
+Todo el control de concurrencia vive en la base (add_stock_reservations.sql):
+cada venta descuenta todos sus items en una transacción, con las filas
+bloqueadas en orden de id y `stock_actual >= cantidad` en la misma
+sentencia, así no hay sobreventa ni deadlocks aunque muchos checkouts
+compitan por el mismo producto. Aquí solo se traducen los faltantes a una
+excepción y se liberan periódicamente las reservas vencidas del
+marketplace (órdenes que nadie confirmó).
+"""
+import asyncio
+import logging
+import os
+
+from app.services.database import get_db
+from app.services.response_cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+# Minutos que una orden del marketplace retiene el stock sin confirmarse
+STOCK_RESERVATION_MINUTES = int(os.getenv("STOCK_RESERVATION_MINUTES", 30))
+STOCK_RESERVATION_SWEEP_INTERVAL = float(os.getenv("STOCK_RESERVATION_SWEEP_INTERVAL", 60))
+STOCK_RESERVATION_SWEEP_BATCH = int(os.getenv("STOCK_RESERVATION_SWEEP_BATCH", 500))
+
+
+class StockShortage(Exception):
+    """Algún item no tiene stock suficiente; no se descontó nada"""
+
+    def __init__(self, faltantes):
+        super().__init__("Stock insuficiente")
+        self.faltantes = faltantes  # [{producto_id, solicitado, disponible}]
+
+
+async def register_sale(db, venta):
+    """
+    Descuenta el stock de los items y crea la venta, todo o nada.
+    Retorna la fila creada o lanza StockShortage.
+    """
+    response = await db.rpc("registrar_venta", {"p_venta": venta}).execute()
+    result = response.data
+    if not result.get("ok"):
+        raise StockShortage(result.get("faltantes") or [])
+    return result["venta"]
+
+
+async def register_sync_sales(db, ventas):
+    """
+    Inserta ventas offline (ignora ids existentes) y descuenta su stock en
+    una transacción; no rechaza por falta de stock. Retorna (ids creados,
+    faltantes por id de venta).
+    """
+    response = await db.rpc("registrar_ventas_sync", {"p_ventas": ventas}).execute()
+    faltantes = {}
+    for faltante in response.data["faltantes"]:
+        faltantes.setdefault(faltante.pop("id"), []).append(faltante)
+    return set(response.data["creadas"]), faltantes
+
+
+class ReservationSweeper:
+    """Libera cada cierto tiempo las reservas vencidas (tarea de fondo)"""
+
+    def __init__(self, release, interval=STOCK_RESERVATION_SWEEP_INTERVAL,
+                 batch=STOCK_RESERVATION_SWEEP_BATCH):
+        # release(limite) -> órdenes liberadas
+        self._release = release
+        self.interval = interval
+        self.batch = batch
+        self._task = None
+        self.sweeps = 0
+        self.released = 0
+        self.failures = 0
+
+    async def sweep(self):
+        """Libera vencidas por lotes hasta que no quede ninguna"""
+        try:
+            while True:
+                released = await self._release(self.batch)
+                self.released += released
+                if released < self.batch:
+                    break
+            self.sweeps += 1
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"No se pudieron liberar reservas vencidas: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.sweep()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "reservation_minutes": STOCK_RESERVATION_MINUTES,
+            "sweep_interval": self.interval,
+            "sweeps": self.sweeps,
+            "released": self.released,
+            "failures": self.failures,
+        }
+
+
+async def release_expired(limit):
+    """Una pasada en la base; varios workers pueden llamarla a la vez"""
+    response = await get_db().rpc(
+        "liberar_reservas_vencidas", {"p_limite": limit}
+    ).execute()
+    # Órdenes canceladas: su estado cacheado ya no vale
+    orden_ids = response.data or []
+    for orden_id in orden_ids:
+        await response_cache.invalidate("order", orden_id)
+    return len(orden_ids)
+
+
+reservation_sweeper = ReservationSweeper(release_expired)
@@ -0,0 +1,123 @@
+"""
+Vitrina pública del marketplace (/marketplace/access/{codigo}).
+
+El enlace, la cabecera del negocio y los productos activos se resuelven en
+una sola llamada a la base (RPC `marketplace_storefront`). La respuesta se
+serializa una vez y se cachea por código con un ETag débil, así los
+clientes que revalidan reciben 304 sin tocar la base. Las cargas
+concurrentes del mismo código (ráfagas al publicar el QR) se deduplican.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+from app.services.cache import TTLCache
+
+MARKETPLACE_STOREFRONT_TTL = int(os.getenv("MARKETPLACE_STOREFRONT_TTL", 60))
+MARKETPLACE_STOREFRONT_ENTRIES = int(os.getenv("MARKETPLACE_STOREFRONT_ENTRIES", 2048))
+
+# Códigos inexistentes o inactivos (caché negativa corta)
+_NOT_FOUND = object()
+_NOT_FOUND_TTL = 15
+
+# head: JSON serializado hasta el valor de "visitas" (lo único que cambia por visita)
+Storefront = namedtuple(
+    "Storefront", ["head", "etag", "link_id", "negocio_id", "productos", "visitas"]
+)
+
+
+def storefront_etag(data):
+    """ETag débil del contenido; las visitas no cuentan como cambio"""
+    content = {k: v for k, v in data["link"].items() if k != "visitas"}
+    canonical = json.dumps(
+        [content, data["negocio"], data["productos"]],
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    return f'W/"{hashlib.blake2b(canonical.encode(), digest_size=12).hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Compara If-None-Match (lista o *) con el ETag, en forma débil"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def build_storefront(data):
+    """Arma la respuesta pública a partir del resultado del RPC"""
+    link = data["link"]
+    productos = data["productos"]
+    body = json.dumps({
+        "success": True,
+        "marketplace": {
+            "nombre": link["nombre"],
+            "descripcion": link["descripcion"],
+            "negocio": data["negocio"],
+            "productos": productos,
+            "total_productos": len(productos),
+            "visitas": 0,
+        },
+    }, ensure_ascii=False, default=str).encode()
+    # "visitas" es la última clave: se guarda todo lo anterior a su valor
+    head = body[:-len(b"0}}")]
+    return Storefront(
+        head, storefront_etag(data), link["id"], link["negocio_id"], productos,
+        link["visitas"] or 0,
+    )
+
+
+def storefront_body(storefront, visitas):
+    """Cuerpo JSON de la vitrina con el conteo de visitas actual"""
+    return storefront.head + str(int(visitas)).encode() + b"}}"
+
+
+class StorefrontCache:
+    """Vitrinas serializadas por código, con cargas deduplicadas"""
+
+    def __init__(self, max_entries=MARKETPLACE_STOREFRONT_ENTRIES, ttl=MARKETPLACE_STOREFRONT_TTL):
+        self.cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._loads = {}  # codigo -> asyncio.Task en curso
+
+    async def get(self, codigo, load):
+        """
+        Retorna (Storefront o None, cargada_por_esta_petición). `load(codigo)`
+        llama al RPC y solo se usa en fallos de caché.
+        """
+        cached = self.cache.get(codigo)
+        if cached is not None:
+            return (None if cached is _NOT_FOUND else cached), False
+
+        task = self._loads.get(codigo)
+        created = task is None
+        if created:
+            task = asyncio.ensure_future(self._load(codigo, load))
+            self._loads[codigo] = task
+            task.add_done_callback(lambda _: self._loads.pop(codigo, None))
+        storefront = await asyncio.shield(task)
+        return storefront, created
+
+    async def _load(self, codigo, load):
+        data = await load(codigo)
+        if not data:
+            self.cache.set(codigo, _NOT_FOUND, ttl=_NOT_FOUND_TTL)
+            return None
+        storefront = build_storefront(data)
+        self.cache.set(codigo, storefront)
+        return storefront
+
+    def invalidate(self, codigo):
+        self.cache.invalidate(codigo)
+
+    def stats(self):
+        return {**self.cache.stats(), "loads_in_flight": len(self._loads)}
+
+
+storefront_cache = StorefrontCache()
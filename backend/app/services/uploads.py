@@ -0,0 +1,250 @@
+"""
+Lectura acotada de imágenes subidas (probador AR y fotos de productos).
+
+Starlette deja el archivo en un SpooledTemporaryFile (en disco pasado 1 MB);
+aquí se valida antes de traerlo a memoria: tamaño declarado, firma del
+formato en los primeros bytes y dimensiones desde la cabecera (sin
+decodificar). Luego se copia por bloques a un único buffer, cortando apenas
+se supera el límite, y se entrega como memoryview para que el decodificador
+no vuelva a copiar.
+
+UploadLimitMiddleware corta antes: rechaza cuerpos multipart que superan el
+límite mientras llegan, sin esperar a que Starlette termine el spool.
+"""
+import io
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image
+from starlette.responses import JSONResponse
+
+from app.services.image_input import read_header
+from app.services.model_registry import rss_bytes
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_MB", 15)) * 1024 * 1024
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_MEGAPIXELS", 40)) * 1000 * 1000
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Margen para los demás campos y separadores del multipart
+_FORM_OVERHEAD = 64 * 1024
+
+FORMATS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+}
+
+
+class UploadRejected(Exception):
+    """La subida no es una imagen aceptable; lleva el código HTTP a usar"""
+
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+
+
+def sniff_image_type(head):
+    """Tipo MIME según la firma de los primeros bytes (None si no es imagen)"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+class ImageUpload:
+    """Imagen validada: bytes (memoryview) + datos de cabecera"""
+
+    def __init__(self, data, media_type, width, height, orientation):
+        self.data = data
+        self.media_type = media_type
+        self.width = width
+        self.height = height
+        self.orientation = orientation
+
+    @property
+    def size(self):
+        return self.data.nbytes
+
+    @property
+    def extension(self):
+        return FORMATS[self.media_type]
+
+    @property
+    def header(self):
+        return self.width, self.height, self.orientation
+
+
+def checked_header(fp, max_pixels=UPLOAD_MAX_PIXELS):
+    """(ancho, alto, orientación) desde la cabecera; UploadRejected si excede"""
+    try:
+        width, height, orientation = read_header(fp)
+    except Image.DecompressionBombError:
+        # Pillow corta antes de nuestro límite cuando la cabecera declara
+        # más del doble de Image.MAX_IMAGE_PIXELS
+        raise UploadRejected(413, f"La imagen supera {max_pixels // 1000000} MP")
+    if width is None:
+        raise UploadRejected(415, "Imagen inválida")
+    if width * height > max_pixels:
+        raise UploadRejected(413, f"La imagen supera {max_pixels // 1000000} MP")
+    return width, height, orientation
+
+
+def check_image_bytes(data, max_bytes=UPLOAD_MAX_BYTES, max_pixels=UPLOAD_MAX_PIXELS):
+    """
+    Mismos límites que read_image_upload para bytes ya en memoria (frames
+    del WebSocket, texturas descargadas). Retorna la cabecera o lanza
+    UploadRejected.
+    """
+    if len(data) > max_bytes:
+        raise UploadRejected(413, f"La imagen supera {max_bytes // (1024 * 1024)} MB")
+    if sniff_image_type(bytes(data[:16])) is None:
+        raise UploadRejected(415, "Formato no soportado (usa JPEG, PNG o WebP)")
+    return checked_header(io.BytesIO(data), max_pixels)
+
+
+async def read_image_upload(upload, max_bytes=UPLOAD_MAX_BYTES, max_pixels=UPLOAD_MAX_PIXELS):
+    """Valida y lee una subida; lanza UploadRejected (413/415)"""
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadRejected(413, f"La imagen supera {max_bytes // (1024 * 1024)} MB")
+
+    await upload.seek(0)
+    head = await upload.read(UPLOAD_CHUNK_SIZE)
+    media_type = sniff_image_type(head)
+    if media_type is None:
+        raise UploadRejected(415, "Formato no soportado (usa JPEG, PNG o WebP)")
+
+    # Dimensiones desde la cabecera del archivo en spool, antes de leerlo entero
+    await upload.seek(0)
+    width, height, orientation = await run_in_threadpool(checked_header, upload.file, max_pixels)
+
+    # Un solo buffer; si el tamaño se conoce se reserva de una vez
+    buffer = bytearray(upload.size or 0)
+    total = 0
+    await upload.seek(0)
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if total + len(chunk) > max_bytes:
+            raise UploadRejected(413, f"La imagen supera {max_bytes // (1024 * 1024)} MB")
+        buffer[total:total + len(chunk)] = chunk
+        total += len(chunk)
+
+    return ImageUpload(memoryview(buffer)[:total], media_type, width, height, orientation)
+
+
+class UploadStats:
+    """Subidas en curso y memoria residente que agregó cada una"""
+
+    def __init__(self, window=256):
+        self.in_flight = 0
+        self.in_flight_bytes = 0
+        self.accepted = 0
+        self.rejected = {}
+        self._peaks = deque(maxlen=window)
+
+    def record(self, peak_rss):
+        if peak_rss is not None:
+            self._peaks.append(peak_rss)
+
+    def stats(self):
+        peaks = list(self._peaks)
+        return {
+            "in_flight": self.in_flight,
+            "in_flight_bytes": self.in_flight_bytes,
+            "accepted": self.accepted,
+            "rejected": dict(self.rejected),
+            "max_bytes": UPLOAD_MAX_BYTES,
+            "max_pixels": UPLOAD_MAX_PIXELS,
+            "peak_rss_bytes_max": max(peaks) if peaks else None,
+            "peak_rss_bytes_avg": round(sum(peaks) / len(peaks)) if peaks else None,
+        }
+
+
+upload_stats = UploadStats()
+
+
+@asynccontextmanager
+async def image_upload(upload, max_bytes=UPLOAD_MAX_BYTES, max_pixels=UPLOAD_MAX_PIXELS):
+    """
+    Contexto de una subida en curso: la valida y lee, y al salir registra
+    cuánto creció la memoria residente mientras se procesaba (aproximado:
+    con subidas concurrentes el RSS es del proceso completo).
+    """
+    rss_start = rss_bytes()
+    samples = []
+    upload_stats.in_flight += 1
+    image = None
+    try:
+        try:
+            image = await read_image_upload(upload, max_bytes, max_pixels)
+        except UploadRejected as e:
+            upload_stats.rejected[e.status_code] = upload_stats.rejected.get(e.status_code, 0) + 1
+            raise
+        upload_stats.accepted += 1
+        upload_stats.in_flight_bytes += image.size
+        samples.append(rss_bytes())
+        yield image
+    finally:
+        samples.append(rss_bytes())
+        upload_stats.in_flight -= 1
+        if image is not None:
+            upload_stats.in_flight_bytes -= image.size
+        if rss_start is not None and None not in samples:
+            upload_stats.record(max(max(samples) - rss_start, 0))
+
+
+class UploadLimitMiddleware:
+    """Middleware ASGI: 413 para cuerpos multipart más grandes que el límite"""
+
+    def __init__(self, app, max_body=UPLOAD_MAX_BYTES + _FORM_OVERHEAD):
+        self.app = app
+        self.max_body = max_body
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            return await self.app(scope, receive, send)
+
+        too_large = JSONResponse(
+            {"detail": f"La subida supera {self.max_body // (1024 * 1024)} MB"},
+            status_code=413,
+        )
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_body:
+            upload_stats.rejected[413] = upload_stats.rejected.get(413, 0) + 1
+            return await too_large(scope, receive, send)
+
+        # Sin Content-Length (chunked): contar mientras llega y cortar al pasarse
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    exceeded = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        response_started = False
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded:
+                return
+            response_started = True
+            await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+        if exceeded and not response_started:
+            upload_stats.rejected[413] = upload_stats.rejected.get(413, 0) + 1
+            await too_large(scope, receive, send)
@@ -0,0 +1,116 @@
+"""
+Contador de visitas del marketplace con escritura diferida.
+
+Cada visita solo suma en memoria por código; una tarea de fondo vacía los
+acumulados cada MARKETPLACE_VISITS_FLUSH_INTERVAL segundos con un único RPC
+que hace incrementos atómicos en la base (`visitas = visitas + n`), así no
+hay carreras de leer-modificar-escribir y mil visitas cuestan una escritura.
+Si un vaciado falla, los conteos vuelven a quedar pendientes. Al apagar la
+app se vacía lo pendiente.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter
+
+from app.services.cache import TTLCache
+from app.services.database import get_db
+
+logger = logging.getLogger(__name__)
+
+MARKETPLACE_VISITS_FLUSH_INTERVAL = float(os.getenv("MARKETPLACE_VISITS_FLUSH_INTERVAL", 5))
+# Códigos con total conocido que se recuerdan (LRU); el resto se relee de la base
+MARKETPLACE_VISITS_TRACKED = int(os.getenv("MARKETPLACE_VISITS_TRACKED", 10000))
+
+
+class VisitCounter:
+    """Acumula visitas por código y las escribe por lotes"""
+
+    def __init__(self, write, interval=MARKETPLACE_VISITS_FLUSH_INTERVAL,
+                 tracked=MARKETPLACE_VISITS_TRACKED):
+        # write({codigo: n}) -> {codigo: visitas_totales}
+        self._write = write
+        self.interval = interval
+        self._pending = Counter()
+        # Último total conocido en la base por código
+        self._totals = TTLCache(max_entries=tracked, ttl=3600)
+        self._task = None
+        self._flush_lock = asyncio.Lock()
+        self.visits = 0
+        self.flushed = 0
+        self.writes = 0
+        self.failures = 0
+
+    def add(self, codigo, count=1):
+        self._pending[codigo] += count
+        self.visits += count
+
+    def observe(self, codigo, visitas):
+        """Registra un total leído de la base (p.ej. al cargar la vitrina)"""
+        if visitas is not None and visitas > self._totals.peek(codigo, -1):
+            self._totals.set(codigo, visitas)
+
+    def current(self, codigo, visitas=0):
+        """Visitas aproximadas: último total conocido + lo aún no escrito"""
+        return max(self._totals.peek(codigo, 0), visitas or 0) + self._pending[codigo]
+
+    async def flush(self):
+        """Escribe los acumulados; si falla, vuelven a quedar pendientes"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, Counter()
+            try:
+                totals = await self._write(dict(batch))
+            except Exception as e:
+                self._pending.update(batch)
+                self.failures += 1
+                logger.warning(f"No se pudieron escribir {sum(batch.values())} visitas: {e}")
+                return
+            self.writes += 1
+            self.flushed += sum(batch.values())
+            for codigo, visitas in (totals or {}).items():
+                self.observe(codigo, visitas)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Detiene la tarea periódica y vacía lo pendiente"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            "visits": self.visits,
+            "flushed": self.flushed,
+            "pending": sum(self._pending.values()),
+            "pending_links": len(self._pending),
+            "writes": self.writes,
+            "failures": self.failures,
+            "flush_interval": self.interval,
+            "tracked_links": len(self._totals),
+        }
+
+
+async def write_visits(batch):
+    """Incrementos atómicos de todos los códigos en una sola llamada (RPC)"""
+    response = await get_db().rpc(
+        "increment_marketplace_visits_batch", {"p_visitas": batch}
+    ).execute()
+    return {row["codigo"]: row["visitas"] for row in response.data or []}
+
+
+visit_counter = VisitCounter(write_visits)
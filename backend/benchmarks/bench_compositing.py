@@ -0,0 +1,84 @@
+"""
+Micro-benchmark del motor de composición: costo por frame según resolución.
+
+Compara el overlay original (copia completa + addWeighted sobre todo el
+frame, dos veces para full_body) con la composición por ROI.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_compositing --repeat 50
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from app.services.compositing import composite, solid_layer, texture_layer
+
+RESOLUTIONS = {
+    "480p": (480, 640),
+    "720p": (720, 1280),
+    "1080p": (1080, 1920),
+    "12MP": (3024, 4032),
+}
+
+
+def torso_rects(h, w):
+    """Rectángulos de torso y piernas típicos de una foto de cuerpo entero"""
+    top = (int(0.40 * w), int(0.30 * h), int(0.60 * w), int(0.62 * h))
+    bottom = (int(0.43 * w), int(0.62 * h), int(0.57 * w), int(0.92 * h))
+    return top, bottom
+
+
+def legacy_full_body(frame, top, bottom):
+    """Implementación previa: dos copias completas y dos mezclas completas"""
+    for rect, color in ((top, (100, 200, 255)), (bottom, (80, 100, 200))):
+        overlay = frame.copy()
+        cv2.rectangle(overlay, rect[:2], rect[2:], color, -1)
+        cv2.addWeighted(overlay, 0.6, frame, 0.4, 0, frame)
+    return frame
+
+
+def timed(fn, frame, repeat):
+    samples = []
+    for _ in range(repeat):
+        work = frame.copy()
+        start = time.perf_counter()
+        fn(work)
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=30)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    texture = rng.integers(0, 255, (512, 384, 4), dtype=np.uint8)
+
+    print(f"{'resolución':>10} {'legacy ms':>10} {'roi ms':>8} {'textura ms':>11} {'speedup':>8}")
+    for name, (h, w) in RESOLUTIONS.items():
+        frame = rng.integers(0, 255, (h, w, 3), dtype=np.uint8)
+        top, bottom = torso_rects(h, w)
+        layers = [
+            solid_layer(top, (100, 200, 255), 0.6),
+            solid_layer(bottom, (80, 100, 200), 0.6),
+        ]
+
+        reference = legacy_full_body(frame.copy(), top, bottom)
+        assert np.array_equal(reference, composite(frame.copy(), layers))
+
+        legacy_ms = timed(lambda f: legacy_full_body(f, top, bottom), frame, args.repeat)
+        roi_ms = timed(lambda f: composite(f, layers), frame, args.repeat)
+        texture_ms = timed(
+            lambda f: composite(f, [texture_layer(top, texture)]), frame, args.repeat
+        )
+        print(
+            f"{name:>10} {legacy_ms:>10.2f} {roi_ms:>8.2f} {texture_ms:>11.2f} "
+            f"{legacy_ms / roi_ms:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark de la cola de emails contra un servidor SMTP local (aiosmtpd).
+
+Compara el envío anterior (una conexión SMTP nueva por email, en serie)
+con la cola: POST /notifications/email/batch responde 202 y los
+remitentes de fondo envían por conexiones persistentes. El servidor
+local agrega latencia por conexión (saludo/STARTTLS/login de un proveedor
+real) y por mensaje, y puede rechazar temporalmente uno de cada N
+mensajes (451) para ejercitar los reintentos. Mide emails por segundo.
+
+Requiere aiosmtpd (pip install aiosmtpd).
+
+Uso (desde backend/):
+    python -m benchmarks.bench_email_queue --emails 1000
+    python -m benchmarks.bench_email_queue --emails 1000 --senders 4 --connect-ms 300 --fail-every 50
+"""
+import argparse
+import asyncio
+import os
+import smtplib
+import socket
+import threading
+import time
+
+import httpx
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import SMTP as SMTPProtocol
+from fastapi import FastAPI
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StandIn:
+    """Handler de aiosmtpd: cuenta mensajes y simula latencia y rechazos"""
+
+    def __init__(self, connect_latency, message_latency, fail_every):
+        self.connect_latency = connect_latency
+        self.message_latency = message_latency
+        self.fail_every = fail_every
+        self.connections = 0
+        self.received = 0
+        self.rejected = 0
+        self._seen = 0
+        self._lock = threading.Lock()
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        # El saludo cuesta como un handshake real (TLS + login)
+        self.connections += 1
+        await asyncio.sleep(self.connect_latency)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.message_latency)
+        with self._lock:
+            self._seen += 1
+            if self.fail_every and self._seen % self.fail_every == 0:
+                self.rejected += 1
+                return "451 Intente más tarde"
+            self.received += 1
+        return "250 OK"
+
+
+class BenchController(Controller):
+    def factory(self):
+        return SMTPProtocol(self.handler, enable_SMTPUTF8=True)
+
+
+def naive_send(port, count):
+    """Envío anterior: conexión nueva por email, en serie"""
+    from app.services.email_queue import EmailJob
+
+    for i in range(count):
+        job = EmailJob(f"cliente{i}@example.com", "Tu pedido", "Cliente", "Orden confirmada")
+        with smtplib.SMTP("127.0.0.1", port) as server:
+            server.sendmail("notificaciones@omnitienda.pe", [job.to], job.message("notificaciones@omnitienda.pe"))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--emails", type=int, default=1000)
+    parser.add_argument("--senders", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--connect-ms", type=float, default=200)
+    parser.add_argument("--message-ms", type=float, default=2)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--naive", type=int, default=20, help="emails para medir el envío anterior")
+    args = parser.parse_args()
+
+    port = free_port()
+    handler = StandIn(args.connect_ms / 1000, args.message_ms / 1000, args.fail_every)
+    controller = BenchController(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    os.environ.update({
+        "SMTP_SERVER": "127.0.0.1", "SMTP_PORT": str(port),
+        "SMTP_STARTTLS": "False", "EMAIL_PASSWORD": "",
+        "EMAIL_RETRY_BASE": "0.05",
+    })
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+    os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+    from app.routes import notifications_routes
+    from app.services import email_queue as module
+
+    if args.naive:
+        started = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(None, naive_send, port, args.naive)
+        naive_rate = args.naive / (time.perf_counter() - started)
+        print(f"envío anterior: {naive_rate:,.1f} emails/s ({args.naive} emails, conexión por email)")
+        handler.received = handler.connections = 0
+
+    dead = []
+
+    async def store(records):
+        dead.extend(records)
+
+    queue = module.EmailQueue(
+        dead_letter=store, senders=args.senders, batch_size=args.batch_size,
+        max_size=args.emails, retry_base=0.05,
+    )
+    module.email_queue = notifications_routes.email_queue = queue
+    app = FastAPI()
+    app.include_router(notifications_routes.router, prefix="/api/v1/notifications")
+    queue.start()
+
+    notifications = [
+        {"to": f"cliente{i}@example.com", "subject": f"Orden #{i} confirmada",
+         "nombre": "Cliente", "message": "Tu orden fue confirmada. Gracias por tu compra."}
+        for i in range(args.emails)
+    ]
+    started = time.perf_counter()
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench"
+    ) as client:
+        for i in range(0, args.emails, notifications_routes.EMAIL_BATCH_MAX_ITEMS):
+            response = await client.post("/api/v1/notifications/email/batch", json={
+                "notifications": notifications[i:i + notifications_routes.EMAIL_BATCH_MAX_ITEMS]
+            })
+            assert response.status_code == 202, response.text
+    accepted = time.perf_counter() - started
+    await queue.stop(timeout=120)
+    elapsed = time.perf_counter() - started
+    controller.stop()
+
+    stats = queue.stats()
+    print(f"cola: {args.emails} emails aceptados (202) en {accepted * 1000:.0f} ms; "
+          f"enviados en {elapsed:.2f}s -> {stats['sent'] / elapsed:,.1f} emails/s")
+    print(f"conexiones SMTP abiertas: {handler.connections}; recibidos: {handler.received}; "
+          f"rechazos temporales: {handler.rejected}; reintentos: {stats['retries']}; "
+          f"dead letter: {len(dead)}; ms por lote: {stats['avg_batch_ms']}")
+    if stats["sent"] + len(dead) != args.emails:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""
+Benchmark de sesiones en vivo del probador AR (/mirror/live).
+
+Alimenta LiveSession con un WebSocket simulado que envía frames JPEG a
+`--input-fps` y mide los fps efectivamente procesados y los descartados.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_live_session --image foto.jpg --sessions 2
+"""
+import argparse
+import asyncio
+import time
+
+import cv2
+import numpy as np
+from starlette.websockets import WebSocketState
+
+from app.services.compositing import blend_color, clip_rect
+from app.services.image_output import OutputOptions, encode_frame
+from app.services.live_session import LiveSessionManager
+from app.services.size_comparison import clothing_rect
+
+
+class FakeWebSocket:
+    def __init__(self, frame_bytes, input_fps, seconds):
+        self.frame_bytes = frame_bytes
+        self.interval = 1 / input_fps
+        self.deadline = time.monotonic() + seconds
+        self.client_state = WebSocketState.CONNECTED
+        self.sent = 0
+
+    async def receive(self):
+        await asyncio.sleep(self.interval)
+        if time.monotonic() > self.deadline:
+            return {"type": "websocket.disconnect"}
+        return {"type": "websocket.receive", "bytes": self.frame_bytes}
+
+    async def send_bytes(self, data):
+        self.sent += 1
+
+    async def send_json(self, data):
+        self.sent += 1
+
+    async def close(self, code=1000, reason=None):
+        self.client_state = WebSocketState.DISCONNECTED
+
+
+def handle_frame(frame, landmarks):
+    options = OutputOptions(mode="image", quality=70, max_side=0)
+    if not landmarks:
+        return {"pose": False}
+    h, w = frame.shape[:2]
+    region = clip_rect(clothing_rect(landmarks, h, w, 1.0), h, w)
+    if region is not None:
+        blend_color(frame[region], (100, 200, 255), 0.6)
+    return encode_frame(frame, options)
+
+
+async def run(args, frame_bytes):
+    manager = LiveSessionManager(max_sessions=args.sessions)
+    sockets = [
+        FakeWebSocket(frame_bytes, args.input_fps, args.seconds)
+        for _ in range(args.sessions)
+    ]
+    started = time.monotonic()
+    await asyncio.gather(*(manager.serve(ws, handle_frame) for ws in sockets))
+    elapsed = time.monotonic() - started
+    stats = manager.stats()
+    per_session = stats["processed"] / args.sessions / elapsed
+    print(f"sesiones={args.sessions} entrada={args.input_fps} fps")
+    print(f"procesados={stats['processed']} descartados={stats['dropped']}")
+    print(f"fps por sesión={per_session:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--image", help="Foto con una persona (JPEG/PNG)")
+    parser.add_argument("--sessions", type=int, default=1)
+    parser.add_argument("--input-fps", type=float, default=30)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    if args.image:
+        frame = cv2.imread(args.image)
+    else:
+        frame = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    frame_bytes = cv2.imencode(".jpg", frame)[1].tobytes()
+    asyncio.run(run(args, frame_bytes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Benchmark de la importación masiva de productos (/products/import).
+
+Genera un CSV o JSONL sintético al vuelo (nunca completo en memoria) y lo
+envía en streaming a la app en proceso. Por defecto la base es un doble
+local de PostgREST (servidor HTTP real con latencia configurable que aplica
+los upserts en memoria); con --supabase-url se usa una base real con
+add_product_import.sql aplicada.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_product_import --rows 100000
+    python -m benchmarks.bench_product_import --rows 100000 --format jsonl --latency-ms 30
+    python -m benchmarks.bench_product_import --supabase-url http://localhost:54321 --negocio-id <uuid>
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import threading
+import time
+import uuid
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StandIn:
+    """PostgREST mínimo: POST /rest/v1/productos con upsert por (negocio_id, codigo)"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.rows = {}
+        self.requests = 0
+        self.app = Starlette(routes=[
+            Route("/rest/v1/productos", self.upsert, methods=["POST"]),
+        ])
+
+    async def upsert(self, request: Request):
+        self.requests += 1
+        if request.query_params.get("on_conflict") != "negocio_id,codigo":
+            return Response(status_code=400)
+        written = []
+        for row in json.loads(await request.body()):
+            key = (row["negocio_id"], row["codigo"])
+            row["id"] = self.rows[key]["id"] if key in self.rows else str(uuid.uuid4())
+            self.rows[key] = row
+            written.append({"id": row["id"]})
+        await asyncio.sleep(self.latency)
+        if "return=minimal" in request.headers.get("prefer", ""):
+            return Response(status_code=201)
+        return Response(json.dumps(written), status_code=201, media_type="application/json")
+
+    def serve(self, port):
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning")
+        server = uvicorn.Server(config)
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.05)
+
+
+def synthetic_rows(negocio_id, count, formato, invalid_every):
+    """Filas generadas una a una; cada `invalid_every` una con precio inválido"""
+    if formato == "csv":
+        yield "codigo,nombre,descripcion,categoria,precio_compra,precio_venta,stock,atributos\n"
+    for i in range(count):
+        precio = "no-es-precio" if invalid_every and i % invalid_every == 0 else f"{1 + i % 90}.50"
+        if formato == "csv":
+            yield (
+                f'SKU{i:07d},"Producto {i}, mayorista","Caja x {i % 24 + 1}",'
+                f'Abarrotes,{precio},{precio},{i % 500},"{{""lote"": ""L{i % 97}""}}"\n'
+            )
+        else:
+            yield json.dumps({
+                "codigo": f"SKU{i:07d}", "nombre": f"Producto {i}", "descripcion": "",
+                "categoria": "Abarrotes", "precio_compra": precio, "precio_venta": precio,
+                "stock": i % 500, "negocio_id": negocio_id, "atributos": {"lote": f"L{i % 97}"},
+            }) + "\n"
+
+
+async def body(negocio_id, count, formato, invalid_every, block=64 * 1024):
+    buffer = []
+    size = 0
+    for line in synthetic_rows(negocio_id, count, formato, invalid_every):
+        buffer.append(line)
+        size += len(line)
+        if size >= block:
+            yield "".join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--format", default="csv", choices=["csv", "jsonl"])
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--invalid-every", type=int, default=1000)
+    parser.add_argument("--supabase-url")
+    parser.add_argument("--negocio-id", default=str(uuid.uuid4()))
+    args = parser.parse_args()
+
+    stand_in = None
+    if args.supabase_url:
+        os.environ["SUPABASE_URL"] = args.supabase_url
+    else:
+        port = free_port()
+        stand_in = StandIn(args.latency_ms / 1000)
+        stand_in.serve(port)
+        os.environ["SUPABASE_URL"] = f"http://127.0.0.1:{port}"
+        os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+    from app.routes import products_routes
+    from app.services.database import close_db, init_db
+
+    db = init_db()
+    app = FastAPI()
+    app.include_router(products_routes.router, prefix="/api/v1/products")
+
+    media_type = "text/csv" if args.format == "csv" else "application/x-ndjson"
+    started = time.perf_counter()
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None
+    ) as client:
+        response = await client.post(
+            f"/api/v1/products/import/{args.negocio_id}",
+            content=body(args.negocio_id, args.rows, args.format, args.invalid_every),
+            headers={"content-type": media_type},
+        )
+    elapsed = time.perf_counter() - started
+    await close_db()
+
+    events = [json.loads(line) for line in response.text.splitlines()]
+    summary = events[-1]
+    progress = sum(1 for e in events if e["tipo"] == "progreso")
+    row_errors = sum(1 for e in events if e["tipo"] == "error")
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print(f"{args.rows} filas {args.format} en {elapsed:.1f}s ({args.rows / elapsed:,.0f} filas/s)")
+    print(f"resumen: {summary}")
+    print(f"eventos: {progress} de progreso, {row_errors} de error; "
+          f"peticiones a la base: {db.requests}; RSS pico {peak_mb:.0f} MB")
+    if stand_in:
+        print(f"productos en el doble de PostgREST: {len(stand_in.rows)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
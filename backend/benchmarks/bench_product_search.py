@@ -0,0 +1,119 @@
+"""
+Benchmark de la búsqueda de productos (RPC search_productos).
+
+Siembra N productos sintéticos para un negocio y lanza búsquedas
+concurrentes de distintos tipos (primeras teclas del type-ahead, prefijo,
+palabra completa, error de tipeo, código exacto) contra la base configurada en
+SUPABASE_URL/SUPABASE_KEY, con la migración add_product_search.sql
+aplicada. Reporta p50/p95 por tipo de búsqueda.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_product_search --negocio-id <uuid> --products 200000
+    python -m benchmarks.bench_product_search --negocio-id <uuid> --skip-seed
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from app.services.database import close_db, init_db
+
+NOMBRES = [
+    "Arroz", "Azúcar", "Aceite", "Leche", "Fideos", "Atún", "Galletas",
+    "Café", "Chocolate", "Yogurt", "Mantequilla", "Detergente", "Jabón",
+    "Champú", "Papel higiénico", "Gaseosa", "Agua mineral", "Cerveza",
+]
+MARCAS = ["Costeño", "Gloria", "Primor", "Don Vittorio", "Florida", "Molitalia", "Bolívar"]
+CATEGORIAS = ["Abarrotes", "Lácteos", "Limpieza", "Bebidas", "Cuidado personal"]
+
+QUERIES = {
+    "corto": ["a", "c", "ar", "ch"],
+    "prefijo": ["arr", "gal", "choc", "deter", "cerv"],
+    "palabra": ["arroz costeño", "leche gloria", "jabon bolivar", "cafe"],
+    "tipeo": ["aros", "galetas", "chocolat", "detergnte"],
+    "codigo": ["P000123", "P004567", "P099999"],
+}
+
+
+def synthetic_products(negocio_id, count, seed=7):
+    rng = random.Random(seed)
+    for i in range(count):
+        nombre = f"{rng.choice(NOMBRES)} {rng.choice(MARCAS)} {rng.randint(100, 2000)}g"
+        precio_venta = round(rng.uniform(1, 80), 2)
+        yield {
+            "negocio_id": negocio_id,
+            "codigo": f"P{i:06d}",
+            "nombre": nombre,
+            "descripcion": f"{nombre} - presentación {rng.choice(['unidad', 'pack', 'caja'])}",
+            "categoria": rng.choice(CATEGORIAS),
+            "precio_compra": round(precio_venta * 0.7, 2),
+            "precio_venta": precio_venta,
+            "stock_actual": rng.randint(0, 200),
+        }
+
+
+async def seed(db, negocio_id, count, chunk):
+    started = time.perf_counter()
+    batch = []
+    for producto in synthetic_products(negocio_id, count):
+        batch.append(producto)
+        if len(batch) == chunk:
+            await db.table("productos").insert(batch).execute()
+            batch = []
+    if batch:
+        await db.table("productos").insert(batch).execute()
+    print(f"Sembrados {count} productos en {time.perf_counter() - started:.1f}s")
+
+
+async def search(db, negocio_id, q, limit):
+    started = time.perf_counter()
+    response = await db.rpc("search_productos", {
+        "p_query": q, "p_negocio_id": negocio_id, "p_limit": limit + 1,
+    }).execute()
+    return (time.perf_counter() - started) * 1000, len(response.data or [])
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--negocio-id", required=True)
+    parser.add_argument("--products", type=int, default=200_000)
+    parser.add_argument("--chunk", type=int, default=1000)
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    db = init_db()
+    try:
+        if not args.skip_seed:
+            await seed(db, args.negocio_id, args.products, args.chunk)
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def timed(q):
+            async with semaphore:
+                return await search(db, args.negocio_id, q, args.limit)
+
+        for tipo, queries in QUERIES.items():
+            results = await asyncio.gather(*(
+                timed(q) for _ in range(args.rounds) for q in queries
+            ))
+            latencies = [ms for ms, _ in results]
+            hits = statistics.mean(n for _, n in results)
+            print(
+                f"{tipo:8s} n={len(latencies):4d}  p50={percentile(latencies, 50):7.1f}ms  "
+                f"p95={percentile(latencies, 95):7.1f}ms  resultados~{hits:.0f}"
+            )
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
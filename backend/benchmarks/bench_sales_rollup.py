@@ -0,0 +1,86 @@
+"""
+Analítica de ventas: resumen por hora (RPC sales_summary) vs cálculo crudo.
+
+Para un negocio y una ventana, calcula totales por método de pago con el
+RPC y descargando las ventas (como hacía /analytics/sales), compara los
+resultados y reporta tiempos y bytes transferidos. Necesita la base
+configurada en SUPABASE_URL/SUPABASE_KEY con add_sales_rollups.sql.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_sales_rollup --negocio-id <uuid> --days 365
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from app.services.database import close_db, init_db
+
+PAGE = 1000
+
+
+async def raw(db, negocio_id, desde):
+    """Cálculo crudo: todas las ventas de la ventana, sumadas en Python"""
+    por_metodo, cantidad, transferido, offset = {}, 0, 0, 0
+    while True:
+        response = await db.table("ventas").select("*").eq(
+            "negocio_id", negocio_id
+        ).gte("created_at", desde).neq("estado", "ANULADO").order("id").range(
+            offset, offset + PAGE - 1
+        ).execute()
+        transferido += len(json.dumps(response.data))
+        for venta in response.data:
+            metodo = venta["metodo_pago"]
+            por_metodo[metodo] = por_metodo.get(metodo, Decimal(0)) + Decimal(str(venta["total"]))
+            cantidad += 1
+        if len(response.data) < PAGE:
+            return por_metodo, cantidad, transferido
+        offset += PAGE
+
+
+async def rollup(db, negocio_id, desde, bucket):
+    response = await db.rpc("sales_summary", {
+        "p_negocio_id": negocio_id, "p_desde": desde, "p_bucket": bucket,
+    }).execute()
+    por_metodo, cantidad = {}, 0
+    for fila in response.data:
+        metodo = fila["metodo_pago"]
+        por_metodo[metodo] = por_metodo.get(metodo, Decimal(0)) + Decimal(str(fila["total"]))
+        cantidad += fila["cantidad"]
+    return por_metodo, cantidad, len(json.dumps(response.data))
+
+
+async def timed(coro):
+    started = time.perf_counter()
+    result = await coro
+    return result, (time.perf_counter() - started) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--negocio-id", required=True)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--bucket", default="day", choices=["hour", "day", "week", "month"])
+    args = parser.parse_args()
+
+    desde = (datetime.now(timezone.utc) - timedelta(days=args.days)).isoformat()
+    db = init_db()
+    try:
+        (crudo, crudo_ms) = await timed(raw(db, args.negocio_id, desde))
+        (resumen, resumen_ms) = await timed(rollup(db, args.negocio_id, desde, args.bucket))
+    finally:
+        await close_db()
+
+    for nombre, (por_metodo, cantidad, transferido), ms in (
+        ("crudo", crudo, crudo_ms), ("resumen", resumen, resumen_ms)
+    ):
+        print(f"{nombre:8s} {ms:8.1f}ms  {transferido / 1024:9.1f} KiB  ventas={cantidad}")
+    iguales = crudo[:2] == resumen[:2]
+    print("resultados idénticos" if iguales else f"DIFERENCIA: {crudo[:2]} vs {resumen[:2]}")
+    raise SystemExit(0 if iguales else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""
+Benchmark de /mirror/size-comparison: latencia vs número de tallas.
+
+Compara el render original (copia completa + addWeighted completo +
+imencode serial por talla) con el renderizador de una sola pasada.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_size_comparison --width 1920 --height 1080
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from app.services.image_output import OutputOptions
+from app.services.inference import Landmark
+from app.services.size_comparison import (
+    SIZE_SCALES,
+    clothing_rect,
+    get_scale_by_size,
+    render_size_comparisons,
+)
+
+
+def synthetic_landmarks():
+    """Pose frontal sintética (coordenadas normalizadas)"""
+    landmarks = [Landmark(0.5, 0.5, 0.0, 1.0)] * 33
+    landmarks[11] = Landmark(0.40, 0.30, 0.0, 1.0)
+    landmarks[12] = Landmark(0.60, 0.30, 0.0, 1.0)
+    landmarks[23] = Landmark(0.43, 0.62, 0.0, 1.0)
+    landmarks[24] = Landmark(0.57, 0.62, 0.0, 1.0)
+    return landmarks
+
+
+def legacy_render(frame, landmarks, sizes):
+    """Implementación previa, como referencia"""
+    h, w = frame.shape[:2]
+    comparisons = {}
+    for size in sizes:
+        frame_copy = frame.copy()
+        x1, y1, x2, y2 = clothing_rect(landmarks, h, w, get_scale_by_size(size))
+        overlay = frame_copy.copy()
+        cv2.rectangle(overlay, (x1, y1), (x2, y2), (100, 200, 255), -1)
+        cv2.addWeighted(overlay, 0.6, frame_copy, 0.4, 0, frame_copy)
+        comparisons[size] = cv2.imencode(".jpg", frame_copy)[1].tobytes()
+    return comparisons
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+    frame = cv2.GaussianBlur(frame, (9, 9), 0)
+    landmarks = synthetic_landmarks()
+    all_sizes = list(SIZE_SCALES)
+    # Misma calidad que cv2.imencode por defecto, sin reescalar
+    options = OutputOptions(mode="image", quality=95, max_side=0)
+
+    # Las variantes deben ser idénticas píxel a píxel antes de codificar
+    legacy = legacy_render(frame, landmarks, all_sizes)
+    fast = render_size_comparisons(frame, landmarks, all_sizes, options)
+    for size in all_sizes:
+        a = cv2.imdecode(np.frombuffer(legacy[size], np.uint8), cv2.IMREAD_COLOR)
+        b = cv2.imdecode(np.frombuffer(fast[size], np.uint8), cv2.IMREAD_COLOR)
+        assert np.array_equal(a, b), f"La talla {size} difiere"
+
+    print(f"Frame {args.width}x{args.height}, mediana de {args.repeat} corridas")
+    print(f"{'tallas':>6} {'legacy ms':>10} {'single-pass ms':>15} {'speedup':>8}")
+    for n in range(1, len(all_sizes) + 1):
+        sizes = all_sizes[:n]
+        legacy_ms = timed(lambda: legacy_render(frame, landmarks, sizes), args.repeat)
+        fast_ms = timed(lambda: render_size_comparisons(frame, landmarks, sizes, options), args.repeat)
+        print(f"{n:>6} {legacy_ms:>10.1f} {fast_ms:>15.1f} {legacy_ms / fast_ms:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
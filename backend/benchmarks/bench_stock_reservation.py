@@ -0,0 +1,219 @@
+"""
+Prueba de concurrencia del stock contra una base real.
+
+Requiere una base (Supabase/PostgREST) con schema.sql y las migraciones
+aplicadas, incluida add_stock_reservations.sql, y SUPABASE_KEY con la clave
+de servicio (la prueba vence reservas a mano). Corre dos casos y sale con
+código 1 si alguno falla. --concurrency acota las peticiones en vuelo
+(con más que DB_POOL_MAX_CONNECTIONS esperan conexión y, pasado
+DB_POOL_TIMEOUT, fallan con 500):
+
+1. Ventas (/orders/create): cientos de ventas sobre un producto
+   "caliente" (más un segundo producto en orden inverso, para ejercitar el
+   orden de locks). Verifica stock final >= 0 y vendidas == inicial - final.
+2. Checkout del marketplace (/products/order): crea un enlace por
+   /links/create y una prenda con stock en una talla/color, y lanza los
+   checkouts concurrentes. Verifica que las reservas no superen el stock,
+   confirma una parte de las órdenes, vence el resto y corre el barrido:
+   el stock vuelve a inicial - confirmadas y esas órdenes quedan CANCELADA.
+   Ojo: el barrido libera todas las reservas vencidas de la base.
+
+Uso (desde backend/):
+    SUPABASE_KEY=<service key> python -m benchmarks.bench_stock_reservation \\
+        --supabase-url http://localhost:54321 --negocio-id <uuid> --cliente-id <uuid>
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+import httpx
+from fastapi import FastAPI
+
+TALLA, COLOR = "M", "Negro"
+
+
+class Client:
+    """Cliente ASGI con peticiones en vuelo acotadas (como un balanceador)"""
+
+    def __init__(self, client, concurrency):
+        self.client = client
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def post(self, url, **kwargs):
+        async with self.semaphore:
+            return await self.client.post(url, **kwargs)
+
+
+async def create_product(db, negocio_id, nombre, stock):
+    response = await db.table("productos").insert({
+        "negocio_id": negocio_id, "nombre": nombre,
+        "precio_compra": 1, "precio_venta": 2, "stock_actual": stock,
+    }).execute()
+    return response.data[0]["id"]
+
+
+async def current_stock(db, producto_id):
+    response = await db.table("productos").select("id,stock_actual").eq("id", producto_id).execute()
+    return response.data[0]["stock_actual"]
+
+
+async def garment_stock(db, prenda_id):
+    response = await db.table("clothing_products").select(
+        "id,stock_por_talla_color"
+    ).eq("id", prenda_id).execute()
+    return response.data[0]["stock_por_talla_color"][TALLA][COLOR]
+
+
+async def bench_sales(client, db, args):
+    """Caso 1: ventas concurrentes; retorna True si no hubo sobreventa"""
+    hot = await create_product(db, args.negocio_id, "SKU caliente", args.stock)
+    other = await create_product(db, args.negocio_id, "SKU acompañante", args.stock)
+
+    def order():
+        items = [{"producto_id": hot, "cantidad": random.randint(1, args.max_qty), "precio_unitario": 2}]
+        if random.random() < 0.5:
+            # Mismo par de productos en orden inverso
+            items.insert(0, {"producto_id": other, "cantidad": 1, "precio_unitario": 2})
+        return {
+            "negocio_id": args.negocio_id, "cliente_id": args.cliente_id, "items": items,
+            "total": 2.0 * sum(item["cantidad"] for item in items),
+            "tipo": "CONTADO", "metodo_pago": "EFECTIVO",
+        }
+
+    orders = [order() for _ in range(args.orders)]
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(
+        client.post("/api/v1/orders/create", json=body) for body in orders
+    ))
+    elapsed = time.perf_counter() - started
+
+    sold = {hot: 0, other: 0}
+    statuses = {}
+    for body, response in zip(orders, responses):
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if response.status_code == 200:
+            for item in body["items"]:
+                sold[item["producto_id"]] += item["cantidad"]
+    final = {p: await current_stock(db, p) for p in sold}
+
+    print(f"[ventas] {args.orders} ({args.concurrency} en vuelo) en {elapsed:.2f}s "
+          f"({args.orders / elapsed:,.0f} ventas/s); respuestas: {statuses}")
+    ok = statuses.get(500, 0) == 0
+    for name, producto_id in (("caliente", hot), ("acompañante", other)):
+        consistent = final[producto_id] >= 0 and sold[producto_id] == args.stock - final[producto_id]
+        ok = ok and consistent
+        print(f"[ventas] SKU {name}: stock inicial {args.stock}, vendidas {sold[producto_id]}, "
+              f"stock final {final[producto_id]} -> {'OK' if consistent else 'SOBREVENTA'}")
+    return ok
+
+
+async def bench_checkout(client, db, args):
+    """Caso 2: checkouts con reserva, confirmación y liberación"""
+    from app.services.stock import ReservationSweeper, release_expired
+
+    response = await client.post("/api/v1/marketplace/links/create", json={
+        "negocio_id": args.negocio_id, "nombre": "Benchmark reservas", "descripcion": "",
+    })
+    assert response.status_code == 200, response.text
+    codigo = response.json()["link"]["codigo"]
+    prenda = await db.table("clothing_products").insert({
+        "negocio_id": args.negocio_id, "nombre": "Polo benchmark", "precio_venta": 2,
+        "stock_por_talla_color": {TALLA: {COLOR: args.stock}},
+    }).execute()
+    prenda_id = prenda.data[0]["id"]
+
+    def params(i):
+        return {
+            "codigo": codigo, "producto_id": prenda_id, "talla": TALLA, "color": COLOR,
+            "cantidad": random.randint(1, args.max_qty),
+            "cliente_nombre": f"Cliente {i}", "cliente_email": f"cliente{i}@example.com",
+            "cliente_telefono": "999999999", "cliente_direccion": "Lima",
+        }
+
+    checkouts = [params(i) for i in range(args.orders)]
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(
+        client.post("/api/v1/marketplace/products/order", params=p) for p in checkouts
+    ))
+    elapsed = time.perf_counter() - started
+
+    statuses = {}
+    reservadas = []  # (orden_id, cantidad)
+    for p, response in zip(checkouts, responses):
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if response.status_code == 200:
+            reservadas.append((response.json()["orden_id"], p["cantidad"]))
+    reserved = sum(cantidad for _, cantidad in reservadas)
+    after_checkout = await garment_stock(db, prenda_id)
+    print(f"[checkout] {args.orders} ({args.concurrency} en vuelo) en {elapsed:.2f}s "
+          f"({args.orders / elapsed:,.0f} checkouts/s); respuestas: {statuses}")
+    ok = statuses.get(500, 0) == 0 and after_checkout >= 0 and reserved == args.stock - after_checkout
+    print(f"[checkout] stock inicial {args.stock}, reservadas {reserved}, "
+          f"stock final {after_checkout} -> {'OK' if ok else 'SOBREVENTA'}")
+
+    # Confirma una parte; el resto vence y el barrido lo devuelve
+    confirmar = reservadas[:int(len(reservadas) * args.confirm)]
+    for orden_id, _ in confirmar:
+        response = await client.post(f"/api/v1/marketplace/orders/{orden_id}/confirm")
+        ok = ok and response.status_code == 200
+    confirmed = sum(cantidad for _, cantidad in confirmar)
+    await db.table("reservas_stock").update({
+        "expira_at": "2000-01-01T00:00:00+00:00"
+    }).eq("producto_id", prenda_id).eq("estado", "ACTIVA").execute()
+    sweeper = ReservationSweeper(release_expired)
+    await sweeper.sweep()
+
+    restored = await garment_stock(db, prenda_id)
+    canceladas = await db.table("marketplace_orders").select("id").eq(
+        "producto_id", prenda_id
+    ).eq("estado", "CANCELADA").execute()
+    released_ok = (
+        restored == args.stock - confirmed
+        and len(canceladas.data) == len(reservadas) - len(confirmar)
+    )
+    print(f"[checkout] confirmadas {len(confirmar)} ({confirmed} u.), liberadas "
+          f"{sweeper.released} órdenes; stock tras el barrido {restored} "
+          f"(esperado {args.stock - confirmed}) -> {'OK' if released_ok else 'ERROR'}")
+    return ok and released_ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--supabase-url", required=True)
+    parser.add_argument("--negocio-id", required=True)
+    parser.add_argument("--cliente-id", required=True, help="cliente existente para las ventas")
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=200)
+    parser.add_argument("--max-qty", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=100, help="peticiones en vuelo")
+    parser.add_argument("--confirm", type=float, default=0.25, help="fracción de checkouts a confirmar")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    os.environ["SUPABASE_URL"] = args.supabase_url
+
+    from app.routes import marketplace_public_routes, orders_routes
+    from app.services.database import close_db, init_db
+
+    db = init_db()
+    app = FastAPI()
+    app.include_router(orders_routes.router, prefix="/api/v1/orders")
+    app.include_router(marketplace_public_routes.router, prefix="/api/v1/marketplace")
+
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None
+        ) as http:
+            client = Client(http, args.concurrency)
+            ok = await bench_sales(client, db, args)
+            ok = await bench_checkout(client, db, args) and ok
+    finally:
+        await close_db()
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
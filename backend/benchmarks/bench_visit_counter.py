@@ -0,0 +1,112 @@
+"""
+Prueba de carga del contador de visitas (/marketplace/access/{codigo}).
+
+Lanza N visitas concurrentes a un mismo enlace contra la app en proceso,
+con una base simulada que aplica los incrementos con latencia, y verifica
+que se sumen exactamente N visitas con muchas menos escrituras.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_visit_counter --visits 1000 --latency-ms 20
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+import httpx
+from fastapi import FastAPI
+
+from app.routes import marketplace_public_routes
+from app.services import database
+from app.services.visit_counter import visit_counter
+
+CODIGO = "BENCH001"
+
+
+class FakeQuery:
+    def __init__(self, db, func, params):
+        self.db = db
+        self.func = func
+        self.params = params
+
+    async def execute(self):
+        await asyncio.sleep(self.db.latency)
+        self.db.calls[self.func] = self.db.calls.get(self.func, 0) + 1
+        if self.func == "marketplace_storefront":
+            data = self.db.storefront()
+        elif self.func == "increment_marketplace_visits_batch":
+            for codigo, count in self.params["p_visitas"].items():
+                self.db.visitas += count
+            data = [{"codigo": CODIGO, "visitas": self.db.visitas}]
+        else:
+            raise ValueError(self.func)
+        return type("Response", (), {"data": data})()
+
+
+class FakeDatabase:
+    """Solo los RPC que usa la vitrina pública"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.visitas = 0
+        self.calls = {}
+
+    def storefront(self):
+        return {
+            "link": {
+                "id": "l1", "negocio_id": "n1", "nombre": "Tienda",
+                "descripcion": "", "visitas": self.visitas,
+            },
+            "negocio": {"nombre_comercial": "Tienda", "logo_url": None},
+            "productos": [],
+        }
+
+    def rpc(self, func, params=None):
+        return FakeQuery(self, func, params)
+
+
+async def run(args):
+    db = FakeDatabase(args.latency_ms / 1000)
+    database._db = db
+    visit_counter.interval = args.flush_interval
+
+    app = FastAPI()
+    app.include_router(marketplace_public_routes.router, prefix="/api/v1/marketplace")
+
+    visit_counter.start()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started_at = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.get(f"/api/v1/marketplace/access/{CODIGO}") for _ in range(args.visits)
+        ])
+        elapsed = time.perf_counter() - started_at
+    pending = visit_counter.stats()["pending"]
+    await visit_counter.stop()
+
+    statuses = {r.status_code for r in responses}
+    last_seen = max(r.json()["marketplace"]["visitas"] for r in responses)
+    writes = db.calls.get("increment_marketplace_visits_batch", 0)
+    print(f"visitas:           {args.visits} en {elapsed:.2f} s (status {sorted(statuses)})")
+    print(f"pendientes al fin: {pending}")
+    print(f"total en la base:  {db.visitas}")
+    print(f"escrituras:        {writes}")
+    print(f"cargas de vitrina: {db.calls.get('marketplace_storefront', 0)}")
+    print(f"máx. visitas vistas en respuestas: {last_seen}")
+    assert db.visitas == args.visits, "se perdieron o duplicaron visitas"
+    assert writes < args.visits
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--visits", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--flush-interval", type=float, default=0.1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
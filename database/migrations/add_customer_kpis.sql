@@ -0,0 +1,28 @@
+-- KPIs de clientes y cuentas por cobrar (/analytics/clientes)
+
+-- Función: receivables_summary
+-- Cantidad y deuda total de las cuentas por cobrar pendientes del negocio
+CREATE OR REPLACE FUNCTION receivables_summary(p_negocio_id UUID)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT jsonb_build_object(
+        'cuentas_pendientes', COUNT(*),
+        'deuda_total', COALESCE(SUM(monto_pendiente), 0)
+    )
+    FROM cuentas_por_cobrar
+    WHERE negocio_id = p_negocio_id
+      AND estado = 'PENDIENTE';
+$$;
+
+GRANT EXECUTE ON FUNCTION receivables_summary(UUID) TO authenticated;
+
+-- Índices
+-- Suma de pendientes con index-only scan
+CREATE INDEX IF NOT EXISTS idx_cxc_negocio_pendientes
+    ON cuentas_por_cobrar(negocio_id)
+    INCLUDE (monto_pendiente)
+    WHERE estado = 'PENDIENTE';
+-- Conteo de clientes por negocio (index-only scan)
+CREATE INDEX IF NOT EXISTS idx_clientes_negocio_id ON clientes(negocio_id);
@@ -0,0 +1,79 @@
+-- Analítica de inventario en la base (/analytics/inventory)
+-- Agregados con proyección angosta e índices para que el costo no dependa
+-- de fotos/atributos ni del tamaño del catálogo.
+
+-- Índices
+-- Cubre los agregados: index-only scan sin tocar las filas (fotos, atributos)
+CREATE INDEX IF NOT EXISTS idx_productos_inventario
+    ON productos(negocio_id)
+    INCLUDE (categoria, stock_actual, stock_minimo, precio_compra);
+-- Solo productos con stock bajo, en el orden del listado
+CREATE INDEX IF NOT EXISTS idx_productos_bajo_stock
+    ON productos(negocio_id, stock_actual, id)
+    WHERE stock_actual < stock_minimo;
+
+-- Función: inventory_summary
+-- Total de productos, productos con stock bajo y valorización (precio de
+-- compra x stock) total y por categoría
+CREATE OR REPLACE FUNCTION inventory_summary(p_negocio_id UUID)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    WITH por_categoria AS (
+        SELECT
+            COALESCE(categoria, 'Sin categoría') AS categoria,
+            COUNT(*) AS productos,
+            COUNT(*) FILTER (WHERE stock_actual < stock_minimo) AS bajo_stock,
+            COALESCE(SUM(stock_actual), 0) AS unidades,
+            COALESCE(SUM(precio_compra * stock_actual), 0) AS valor
+        FROM productos
+        WHERE negocio_id = p_negocio_id
+        GROUP BY 1
+    )
+    SELECT jsonb_build_object(
+        'total_productos', COALESCE(SUM(productos), 0),
+        'productos_bajo_stock', COALESCE(SUM(bajo_stock), 0),
+        'valor_total_inventario', COALESCE(SUM(valor), 0),
+        'por_categoria', COALESCE(jsonb_agg(jsonb_build_object(
+            'categoria', categoria,
+            'productos', productos,
+            'unidades', unidades,
+            'valor', valor
+        ) ORDER BY valor DESC, categoria), '[]'::jsonb)
+    )
+    FROM por_categoria;
+$$;
+
+-- Función: low_stock_productos
+-- Productos con stock bajo, de menor a mayor stock. Paginación keyset
+-- sobre (stock_actual, id) con el índice parcial idx_productos_bajo_stock.
+CREATE OR REPLACE FUNCTION low_stock_productos(
+    p_negocio_id UUID,
+    p_limit INTEGER DEFAULT 20,
+    p_after_stock INTEGER DEFAULT NULL,
+    p_after_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    id UUID,
+    codigo VARCHAR,
+    nombre VARCHAR,
+    categoria VARCHAR,
+    stock_actual INTEGER,
+    stock_minimo INTEGER,
+    unidad_medida VARCHAR
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT p.id, p.codigo, p.nombre, p.categoria, p.stock_actual, p.stock_minimo, p.unidad_medida
+    FROM productos p
+    WHERE p.negocio_id = p_negocio_id
+      AND p.stock_actual < p.stock_minimo
+      AND (p_after_stock IS NULL OR (p.stock_actual, p.id) > (p_after_stock, p_after_id))
+    ORDER BY p.stock_actual, p.id
+    LIMIT p_limit;
+$$;
+
+GRANT EXECUTE ON FUNCTION inventory_summary(UUID) TO authenticated;
+GRANT EXECUTE ON FUNCTION low_stock_productos(UUID, INTEGER, INTEGER, UUID) TO authenticated;
@@ -0,0 +1,19 @@
+-- Índices para paginación por cursor (keyset)
+-- Los listados filtran por negocio y ordenan por (created_at DESC, id DESC);
+-- con estos índices cada página es un rango del índice, sin importar la
+-- profundidad.
+CREATE INDEX IF NOT EXISTS idx_ventas_negocio_created_id
+    ON ventas(negocio_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_productos_negocio_created_id
+    ON productos(negocio_id, created_at DESC, id DESC);
+
+-- La clave (created_at, id) no puede tener NULLs: en orden DESC irían
+-- primero y el filtro `(created_at, id) < (c, i)` saltaría o repetiría
+-- filas. Las filas sin fecha quedan al final (fecha desconocida = la más
+-- antigua); en productos se usa updated_at si existe.
+UPDATE ventas SET created_at = 'epoch' WHERE created_at IS NULL;
+ALTER TABLE ventas ALTER COLUMN created_at SET NOT NULL;
+
+UPDATE productos SET created_at = COALESCE(updated_at, 'epoch') WHERE created_at IS NULL;
+ALTER TABLE productos ALTER COLUMN created_at SET NOT NULL;
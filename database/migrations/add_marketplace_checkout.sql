@@ -0,0 +1,160 @@
+-- Checkout del marketplace público en una sola llamada transaccional
+-- Enlace + producto + cliente invitado + orden en una transacción, con
+-- clave de idempotencia: un reintento con la misma clave retorna la orden
+-- original sin escribir de nuevo. La clave vale dentro de un enlace (la
+-- eligen los clientes, no es global) y queda atada a los parámetros de la
+-- primera petición: reusarla con otra orden es un error, no un replay.
+
+-- Tabla: marketplace_checkouts (resultados por enlace y clave)
+CREATE TABLE IF NOT EXISTS marketplace_checkouts (
+    codigo TEXT NOT NULL,
+    idempotency_key VARCHAR(255) NOT NULL,
+    parametros_hash TEXT NOT NULL,
+    orden_id UUID NOT NULL,
+    resultado JSONB NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (codigo, idempotency_key)
+);
+
+-- Índices
+-- Para purgar claves antiguas (p.ej. > 7 días)
+CREATE INDEX IF NOT EXISTS idx_marketplace_checkouts_created
+    ON marketplace_checkouts(created_at);
+
+-- Función: marketplace_checkout
+-- Retorna {orden_id, cliente_id, negocio_id, producto, total, replay} o
+-- {error: 'ENLACE_NO_ENCONTRADO' | 'PRODUCTO_NO_ENCONTRADO' |
+-- 'IDEMPOTENCY_KEY_REUSED'}
+CREATE OR REPLACE FUNCTION marketplace_checkout(
+    p_codigo TEXT,
+    p_producto_id UUID,
+    p_talla TEXT,
+    p_color TEXT,
+    p_cantidad INTEGER,
+    p_cliente JSONB,
+    p_idempotency_key TEXT DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_resultado JSONB;
+    v_negocio_id UUID;
+    v_producto RECORD;
+    v_cliente_id UUID;
+    v_orden_id UUID;
+    v_total DECIMAL;
+    v_hash TEXT := md5(jsonb_build_object(
+        'producto_id', p_producto_id, 'talla', p_talla, 'color', p_color,
+        'cantidad', p_cantidad, 'cliente', p_cliente
+    )::TEXT);
+    v_hash_previo TEXT;
+BEGIN
+    IF p_idempotency_key IS NOT NULL THEN
+        -- Serializa los reintentos concurrentes con la misma clave
+        PERFORM pg_advisory_xact_lock(
+            hashtext('marketplace_checkout'), hashtext(p_codigo || ':' || p_idempotency_key)
+        );
+        SELECT resultado, parametros_hash INTO v_resultado, v_hash_previo
+        FROM marketplace_checkouts
+        WHERE codigo = p_codigo
+          AND idempotency_key = p_idempotency_key;
+        IF FOUND THEN
+            IF v_hash_previo <> v_hash THEN
+                RETURN jsonb_build_object('error', 'IDEMPOTENCY_KEY_REUSED');
+            END IF;
+            RETURN v_resultado || jsonb_build_object('replay', TRUE);
+        END IF;
+    END IF;
+
+    SELECT negocio_id INTO v_negocio_id
+    FROM marketplace_links
+    WHERE codigo = p_codigo
+      AND estado = 'ACTIVO';
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('error', 'ENLACE_NO_ENCONTRADO');
+    END IF;
+
+    SELECT nombre, precio_venta INTO v_producto
+    FROM clothing_products
+    WHERE id = p_producto_id
+      AND negocio_id = v_negocio_id;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('error', 'PRODUCTO_NO_ENCONTRADO');
+    END IF;
+
+    v_total := v_producto.precio_venta * p_cantidad;
+
+    INSERT INTO clientes (negocio_id, nombre, email, telefono, direccion, es_empresa, tipo_cliente)
+    VALUES (
+        v_negocio_id,
+        p_cliente->>'nombre',
+        p_cliente->>'email',
+        p_cliente->>'telefono',
+        p_cliente->>'direccion',
+        FALSE,
+        'CONSUMIDOR_FINAL'
+    )
+    RETURNING id INTO v_cliente_id;
+
+    INSERT INTO marketplace_orders (
+        negocio_id, cliente_id, producto_id, talla, color, cantidad,
+        precio_unitario, total, estado, origen, fecha_creacion
+    )
+    VALUES (
+        v_negocio_id, v_cliente_id, p_producto_id, p_talla, p_color, p_cantidad,
+        v_producto.precio_venta, v_total, 'PENDIENTE', 'MARKETPLACE_PUBLICO', NOW()
+    )
+    RETURNING id INTO v_orden_id;
+
+    v_resultado := jsonb_build_object(
+        'orden_id', v_orden_id,
+        'cliente_id', v_cliente_id,
+        'negocio_id', v_negocio_id,
+        'producto', v_producto.nombre,
+        'total', v_total
+    );
+
+    IF p_idempotency_key IS NOT NULL THEN
+        INSERT INTO marketplace_checkouts (codigo, idempotency_key, parametros_hash, orden_id, resultado)
+        VALUES (p_codigo, p_idempotency_key, v_hash, v_orden_id, v_resultado);
+    END IF;
+
+    RETURN v_resultado || jsonb_build_object('replay', FALSE);
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION marketplace_checkout(TEXT, UUID, TEXT, TEXT, INTEGER, JSONB, TEXT) TO anon, authenticated;
+
+-- Función: purgar_marketplace_checkouts
+-- Borra hasta p_limite claves con más de p_dias días; retorna cuántas borró.
+-- La llama periódicamente el backend (IdempotencyPurger).
+CREATE OR REPLACE FUNCTION purgar_marketplace_checkouts(
+    p_dias INTEGER DEFAULT 7,
+    p_limite INTEGER DEFAULT 5000
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_borradas INTEGER;
+BEGIN
+    DELETE FROM marketplace_checkouts
+    WHERE (codigo, idempotency_key) IN (
+        SELECT codigo, idempotency_key
+        FROM marketplace_checkouts
+        WHERE created_at < NOW() - make_interval(days => p_dias)
+        ORDER BY created_at
+        LIMIT p_limite
+    );
+    GET DIAGNOSTICS v_borradas = ROW_COUNT;
+    RETURN v_borradas;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION purgar_marketplace_checkouts(INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION purgar_marketplace_checkouts(INTEGER, INTEGER) TO service_role;
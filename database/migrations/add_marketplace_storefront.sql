@@ -0,0 +1,72 @@
+-- Función: marketplace_storefront
+-- Vitrina pública en una sola llamada: enlace activo + cabecera del negocio
+-- + proyección de productos activos. Retorna NULL si el código no existe
+-- o está inactivo.
+CREATE OR REPLACE FUNCTION marketplace_storefront(p_codigo TEXT)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    SELECT jsonb_build_object(
+        'link', jsonb_build_object(
+            'id', l.id,
+            'negocio_id', l.negocio_id,
+            'nombre', l.nombre,
+            'descripcion', l.descripcion,
+            'visitas', l.visitas
+        ),
+        'negocio', jsonb_build_object(
+            'nombre_comercial', n.nombre_comercial,
+            'logo_url', n.logo_url
+        ),
+        'productos', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'id', p.id,
+                'nombre', p.nombre,
+                'descripcion', p.descripcion,
+                'categoria', p.categoria,
+                'tipo', p.tipo,
+                'tallas', p.tallas,
+                'colores', p.colores,
+                'precio_venta', p.precio_venta,
+                'imagen_plana', p.imagen_plana,
+                'imagen_3d_url', p.imagen_3d_url,
+                'stock_por_talla_color', p.stock_por_talla_color
+            ) ORDER BY p.created_at DESC, p.id)
+            FROM clothing_products p
+            WHERE p.negocio_id = l.negocio_id
+              AND p.activo
+        ), '[]'::jsonb)
+    )
+    FROM marketplace_links l
+    JOIN negocios n ON n.id = l.negocio_id
+    WHERE l.codigo = p_codigo
+      AND l.estado = 'ACTIVO';
+$$;
+
+-- Función: increment_marketplace_visits
+-- Suma visitas de forma atómica (sin leer-modificar-escribir desde la API)
+CREATE OR REPLACE FUNCTION increment_marketplace_visits(p_codigo TEXT, p_visitas INTEGER DEFAULT 1)
+RETURNS INTEGER
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    UPDATE marketplace_links
+    SET visitas = COALESCE(visitas, 0) + p_visitas
+    WHERE codigo = p_codigo
+    RETURNING visitas;
+$$;
+
+GRANT EXECUTE ON FUNCTION marketplace_storefront(TEXT) TO anon, authenticated;
+-- Solo la API (service role): con la clave anon cualquiera podría alterar
+-- las visitas de cualquier enlace
+REVOKE EXECUTE ON FUNCTION increment_marketplace_visits(TEXT, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION increment_marketplace_visits(TEXT, INTEGER) TO service_role;
+
+-- Índices
+CREATE INDEX IF NOT EXISTS idx_marketplace_links_codigo ON marketplace_links(codigo);
+CREATE INDEX IF NOT EXISTS idx_clothing_products_negocio_activo
+    ON clothing_products(negocio_id, created_at DESC) WHERE activo;
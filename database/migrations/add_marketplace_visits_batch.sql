@@ -0,0 +1,22 @@
+-- Función: increment_marketplace_visits_batch
+-- Vaciado del contador de visitas de la API: recibe {"CODIGO": n, ...} y
+-- suma cada conteo con un UPDATE atómico. Retorna los totales resultantes.
+CREATE OR REPLACE FUNCTION increment_marketplace_visits_batch(p_visitas JSONB)
+RETURNS TABLE (codigo TEXT, visitas INTEGER)
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+    UPDATE marketplace_links l
+    SET visitas = COALESCE(l.visitas, 0) + v.cantidad::INTEGER
+    FROM jsonb_each_text(p_visitas) AS v(codigo, cantidad)
+    WHERE l.codigo = v.codigo
+    RETURNING l.codigo::TEXT, l.visitas::INTEGER;
+$$;
+
+-- Solo la API (service role) vacía el contador
+REVOKE EXECUTE ON FUNCTION increment_marketplace_visits_batch(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION increment_marketplace_visits_batch(JSONB) TO service_role;
+
+-- Reemplazada por la versión por lotes; ya nadie la llama
+DROP FUNCTION IF EXISTS increment_marketplace_visits(TEXT, INTEGER);
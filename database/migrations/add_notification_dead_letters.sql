@@ -0,0 +1,19 @@
+-- Emails que la cola de notificaciones no pudo entregar (dead letter)
+-- Rechazos permanentes (5xx) o reintentos agotados; se pueden revisar y
+-- reenviar a mano.
+
+-- Tabla: notificaciones_fallidas
+CREATE TABLE IF NOT EXISTS notificaciones_fallidas (
+    id UUID PRIMARY KEY,
+    destinatario VARCHAR(255) NOT NULL,
+    asunto TEXT NOT NULL,
+    nombre VARCHAR(255),
+    mensaje TEXT,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Índices
+CREATE INDEX IF NOT EXISTS idx_notificaciones_fallidas_created
+    ON notificaciones_fallidas(created_at);
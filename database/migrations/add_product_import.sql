@@ -0,0 +1,10 @@
+-- Importación masiva de productos (/products/import/{negocio_id})
+-- El upsert por lotes usa ON CONFLICT (negocio_id, codigo): requiere un
+-- índice único. Los productos sin código (NULL) no entran en conflicto.
+-- Si ya hay códigos repetidos en un negocio, corregirlos antes de aplicar.
+
+-- Índices
+CREATE UNIQUE INDEX IF NOT EXISTS uq_productos_negocio_codigo
+    ON productos(negocio_id, codigo);
+-- Reemplazado por el índice único
+DROP INDEX IF EXISTS idx_productos_negocio_codigo;
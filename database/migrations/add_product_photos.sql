@@ -0,0 +1,34 @@
+-- Fotos de productos con variantes derivadas
+-- productos.fotos sigue siendo el arreglo de URLs (lo leen la app, el
+-- marketplace y la búsqueda); las variantes van aparte, por hash:
+--   fotos_variantes = {sha256: {"url": original, "variantes": {"thumb": {"webp": url, "jpeg": url}, "card": ..., "zoom": ...}}}
+ALTER TABLE productos
+    ADD COLUMN IF NOT EXISTS fotos_variantes JSONB DEFAULT '{}'::jsonb;
+
+-- Función: append_producto_foto
+-- Agrega la URL al final de productos.fotos (si no está) y registra sus
+-- variantes, en una sola sentencia (sin leer-modificar-escribir desde la
+-- API). p_foto = {"hash", "url", "variantes"}; si ya está todo, no hace nada
+CREATE OR REPLACE FUNCTION append_producto_foto(p_producto_id UUID, p_foto JSONB)
+RETURNS JSONB
+LANGUAGE sql
+AS $$
+    UPDATE productos
+    SET fotos = CASE
+            WHEN COALESCE(fotos, '[]'::jsonb) @> jsonb_build_array(p_foto->>'url') THEN fotos
+            ELSE COALESCE(fotos, '[]'::jsonb) || jsonb_build_array(p_foto->>'url')
+        END,
+        fotos_variantes = COALESCE(fotos_variantes, '{}'::jsonb) || jsonb_build_object(
+            p_foto->>'hash',
+            jsonb_build_object('url', p_foto->'url', 'variantes', p_foto->'variantes')
+        ),
+        updated_at = NOW()
+    WHERE id = p_producto_id
+      AND NOT (
+          COALESCE(fotos, '[]'::jsonb) @> jsonb_build_array(p_foto->>'url')
+          AND COALESCE(fotos_variantes, '{}'::jsonb) ? (p_foto->>'hash')
+      )
+    RETURNING fotos;
+$$;
+
+GRANT EXECUTE ON FUNCTION append_producto_foto(UUID, JSONB) TO authenticated;
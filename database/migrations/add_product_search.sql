@@ -0,0 +1,145 @@
+-- Búsqueda de productos indexada y con ranking (/marketplace/search, POS)
+-- Nombre, código, categoría y descripción, sin acentos; prefijos para el
+-- type-ahead y tolerancia a errores de tipeo con trigramas.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() es STABLE; este wrapper con diccionario fijo es IMMUTABLE y
+-- se puede usar en columnas generadas e índices
+CREATE OR REPLACE FUNCTION f_unaccent(TEXT)
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE PARALLEL SAFE STRICT
+AS $$
+    SELECT public.unaccent('public.unaccent'::regdictionary, $1);
+$$;
+
+-- Columnas de búsqueda (generadas: se mantienen solas en INSERT/UPDATE)
+-- Nota: agregar columnas STORED reescribe la tabla productos
+ALTER TABLE productos
+    ADD COLUMN IF NOT EXISTS search_nombre TEXT
+        GENERATED ALWAYS AS (lower(f_unaccent(coalesce(nombre, '')))) STORED,
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', lower(f_unaccent(coalesce(nombre, '')))), 'A') ||
+            setweight(to_tsvector('simple', lower(f_unaccent(coalesce(codigo, '')))), 'A') ||
+            setweight(to_tsvector('simple', lower(f_unaccent(coalesce(categoria, '')))), 'B') ||
+            setweight(to_tsvector('simple', lower(f_unaccent(coalesce(descripcion, '')))), 'C')
+        ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_productos_search_vector
+    ON productos USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_productos_search_nombre_trgm
+    ON productos USING GIN (search_nombre gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_productos_negocio_codigo
+    ON productos(negocio_id, codigo);
+
+-- Función: search_tsquery
+-- "arroz cost" -> 'arroz':* & 'cost':*  (cada término como prefijo; los de
+-- un carácter solo como palabra completa: como prefijo coinciden con casi
+-- todo el catálogo)
+CREATE OR REPLACE FUNCTION search_tsquery(p_query TEXT)
+RETURNS TSQUERY
+LANGUAGE sql
+IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT to_tsquery('simple', string_agg(
+        quote_literal(term) || CASE WHEN length(term) > 1 THEN ':*' ELSE '' END, ' & '
+    ))
+    FROM unnest(regexp_split_to_array(lower(f_unaccent(coalesce(p_query, ''))), '[^a-z0-9]+')) AS term
+    WHERE term <> '';
+$$;
+
+-- Umbral de similitud de palabras del operador <% (errores de tipeo).
+-- Va como valor por defecto de la base y no como SET de search_productos:
+-- una función con SET no se puede inlinear. Las conexiones ya abiertas lo
+-- toman al reconectar (mientras tanto rige el valor por defecto, 0.6)
+DO $$
+BEGIN
+    EXECUTE format(
+        'ALTER DATABASE %I SET pg_trgm.word_similarity_threshold = 0.4', current_database()
+    );
+END
+$$;
+
+-- Función: search_productos
+-- Coincide por prefijo (tsvector), por similitud de palabras en el nombre
+-- (errores de tipeo, desde 3 caracteres) o por código exacto. Solo se
+-- rankean los primeros 1000 candidatos de cada vía, no todo lo que
+-- coincide con un prefijo corto. Ranking: ts_rank_cd + similitud + bonus
+-- por código exacto, redondeado para que el cursor sea estable.
+-- Paginación keyset sobre (rank DESC, id DESC). Sin SET ni SECURITY
+-- DEFINER para que el planner la inlinee en la consulta que la llama.
+CREATE OR REPLACE FUNCTION search_productos(
+    p_query TEXT,
+    p_negocio_id UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 20,
+    p_after_rank NUMERIC DEFAULT NULL,
+    p_after_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    id UUID,
+    negocio_id UUID,
+    codigo VARCHAR,
+    nombre VARCHAR,
+    descripcion TEXT,
+    categoria VARCHAR,
+    precio_venta DECIMAL,
+    stock_actual INTEGER,
+    fotos JSONB,
+    rank NUMERIC
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH q AS (
+        SELECT lower(f_unaccent(p_query)) AS texto, search_tsquery(p_query) AS tsq
+    ),
+    candidatos AS (
+        (
+            SELECT p.id
+            FROM productos p, q
+            WHERE p.search_vector @@ q.tsq
+              AND p.activo
+              AND (p_negocio_id IS NULL OR p.negocio_id = p_negocio_id)
+            LIMIT 1000
+        )
+        UNION
+        (
+            SELECT p.id
+            FROM productos p, q
+            WHERE length(q.texto) >= 3
+              AND q.texto <% p.search_nombre
+              AND p.activo
+              AND (p_negocio_id IS NULL OR p.negocio_id = p_negocio_id)
+            LIMIT 1000
+        )
+        UNION
+        (
+            SELECT p.id
+            FROM productos p
+            WHERE p.codigo = p_query
+              AND p.activo
+              AND (p_negocio_id IS NULL OR p.negocio_id = p_negocio_id)
+        )
+    ),
+    ranked AS (
+        SELECT
+            p.id, p.negocio_id, p.codigo, p.nombre, p.descripcion, p.categoria,
+            p.precio_venta, p.stock_actual, p.fotos,
+            round((
+                coalesce(ts_rank_cd(p.search_vector, q.tsq), 0)
+                + word_similarity(q.texto, p.search_nombre)
+                + CASE WHEN p.codigo = p_query THEN 1 ELSE 0 END
+            )::NUMERIC, 6) AS rank
+        FROM productos p, q
+        WHERE p.id = ANY (ARRAY(SELECT c.id FROM candidatos c))
+    )
+    SELECT r.*
+    FROM ranked r
+    WHERE p_after_rank IS NULL OR (r.rank, r.id) < (p_after_rank, p_after_id)
+    ORDER BY r.rank DESC, r.id DESC
+    LIMIT p_limit;
+$$;
+
+GRANT EXECUTE ON FUNCTION search_productos(TEXT, UUID, INTEGER, NUMERIC, UUID) TO anon, authenticated;
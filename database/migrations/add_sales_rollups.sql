@@ -0,0 +1,178 @@
+-- Resumen incremental de ventas para /analytics/sales
+-- Una fila por (negocio, hora, método de pago, tipo) con cantidad, total y
+-- descuento de las ventas no anuladas. Se mantiene con triggers en cada
+-- insert/anulación/edición de ventas; la analítica lee el resumen en lugar
+-- de descargar las ventas. La granularidad es por hora (UTC) para poder
+-- agrupar por hora, día, semana o mes en cualquier zona de hora entera.
+
+-- Tabla: ventas_resumen
+CREATE TABLE IF NOT EXISTS ventas_resumen (
+    negocio_id UUID REFERENCES negocios(id) ON DELETE CASCADE NOT NULL,
+    hora TIMESTAMPTZ NOT NULL, -- inicio de la hora (UTC)
+    metodo_pago VARCHAR(50) NOT NULL,
+    tipo VARCHAR(20) NOT NULL,
+    cantidad BIGINT NOT NULL DEFAULT 0,
+    total DECIMAL(14,2) NOT NULL DEFAULT 0,
+    descuento DECIMAL(14,2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (negocio_id, hora, metodo_pago, tipo)
+);
+
+-- Función: ventas_resumen_aplicar
+-- Suma (p_signo = 1) o resta (p_signo = -1) una venta en su hora
+CREATE OR REPLACE FUNCTION ventas_resumen_aplicar(
+    p_negocio_id UUID,
+    p_created_at TIMESTAMPTZ,
+    p_metodo_pago TEXT,
+    p_tipo TEXT,
+    p_total NUMERIC,
+    p_descuento NUMERIC,
+    p_signo INTEGER
+)
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    INSERT INTO ventas_resumen AS r (negocio_id, hora, metodo_pago, tipo, cantidad, total, descuento)
+    VALUES (
+        p_negocio_id,
+        date_trunc('hour', p_created_at, 'UTC'),
+        p_metodo_pago,
+        p_tipo,
+        p_signo,
+        p_signo * p_total,
+        p_signo * COALESCE(p_descuento, 0)
+    )
+    ON CONFLICT (negocio_id, hora, metodo_pago, tipo) DO UPDATE SET
+        cantidad = r.cantidad + EXCLUDED.cantidad,
+        total = r.total + EXCLUDED.total,
+        descuento = r.descuento + EXCLUDED.descuento;
+$$;
+
+-- Función: ventas_resumen_trigger
+-- Quita la versión anterior de la fila (si contaba) y suma la nueva
+CREATE OR REPLACE FUNCTION ventas_resumen_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.estado IS DISTINCT FROM 'ANULADO' THEN
+        PERFORM ventas_resumen_aplicar(
+            OLD.negocio_id, OLD.created_at, OLD.metodo_pago, OLD.tipo,
+            OLD.total, OLD.descuento, -1
+        );
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.estado IS DISTINCT FROM 'ANULADO' THEN
+        PERFORM ventas_resumen_aplicar(
+            NEW.negocio_id, NEW.created_at, NEW.metodo_pago, NEW.tipo,
+            NEW.total, NEW.descuento, 1
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Triggers y carga inicial en una sola transacción: ninguna venta queda
+-- fuera del resumen ni contada dos veces
+BEGIN;
+
+LOCK TABLE ventas IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS trg_ventas_resumen_insert_delete ON ventas;
+CREATE TRIGGER trg_ventas_resumen_insert_delete
+    AFTER INSERT OR DELETE ON ventas
+    FOR EACH ROW EXECUTE FUNCTION ventas_resumen_trigger();
+
+DROP TRIGGER IF EXISTS trg_ventas_resumen_update ON ventas;
+CREATE TRIGGER trg_ventas_resumen_update
+    AFTER UPDATE OF estado, total, descuento, metodo_pago, tipo, created_at, negocio_id ON ventas
+    FOR EACH ROW
+    WHEN (
+        OLD.estado IS DISTINCT FROM NEW.estado
+        OR OLD.total IS DISTINCT FROM NEW.total
+        OR OLD.descuento IS DISTINCT FROM NEW.descuento
+        OR OLD.metodo_pago IS DISTINCT FROM NEW.metodo_pago
+        OR OLD.tipo IS DISTINCT FROM NEW.tipo
+        OR OLD.created_at IS DISTINCT FROM NEW.created_at
+        OR OLD.negocio_id IS DISTINCT FROM NEW.negocio_id
+    )
+    EXECUTE FUNCTION ventas_resumen_trigger();
+
+TRUNCATE ventas_resumen;
+INSERT INTO ventas_resumen (negocio_id, hora, metodo_pago, tipo, cantidad, total, descuento)
+SELECT
+    negocio_id,
+    date_trunc('hour', created_at, 'UTC'),
+    metodo_pago,
+    tipo,
+    COUNT(*),
+    SUM(total),
+    SUM(COALESCE(descuento, 0))
+FROM ventas
+WHERE estado IS DISTINCT FROM 'ANULADO'
+GROUP BY 1, 2, 3, 4;
+
+COMMIT;
+
+-- Función: sales_summary
+-- Ventas no anuladas de [p_desde, p_hasta) agrupadas por periodo (hour,
+-- day, week, month en p_tz), método de pago y tipo. Las horas completas
+-- salen del resumen; las fracciones de hora en los bordes de la ventana se
+-- leen de ventas, así el resultado es exacto para cualquier ventana.
+CREATE OR REPLACE FUNCTION sales_summary(
+    p_negocio_id UUID,
+    p_desde TIMESTAMPTZ,
+    p_hasta TIMESTAMPTZ DEFAULT NULL,
+    p_bucket TEXT DEFAULT 'day',
+    p_tz TEXT DEFAULT 'America/Lima'
+)
+RETURNS TABLE (
+    periodo TIMESTAMPTZ,
+    metodo_pago VARCHAR,
+    tipo VARCHAR,
+    cantidad BIGINT,
+    total DECIMAL,
+    descuento DECIMAL
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH bordes AS (
+        SELECT
+            -- primera hora completa de la ventana
+            CASE WHEN date_trunc('hour', p_desde, 'UTC') = p_desde THEN p_desde
+                 ELSE date_trunc('hour', p_desde, 'UTC') + INTERVAL '1 hour' END AS ini,
+            -- fin de la última hora completa
+            CASE WHEN p_hasta IS NULL THEN 'infinity'::TIMESTAMPTZ
+                 ELSE date_trunc('hour', p_hasta, 'UTC') END AS fin
+    ),
+    filas AS (
+        SELECT r.hora AS momento, r.metodo_pago, r.tipo, r.cantidad, r.total, r.descuento
+        FROM ventas_resumen r, bordes b
+        WHERE r.negocio_id = p_negocio_id
+          AND r.hora >= b.ini
+          AND r.hora < b.fin
+        UNION ALL
+        SELECT v.created_at, v.metodo_pago, v.tipo, 1, v.total, COALESCE(v.descuento, 0)
+        FROM ventas v, bordes b
+        WHERE v.negocio_id = p_negocio_id
+          AND v.estado IS DISTINCT FROM 'ANULADO'
+          AND v.created_at >= p_desde
+          AND (p_hasta IS NULL OR v.created_at < p_hasta)
+          AND (v.created_at < b.ini OR v.created_at >= b.fin)
+    )
+    SELECT
+        date_trunc(p_bucket, momento, p_tz) AS periodo,
+        metodo_pago,
+        tipo,
+        SUM(cantidad)::BIGINT,
+        SUM(total),
+        SUM(descuento)
+    FROM filas
+    GROUP BY 1, 2, 3
+    HAVING SUM(cantidad) > 0
+    ORDER BY 1, 2, 3;
+$$;
+
+GRANT SELECT ON ventas_resumen TO authenticated;
+GRANT EXECUTE ON FUNCTION sales_summary(UUID, TIMESTAMPTZ, TIMESTAMPTZ, TEXT, TEXT) TO authenticated;
@@ -0,0 +1,420 @@
+-- Motor de stock: descuento atómico en ventas y reservas en el marketplace
+-- Cada operación bloquea las filas de productos en orden de id (sin
+-- deadlocks entre ventas con los mismos productos) y descuenta con
+-- `stock >= cantidad` en la misma sentencia, así no hay sobreventa aunque
+-- cientos de checkouts compitan por el mismo SKU.
+
+-- Tabla: reservas_stock (stock apartado por órdenes del marketplace)
+CREATE TABLE IF NOT EXISTS reservas_stock (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    negocio_id UUID REFERENCES negocios(id) ON DELETE CASCADE NOT NULL,
+    orden_id UUID NOT NULL,
+    producto_id UUID NOT NULL,
+    talla VARCHAR(20) NOT NULL,
+    color VARCHAR(50) NOT NULL,
+    cantidad INTEGER NOT NULL CHECK (cantidad > 0),
+    estado VARCHAR(20) NOT NULL DEFAULT 'ACTIVA', -- 'ACTIVA', 'CONFIRMADA', 'LIBERADA'
+    expira_at TIMESTAMPTZ NOT NULL,
+    liberada_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Índices
+CREATE INDEX IF NOT EXISTS idx_reservas_stock_vencimiento
+    ON reservas_stock(expira_at) WHERE estado = 'ACTIVA';
+CREATE INDEX IF NOT EXISTS idx_reservas_stock_orden ON reservas_stock(orden_id);
+
+-- Función: registrar_venta
+-- Descuenta el stock de todos los items y crea la venta en una sola
+-- transacción. Retorna {ok: true, venta} o {ok: false, faltantes} sin
+-- modificar nada si algún producto no alcanza.
+CREATE OR REPLACE FUNCTION registrar_venta(p_venta JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_negocio_id UUID := (p_venta->>'negocio_id')::UUID;
+    v_pedido JSONB;
+    v_faltantes JSONB;
+    v_venta ventas;
+BEGIN
+    -- Cantidades por producto (un producto puede repetirse en los items)
+    SELECT jsonb_agg(jsonb_build_object('id', id, 'cantidad', cantidad) ORDER BY id)
+    INTO v_pedido
+    FROM (
+        SELECT (i->>'producto_id')::UUID AS id, SUM((i->>'cantidad')::INTEGER) AS cantidad
+        FROM jsonb_array_elements(p_venta->'items') i
+        GROUP BY 1
+    ) s;
+
+    -- Bloqueo en orden de id: dos ventas con los mismos productos se
+    -- esperan en vez de bloquearse mutuamente
+    PERFORM 1
+    FROM productos p
+    WHERE p.negocio_id = v_negocio_id
+      AND p.id IN (SELECT id FROM jsonb_to_recordset(v_pedido) AS x(id UUID, cantidad INTEGER))
+    ORDER BY p.id
+    FOR UPDATE;
+
+    SELECT jsonb_agg(jsonb_build_object(
+        'producto_id', pedido.id,
+        'solicitado', pedido.cantidad,
+        'disponible', COALESCE(p.stock_actual, 0)
+    ))
+    INTO v_faltantes
+    FROM jsonb_to_recordset(v_pedido) AS pedido(id UUID, cantidad INTEGER)
+    LEFT JOIN productos p ON p.id = pedido.id AND p.negocio_id = v_negocio_id
+    WHERE p.id IS NULL OR COALESCE(p.stock_actual, 0) < pedido.cantidad;
+
+    IF v_faltantes IS NOT NULL THEN
+        RETURN jsonb_build_object('ok', FALSE, 'faltantes', v_faltantes);
+    END IF;
+
+    UPDATE productos p
+    SET stock_actual = p.stock_actual - pedido.cantidad,
+        updated_at = NOW()
+    FROM jsonb_to_recordset(v_pedido) AS pedido(id UUID, cantidad INTEGER)
+    WHERE p.id = pedido.id
+      AND p.negocio_id = v_negocio_id
+      AND p.stock_actual >= pedido.cantidad;
+
+    INSERT INTO ventas (
+        id, negocio_id, cliente_id, items, subtotal, total, tipo, metodo_pago, estado, created_at
+    )
+    VALUES (
+        COALESCE((p_venta->>'id')::UUID, gen_random_uuid()),
+        v_negocio_id,
+        (p_venta->>'cliente_id')::UUID,
+        p_venta->'items',
+        (p_venta->>'subtotal')::DECIMAL,
+        (p_venta->>'total')::DECIMAL,
+        p_venta->>'tipo',
+        p_venta->>'metodo_pago',
+        COALESCE(p_venta->>'estado', 'PENDIENTE'),
+        COALESCE((p_venta->>'created_at')::TIMESTAMPTZ, NOW())
+    )
+    RETURNING * INTO v_venta;
+
+    RETURN jsonb_build_object('ok', TRUE, 'venta', to_jsonb(v_venta));
+END;
+$$;
+
+-- Función: registrar_ventas_sync
+-- Ventas offline del POS (/orders/sync): ya se entregaron en el dispositivo,
+-- así que no se rechazan por falta de stock. Inserta las nuevas (las que ya
+-- existen por id se ignoran y no descuentan de nuevo) y descuenta su stock
+-- en la misma transacción, aunque quede negativo. Los items que no
+-- alcanzaban, en orden de created_at, se reportan para conciliar.
+-- Retorna {creadas: [id], faltantes: [{id, producto_id, solicitado, disponible}]}
+CREATE OR REPLACE FUNCTION registrar_ventas_sync(p_ventas JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_creadas JSONB;
+    v_pedido JSONB;
+    v_faltantes JSONB;
+BEGIN
+    -- Mismo orden de locks que registrar_venta (productos por id, luego ventas)
+    PERFORM 1
+    FROM productos p
+    WHERE (p.id, p.negocio_id) IN (
+        SELECT (i->>'producto_id')::UUID, (v->>'negocio_id')::UUID
+        FROM jsonb_array_elements(p_ventas) v, jsonb_array_elements(v->'items') i
+    )
+    ORDER BY p.id
+    FOR UPDATE;
+
+    WITH nuevas AS (
+        INSERT INTO ventas (
+            id, negocio_id, cliente_id, items, subtotal, total, tipo, metodo_pago, estado, created_at
+        )
+        SELECT
+            (v->>'id')::UUID,
+            (v->>'negocio_id')::UUID,
+            (v->>'cliente_id')::UUID,
+            v->'items',
+            (v->>'subtotal')::DECIMAL,
+            (v->>'total')::DECIMAL,
+            v->>'tipo',
+            v->>'metodo_pago',
+            COALESCE(v->>'estado', 'PENDIENTE'),
+            COALESCE((v->>'created_at')::TIMESTAMPTZ, NOW())
+        FROM jsonb_array_elements(p_ventas) v
+        ON CONFLICT (id) DO NOTHING
+        RETURNING id, negocio_id, items, created_at
+    )
+    SELECT COALESCE(jsonb_agg(to_jsonb(nuevas)), '[]'::JSONB)
+    INTO v_creadas
+    FROM nuevas;
+
+    -- Cantidades por venta y producto, solo de las ventas nuevas
+    SELECT COALESCE(jsonb_agg(to_jsonb(s)), '[]'::JSONB)
+    INTO v_pedido
+    FROM (
+        SELECT (v->>'id')::UUID AS venta_id, (v->>'negocio_id')::UUID AS negocio_id,
+               (v->>'created_at')::TIMESTAMPTZ AS created_at,
+               (i->>'producto_id')::UUID AS producto_id, SUM((i->>'cantidad')::INTEGER) AS cantidad
+        FROM jsonb_array_elements(v_creadas) v, jsonb_array_elements(v->'items') i
+        GROUP BY 1, 2, 3, 4
+    ) s;
+
+    -- Faltantes: lo pedido hasta cada venta (por created_at) contra el stock
+    SELECT jsonb_agg(jsonb_build_object(
+        'id', venta_id,
+        'producto_id', producto_id,
+        'solicitado', cantidad,
+        'disponible', GREATEST(disponible - (acumulado - cantidad), 0)
+    ) ORDER BY created_at, venta_id)
+    INTO v_faltantes
+    FROM (
+        SELECT pedido.*, COALESCE(p.stock_actual, 0) AS disponible,
+               SUM(pedido.cantidad) OVER (
+                   PARTITION BY pedido.producto_id
+                   ORDER BY pedido.created_at, pedido.venta_id
+               ) AS acumulado
+        FROM jsonb_to_recordset(v_pedido)
+            AS pedido(venta_id UUID, negocio_id UUID, created_at TIMESTAMPTZ, producto_id UUID, cantidad INTEGER)
+        LEFT JOIN productos p ON p.id = pedido.producto_id AND p.negocio_id = pedido.negocio_id
+    ) s
+    WHERE acumulado > disponible;
+
+    UPDATE productos p
+    SET stock_actual = COALESCE(p.stock_actual, 0) - t.cantidad,
+        updated_at = NOW()
+    FROM (
+        SELECT producto_id, negocio_id, SUM(cantidad) AS cantidad
+        FROM jsonb_to_recordset(v_pedido) AS x(negocio_id UUID, producto_id UUID, cantidad INTEGER)
+        GROUP BY 1, 2
+    ) t
+    WHERE p.id = t.producto_id
+      AND p.negocio_id = t.negocio_id;
+
+    RETURN jsonb_build_object(
+        'creadas', (SELECT COALESCE(jsonb_agg(v->'id'), '[]'::JSONB) FROM jsonb_array_elements(v_creadas) v),
+        'faltantes', COALESCE(v_faltantes, '[]'::JSONB)
+    );
+END;
+$$;
+
+-- Función: marketplace_checkout (reemplaza la versión sin reservas)
+-- Igual que antes, más la reserva de stock por talla/color de la prenda:
+-- descuenta de clothing_products.stock_por_talla_color en una sola
+-- sentencia y registra la reserva, que vence a los p_reserva_minutos si
+-- la orden no se confirma. Sin stock retorna {error: 'SIN_STOCK'}.
+-- p_reserva_minutos lo manda la API (STOCK_RESERVATION_MINUTES); como la
+-- función es pública se acota a 1..60.
+DROP FUNCTION IF EXISTS marketplace_checkout(TEXT, UUID, TEXT, TEXT, INTEGER, JSONB, TEXT);
+
+CREATE OR REPLACE FUNCTION marketplace_checkout(
+    p_codigo TEXT,
+    p_producto_id UUID,
+    p_talla TEXT,
+    p_color TEXT,
+    p_cantidad INTEGER,
+    p_cliente JSONB,
+    p_idempotency_key TEXT DEFAULT NULL,
+    p_reserva_minutos INTEGER DEFAULT 30
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_resultado JSONB;
+    v_negocio_id UUID;
+    v_producto RECORD;
+    v_cliente_id UUID;
+    v_orden_id UUID;
+    v_total DECIMAL;
+    v_expira_at TIMESTAMPTZ := NOW() + make_interval(
+        mins => LEAST(GREATEST(COALESCE(p_reserva_minutos, 30), 1), 60)
+    );
+    v_hash TEXT := md5(jsonb_build_object(
+        'producto_id', p_producto_id, 'talla', p_talla, 'color', p_color,
+        'cantidad', p_cantidad, 'cliente', p_cliente
+    )::TEXT);
+    v_hash_previo TEXT;
+BEGIN
+    IF p_idempotency_key IS NOT NULL THEN
+        -- Serializa los reintentos concurrentes con la misma clave
+        PERFORM pg_advisory_xact_lock(
+            hashtext('marketplace_checkout'), hashtext(p_codigo || ':' || p_idempotency_key)
+        );
+        SELECT resultado, parametros_hash INTO v_resultado, v_hash_previo
+        FROM marketplace_checkouts
+        WHERE codigo = p_codigo
+          AND idempotency_key = p_idempotency_key;
+        IF FOUND THEN
+            IF v_hash_previo <> v_hash THEN
+                RETURN jsonb_build_object('error', 'IDEMPOTENCY_KEY_REUSED');
+            END IF;
+            RETURN v_resultado || jsonb_build_object('replay', TRUE);
+        END IF;
+    END IF;
+
+    SELECT negocio_id INTO v_negocio_id
+    FROM marketplace_links
+    WHERE codigo = p_codigo
+      AND estado = 'ACTIVO';
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('error', 'ENLACE_NO_ENCONTRADO');
+    END IF;
+
+    SELECT nombre, precio_venta INTO v_producto
+    FROM clothing_products
+    WHERE id = p_producto_id
+      AND negocio_id = v_negocio_id;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('error', 'PRODUCTO_NO_ENCONTRADO');
+    END IF;
+
+    -- Reserva: el WHERE se reevalúa sobre la fila bloqueada
+    UPDATE clothing_products
+    SET stock_por_talla_color = jsonb_set(
+        stock_por_talla_color,
+        ARRAY[p_talla, p_color],
+        to_jsonb((stock_por_talla_color #>> ARRAY[p_talla, p_color])::INTEGER - p_cantidad)
+    )
+    WHERE id = p_producto_id
+      AND (stock_por_talla_color #>> ARRAY[p_talla, p_color])::INTEGER >= p_cantidad;
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('error', 'SIN_STOCK');
+    END IF;
+
+    v_total := v_producto.precio_venta * p_cantidad;
+
+    INSERT INTO clientes (negocio_id, nombre, email, telefono, direccion, es_empresa, tipo_cliente)
+    VALUES (
+        v_negocio_id,
+        p_cliente->>'nombre',
+        p_cliente->>'email',
+        p_cliente->>'telefono',
+        p_cliente->>'direccion',
+        FALSE,
+        'CONSUMIDOR_FINAL'
+    )
+    RETURNING id INTO v_cliente_id;
+
+    INSERT INTO marketplace_orders (
+        negocio_id, cliente_id, producto_id, talla, color, cantidad,
+        precio_unitario, total, estado, origen, fecha_creacion
+    )
+    VALUES (
+        v_negocio_id, v_cliente_id, p_producto_id, p_talla, p_color, p_cantidad,
+        v_producto.precio_venta, v_total, 'PENDIENTE', 'MARKETPLACE_PUBLICO', NOW()
+    )
+    RETURNING id INTO v_orden_id;
+
+    INSERT INTO reservas_stock (negocio_id, orden_id, producto_id, talla, color, cantidad, expira_at)
+    VALUES (v_negocio_id, v_orden_id, p_producto_id, p_talla, p_color, p_cantidad, v_expira_at);
+
+    v_resultado := jsonb_build_object(
+        'orden_id', v_orden_id,
+        'cliente_id', v_cliente_id,
+        'negocio_id', v_negocio_id,
+        'producto', v_producto.nombre,
+        'total', v_total,
+        'reserva_expira_at', v_expira_at
+    );
+
+    IF p_idempotency_key IS NOT NULL THEN
+        INSERT INTO marketplace_checkouts (codigo, idempotency_key, parametros_hash, orden_id, resultado)
+        VALUES (p_codigo, p_idempotency_key, v_hash, v_orden_id, v_resultado);
+    END IF;
+
+    RETURN v_resultado || jsonb_build_object('replay', FALSE);
+END;
+$$;
+
+-- Función: confirmar_reserva
+-- El vendedor confirma la orden: la reserva pasa a venta definitiva.
+-- FALSE si no hay reserva activa y vigente (vencida, aunque el barrido aún
+-- no la libere, o ya confirmada). Solo la llama la API (service_role).
+CREATE OR REPLACE FUNCTION confirmar_reserva(p_orden_id UUID)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE reservas_stock
+    SET estado = 'CONFIRMADA'
+    WHERE orden_id = p_orden_id
+      AND estado = 'ACTIVA'
+      AND expira_at > NOW();
+    IF NOT FOUND THEN
+        RETURN FALSE;
+    END IF;
+    UPDATE marketplace_orders SET estado = 'CONFIRMADA' WHERE id = p_orden_id;
+    RETURN TRUE;
+END;
+$$;
+
+-- Función: liberar_reservas_vencidas
+-- Devuelve al stock las reservas vencidas de órdenes no confirmadas y
+-- cancela esas órdenes. SKIP LOCKED: varios workers pueden llamarla a la
+-- vez sin pisarse. Retorna los ids de las órdenes liberadas (la API
+-- invalida su caché).
+DROP FUNCTION IF EXISTS liberar_reservas_vencidas(INTEGER);
+
+CREATE OR REPLACE FUNCTION liberar_reservas_vencidas(p_limite INTEGER DEFAULT 500)
+RETURNS UUID[]
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_liberadas JSONB;
+    v_item RECORD;
+BEGIN
+    WITH vencidas AS (
+        SELECT id
+        FROM reservas_stock
+        WHERE estado = 'ACTIVA'
+          AND expira_at < NOW()
+        ORDER BY expira_at
+        LIMIT p_limite
+        FOR UPDATE SKIP LOCKED
+    ), liberadas AS (
+        UPDATE reservas_stock r
+        SET estado = 'LIBERADA', liberada_at = NOW()
+        FROM vencidas v
+        WHERE r.id = v.id
+        RETURNING r.orden_id, r.producto_id, r.talla, r.color, r.cantidad
+    )
+    SELECT COALESCE(jsonb_agg(to_jsonb(liberadas)), '[]'::JSONB)
+    INTO v_liberadas
+    FROM liberadas;
+
+    -- Devolución en orden de producto (mismo orden de locks que las ventas)
+    FOR v_item IN
+        SELECT producto_id, talla, color, SUM(cantidad) AS cantidad
+        FROM jsonb_to_recordset(v_liberadas)
+            AS x(orden_id UUID, producto_id UUID, talla TEXT, color TEXT, cantidad INTEGER)
+        GROUP BY 1, 2, 3
+        ORDER BY 1, 2, 3
+    LOOP
+        UPDATE clothing_products
+        SET stock_por_talla_color = jsonb_set(
+            stock_por_talla_color,
+            ARRAY[v_item.talla, v_item.color],
+            to_jsonb(COALESCE((stock_por_talla_color #>> ARRAY[v_item.talla, v_item.color])::INTEGER, 0) + v_item.cantidad)
+        )
+        WHERE id = v_item.producto_id;
+    END LOOP;
+
+    UPDATE marketplace_orders
+    SET estado = 'CANCELADA'
+    WHERE estado = 'PENDIENTE'
+      AND id IN (SELECT (x->>'orden_id')::UUID FROM jsonb_array_elements(v_liberadas) x);
+
+    RETURN ARRAY(SELECT DISTINCT (x->>'orden_id')::UUID FROM jsonb_array_elements(v_liberadas) x);
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION registrar_venta(JSONB) TO authenticated;
+GRANT EXECUTE ON FUNCTION registrar_ventas_sync(JSONB) TO authenticated;
+GRANT EXECUTE ON FUNCTION marketplace_checkout(TEXT, UUID, TEXT, TEXT, INTEGER, JSONB, TEXT, INTEGER) TO anon, authenticated;
+REVOKE EXECUTE ON FUNCTION confirmar_reserva(UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION confirmar_reserva(UUID) TO service_role;
+GRANT EXECUTE ON FUNCTION liberar_reservas_vencidas(INTEGER) TO authenticated;
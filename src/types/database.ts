@@ -47,6 +47,11 @@ export interface Producto {
   unidad_medida: string;
   atributos: Record<string, any>;
   fotos: string[];
+  // Variantes por hash del original (thumb/card/zoom en webp y jpeg)
+  fotos_variantes?: Record<string, {
+    url: string;
+    variantes: Record<string, Record<string, string>>;
+  }>;
   activo: boolean;
   created_at: string;
   updated_at: string;